@@ -27,6 +27,12 @@ from app.models.orders import Order
 from app.models.order_history import OrderHistory
 from app.models.sales import Sale
 from app.models.coupon import Coupon
+from app.models.archive import orders_archive
+from app.models.analytics import SalesDailyRollup
+from app.models.idempotency import IdempotencyKey
+from app.models.jobs import Job
+from app.models.scheduler import ScheduledRun
+from app.models.outbox import OutboxEvent
 
 # Crear todas las tablas
 def create_tables():
@@ -0,0 +1,29 @@
+from datetime import datetime
+from sqlalchemy import Column, Integer, String, Float, Date, DateTime, ForeignKey, UniqueConstraint, Index
+from app.models import Base  # Unifica la importación de Base
+
+class SalesDailyRollup(Base):
+    """Totales de ventas completadas por día y producto (la categoría se desnormaliza)"""
+    __tablename__ = "sales_daily_rollups"
+    __table_args__ = (
+        UniqueConstraint("day", "product_id", name="uq_sales_daily_rollups_day_product"),
+        Index("ix_sales_daily_rollups_category_day", "category", "day"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    day = Column(Date, nullable=False, index=True)
+    product_id = Column(Integer, ForeignKey("products.id"), nullable=False)
+    category = Column(String(50), nullable=True)
+    revenue = Column(Float, nullable=False, default=0.0)
+    tax = Column(Float, nullable=False, default=0.0)
+    units = Column(Integer, nullable=False, default=0)
+    sales_count = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class SalesRollupEntry(Base):
+    """Ventas ya acumuladas en los rollups (evita contarlas dos veces)"""
+    __tablename__ = "sales_rollup_entries"
+
+    sale_id = Column(Integer, primary_key=True, autoincrement=False)
+    day = Column(Date, nullable=False, index=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
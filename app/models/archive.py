@@ -0,0 +1,48 @@
+from datetime import datetime
+from sqlalchemy import Column, DateTime, Index, Table
+from app.models import Base  # Unifica la importación de Base
+from app.models.orders import Order, OrderItem
+from app.models.sales import Payment, Sale, SaleItem
+from app.models.order_history import OrderHistory, OrderHistoryItem
+
+# Tablas frías: mismas columnas que la tabla caliente, sin claves foráneas ni
+# restricciones únicas (los datos ya fueron validados al escribirse), más la
+# fecha en que se archivó la fila. Las consultas de estados activos solo leen
+# las tablas calientes; el historial cerrado y antiguo vive aquí.
+def _archive_table(source: Table, *indexes) -> Table:
+    columns = [
+        Column(column.name, column.type, primary_key=column.primary_key, autoincrement=False)
+        for column in source.columns
+    ]
+    columns.append(Column("archived_at", DateTime, default=datetime.utcnow))
+    return Table(f"{source.name}_archive", Base.metadata, *columns, *indexes)
+
+orders_archive = _archive_table(
+    Order.__table__,
+    Index("ix_orders_archive_user_created_at", "user_id", "created_at"),
+    Index("ix_orders_archive_status_created_at", "status", "created_at"),
+)
+order_items_archive = _archive_table(
+    OrderItem.__table__,
+    Index("ix_order_items_archive_order_id", "order_id"),
+)
+payments_archive = _archive_table(
+    Payment.__table__,
+    Index("ix_payments_archive_order_id", "order_id"),
+)
+sales_archive = _archive_table(
+    Sale.__table__,
+    Index("ix_sales_archive_status_created_at", "status", "created_at"),
+)
+sale_items_archive = _archive_table(
+    SaleItem.__table__,
+    Index("ix_sale_items_archive_sale_id", "sale_id"),
+)
+order_history_archive = _archive_table(
+    OrderHistory.__table__,
+    Index("ix_order_history_archive_user_created_at", "user_id", "created_at"),
+)
+order_history_items_archive = _archive_table(
+    OrderHistoryItem.__table__,
+    Index("ix_order_history_items_archive_history_id", "order_history_id"),
+)
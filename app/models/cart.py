@@ -1,4 +1,5 @@
-from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, Float
+from datetime import datetime
+from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, Float, DateTime, Index
 from sqlalchemy.orm import relationship
 from app.models import Base  # Unifica la importación de Base
 
@@ -9,6 +10,7 @@ class CartItem(Base):
     cart_id = Column(Integer, ForeignKey("carts.id"))
     product_id = Column(Integer, ForeignKey("products.id"))
     quantity = Column(Integer, default=1)
+    unit_price = Column(Float, nullable=True)  # Precio del producto al agregarlo al carrito
     
     # Usar strings en lugar de importar las clases directamente
     product = relationship("Product")
@@ -16,13 +18,26 @@ class CartItem(Base):
 
 class Cart(Base):
     __tablename__ = "carts"
+    __table_args__ = (
+        Index("ix_carts_user_id_status", "user_id", "status"),
+        Index("ix_carts_status_updated_at", "status", "updated_at"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
-    status = Column(String, default="active")  # e.g., active, completed, cancelled
+    status = Column(String, default="active")  # e.g., active, processed, expired
     coupon_id = Column(Integer, ForeignKey("coupons.id"), nullable=True)
+    # Totales desnormalizados, mantenidos por app.services.carts en cada cambio
+    subtotal = Column(Float, default=0.0)
+    discount_percent = Column(Float, default=0.0)
     discount_amount = Column(Float, default=0.0)
+    total = Column(Float, default=0.0)
+    version = Column(Integer, nullable=False, default=1, server_default="1")  # Control de concurrencia optimista
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)  # Vencimiento de carritos abandonados
     
     user = relationship("User")
     items = relationship("CartItem", back_populates="cart")
-    coupon = relationship("Coupon")
\ No newline at end of file
+    coupon = relationship("Coupon")
+
+    __mapper_args__ = {"version_id_col": version}
\ No newline at end of file
@@ -0,0 +1,21 @@
+from datetime import datetime
+from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, UniqueConstraint
+from app.models import Base  # Unifica la importación de Base
+
+class IdempotencyKey(Base):
+    """Primera respuesta de una petición con Idempotency-Key, para repetirla en los reintentos"""
+    __tablename__ = "idempotency_keys"
+    __table_args__ = (
+        UniqueConstraint("user_id", "key", name="uq_idempotency_keys_user_key"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    key = Column(String(255), nullable=False)
+    fingerprint = Column(String(64), nullable=False)  # sha256 de método, ruta, query y cuerpo
+    status = Column(String(20), nullable=False, default="in_progress")  # in_progress / completed
+    response_status = Column(Integer, nullable=True)
+    response_body = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+    locked_at = Column(DateTime, default=datetime.utcnow)
+    completed_at = Column(DateTime, nullable=True)
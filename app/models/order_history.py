@@ -1,5 +1,5 @@
 from datetime import datetime
-from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, DateTime
+from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, DateTime, Index
 from sqlalchemy.orm import relationship
 from app.models import Base  # Unifica la importación de Base
 from app.models.user import User
@@ -7,6 +7,7 @@ from app.models.product import Product
 
 class OrderHistory(Base):
     __tablename__ = "order_history"
+    __table_args__ = (Index("ix_order_history_status_created_at", "status", "created_at"),)
     id = Column(Integer, primary_key=True, index=True)
     order_number = Column(String, unique=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
@@ -1,5 +1,5 @@
 from datetime import datetime
-from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, DateTime
+from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, DateTime, Index
 from sqlalchemy.orm import relationship
 from app.models import Base  # Unifica la importación de Base
 from app.models.user import User
@@ -8,7 +8,7 @@ from app.models.product import Product
 class OrderItem(Base):
     __tablename__ = "order_items"
     id = Column(Integer, primary_key=True, index=True)
-    order_id = Column(Integer, ForeignKey("orders.id"))
+    order_id = Column(Integer, ForeignKey("orders.id"), index=True)
     product_id = Column(Integer, ForeignKey("products.id"))
     quantity = Column(Integer, default=1)
     unit_price = Column(Integer, nullable=False)  # Precio al momento de la compra
@@ -16,11 +16,21 @@ class OrderItem(Base):
     product = relationship("Product")
     order = relationship("Order", back_populates="items")
 
+    @property
+    def subtotal(self) -> int:
+        return (self.quantity or 0) * (self.unit_price or 0)
+
 class Order(Base):
     __tablename__ = "orders"
+    # Los listados filtran por estado y ordenan por fecha
+    __table_args__ = (
+        Index("ix_orders_status_created_at", "status", "created_at"),
+        Index("ix_orders_user_created_at", "user_id", "created_at"),
+    )
     id = Column(Integer, primary_key=True, index=True)
     order_number = Column(String, unique=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
+    user = relationship("User")
     items = relationship("OrderItem", back_populates="order")
     payments = relationship("Payment", back_populates="order")
     status = Column(String, default="pending")  # pending, created, paid, processing, shipped, delivered, cancelled
@@ -0,0 +1,23 @@
+from datetime import datetime
+from sqlalchemy import Column, Integer, String, Text, DateTime, Index
+from app.models import Base  # Unifica la importación de Base
+
+class OutboxEvent(Base):
+    """Evento de dominio guardado en la misma transacción que el cambio de estado"""
+    __tablename__ = "outbox_events"
+    __table_args__ = (
+        Index("ix_outbox_events_status_id", "status", "id"),
+        Index("ix_outbox_events_aggregate", "aggregate_type", "aggregate_id"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)  # Orden de publicación
+    event_type = Column(String(100), nullable=False)  # order.created, payment.completed, ...
+    aggregate_type = Column(String(50), nullable=False)  # order, payment, ...
+    aggregate_id = Column(String(100), nullable=False)
+    payload = Column(Text, nullable=False, default="{}")  # JSON
+    status = Column(String(20), nullable=False, default="pending")  # pending, published, dead
+    attempts = Column(Integer, nullable=False, default=0)
+    last_error = Column(Text, nullable=True)
+    next_attempt_at = Column(DateTime, nullable=True)  # No antes de (reintentos con espera)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+    published_at = Column(DateTime, nullable=True)
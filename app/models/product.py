@@ -20,5 +20,8 @@ class Product(Base):
     updated_at = Column(DateTime, onupdate=datetime.utcnow, nullable=True)
     created_by = Column(Integer, nullable=True)
     updated_by = Column(Integer, nullable=True)
+    version = Column(Integer, nullable=False, default=1, server_default="1")  # Control de concurrencia optimista
 
-    sale_items = relationship("SaleItem", back_populates="product")
\ No newline at end of file
+    sale_items = relationship("SaleItem", back_populates="product")
+
+    __mapper_args__ = {"version_id_col": version}
\ No newline at end of file
@@ -1,5 +1,5 @@
 from datetime import datetime
-from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Float, Enum
+from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Float, Enum, Index
 from sqlalchemy.orm import relationship
 from app.models import Base  # Unifica la importación de Base
 from app.models.product import Product
@@ -10,6 +10,7 @@ class PaymentStatus(str, enum.Enum):
     PENDING = "pending"
     PAID = "paid"
     FAILED = "failed"
+    EXPIRED = "expired"
 
 class PaymentMethod(str, enum.Enum):
     CREDIT_CARD = "credit_card"
@@ -19,9 +20,10 @@ class PaymentMethod(str, enum.Enum):
 
 class Payment(Base):
     __tablename__ = "payments"
+    __table_args__ = (Index("ix_payments_status_payment_date", "status", "payment_date"),)
 
     id = Column(Integer, primary_key=True, index=True)
-    order_id = Column(Integer, ForeignKey("orders.id"))
+    order_id = Column(Integer, ForeignKey("orders.id"), index=True)
     amount = Column(Float, nullable=False)
     payment_method = Column(String, nullable=False)
     status = Column(String, default=PaymentStatus.PENDING)
@@ -46,6 +48,7 @@ class SaleItem(Base):
 
 class Sale(Base):
     __tablename__ = "sales"
+    __table_args__ = (Index("ix_sales_status_created_at", "status", "created_at"),)
 
     id = Column(Integer, primary_key=True, index=True)
     order_id = Column(Integer, ForeignKey("orders.id"))
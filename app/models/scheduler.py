@@ -0,0 +1,16 @@
+from sqlalchemy import Column, Integer, String, Text, Float, DateTime
+from app.models import Base  # Unifica la importación de Base
+
+class ScheduledRun(Base):
+    """Estado de cada tarea programada: próxima ejecución y resultado de la última"""
+    __tablename__ = "scheduled_runs"
+
+    name = Column(String(100), primary_key=True)
+    next_run_at = Column(DateTime, nullable=False)
+    last_started_at = Column(DateTime, nullable=True)
+    last_finished_at = Column(DateTime, nullable=True)
+    last_duration = Column(Float, nullable=True)  # Segundos
+    last_status = Column(String(20), nullable=True)  # running, ok, error
+    last_error = Column(Text, nullable=True)
+    last_node = Column(String(100), nullable=True)  # Réplica que la ejecutó
+    run_count = Column(Integer, nullable=False, default=0)
@@ -0,0 +1,43 @@
+from datetime import date, timedelta
+from typing import Literal, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.orm import Session
+from app.database import get_db
+from app.schemas import analytics as schemas
+from app.services.analytics import query_rollups
+from app.utils.permissions import check_rol
+from app.models.user import User
+
+router = APIRouter(
+    prefix="/analytics",
+    tags=["analytics"]
+)
+
+# Ingresos, impuestos y unidades por día, producto o categoría (leídos de los rollups diarios)
+@router.get("/sales", response_model=schemas.SalesAnalytics)
+def get_sales_analytics(
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    group_by: Literal["day", "product", "category"] = "day",
+    category: Optional[str] = Query(None, max_length=50),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(check_rol(["vendedor", "admin"]))
+):
+    end = end or date.today()
+    start = start or end - timedelta(days=30)
+    if start > end:
+        raise HTTPException(status_code=400, detail="La fecha de inicio debe ser anterior a la de fin")
+    try:
+        rows = query_rollups(db, start, end, group_by, category)
+        return {
+            "start": start,
+            "end": end,
+            "group_by": group_by,
+            "total_revenue": round(sum(row["revenue"] for row in rows), 2),
+            "total_tax": round(sum(row["tax"] for row in rows), 2),
+            "total_units": sum(row["units"] for row in rows),
+            "rows": rows,
+        }
+    except Exception as e:
+        print(f"Error obteniendo la analítica de ventas: {e}")
+        raise HTTPException(status_code=500, detail="Error interno del servidor")
@@ -1,20 +1,59 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, Header, HTTPException
 from fastapi.responses import JSONResponse
 from sqlalchemy.orm import Session, joinedload
+from sqlalchemy.orm.exc import StaleDataError
+from typing import Optional
 from app.database import get_db
 from app.models import cart as models
 from app.schemas import cart as schemas
 from app.utils import get_current_user
 from app.models.user import User
-from app.models.coupon import Coupon
-from datetime import datetime
 from app.utils.ai import generate_ai_completion
 from fastapi import Body
+from app.utils.metrics import CHECKOUTS_TOTAL
+from app.utils.serialization import fast_json
+from app.services.coupons import CouponError, validate_coupon, redeem_coupon
+from app.services import carts as cart_service
+from app.services import cart_store
+from app.utils.concurrency import VersionConflict, check_version, conflict_response, expected_version, with_retry
 
 router = APIRouter(
     prefix="/carts",
     tags=["carts"]
 )
+def _edit_cart(db: Session, cart_id: int, user: User, operations: list, if_match: Optional[str] = None):
+    """
+    Aplica las operaciones en el almacén caliente si está habilitado
+    (CART_STORE) o en la base, y devuelve (carrito para la respuesta, resumen).
+    En la base no bloquea la fila: si otra pestaña cambió el carrito en el
+    medio se reintenta; con If-Match una versión distinta es un conflicto.
+    """
+    expected = expected_version(if_match)
+    if cart_store.enabled():
+        state, summary = cart_store.apply_operations(db, cart_id, user.id, operations, expected)
+        return cart_store.render(db, state, user), summary
+
+    def work(db: Session):
+        cart = cart_service.get_active_cart(db, cart_id, user.id)
+        check_version(cart.version, expected)
+        return cart_service.apply_operations(db, cart, operations)
+
+    summary = with_retry(db, work)
+    return cart_service.load_cart(db, cart_id), summary
+
+def _conflict(db: Session, cart_id: int, user: User):
+    """409 con el estado actual del carrito (del almacén caliente si está ahí)"""
+    db.rollback()
+    hot = cart_store.cached([cart_id]).get(cart_id)
+    if hot is not None:
+        return conflict_response(schemas.Cart, cart_store.render(db, hot, user), "El carrito fue modificado por otra petición")
+    current = db.query(models.Cart).filter(models.Cart.id == cart_id, models.Cart.user_id == user.id).first()
+    return conflict_response(
+        schemas.Cart,
+        cart_service.load_cart(db, cart_id) if current else None,
+        "El carrito fue modificado por otra petición"
+    )
+
 # Crear un carrito de compras 
 @router.post("/", response_model=schemas.Cart)
 def create_cart(
@@ -27,30 +66,23 @@ def create_cart(
         db_cart = db.query(models.Cart).filter(models.Cart.user_id == cart.user_id, models.Cart.status == "active").first()
         if db_cart:
             # Si ya existe, limpiar los items actuales del carrito
-            db.query(models.CartItem).filter(models.CartItem.cart_id == db_cart.id).delete()
+            cart_store.discard(db_cart.id)
+            cart_service.clear_items(db, db_cart)
         else:
-            db_cart = models.Cart(user_id=cart.user_id)
+            db_cart = models.Cart(user_id=cart.user_id, subtotal=0.0, discount_percent=0.0, discount_amount=0.0, total=0.0)
             db.add(db_cart)
             db.flush()  # Para obtener el id del carrito
-        for item in cart.items:
-            # Validar que el producto existe
-            product = db.query(models.Product).filter(models.Product.id == item.product.id).first()
-            if not product:
-                raise HTTPException(status_code=404, detail=f"Producto con id {item.product.id} no encontrado")
-            cart_item = models.CartItem(
-                cart_id=db_cart.id,
-                product_id=product.id,
-                quantity=item.quantity
-            )
-            db.add(cart_item)
+        # Valida que los productos existan y guarda su precio actual en cada item
+        cart_service.apply_operations(db, db_cart, [
+            schemas.CartOperation(op="add", product_id=item.product.id, quantity=item.quantity)
+            for item in cart.items
+        ])
         db.commit()
         # Recargar el carrito con los items y productos asociados
-        db.refresh(db_cart)
-        cart_with_items = db.query(models.Cart).options(
-            joinedload(models.Cart.user),
-            joinedload(models.Cart.items).joinedload(models.CartItem.product)
-        ).filter(models.Cart.id == db_cart.id).first()
-        return cart_with_items
+        return cart_service.load_cart(db, db_cart.id)
+    except cart_service.CartOperationError as e:
+        db.rollback()
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
     except Exception as e:
         db.rollback()
         print(f"Error creando el carrito: {e}")
@@ -75,7 +107,10 @@ def read_carts(
             .limit(limit)
             .all()
         )
-        return carts
+        # Los carritos con cambios en el almacén caliente se responden desde ahí
+        hot = cart_store.cached(cart.id for cart in carts)
+        carts = [cart_store.render(db, hot[cart.id], cart.user) if cart.id in hot else cart for cart in carts]
+        return fast_json(list[schemas.Cart], carts)
     except Exception as e:
         print(f"Error leyendo los carritos: {e}")
         raise HTTPException(status_code=500, detail="Error interno del servidor")
@@ -88,6 +123,9 @@ def read_cart(
     current_user: User = Depends(get_current_user)
 ):
     try:
+        hot = cart_store.cached([cart_id]).get(cart_id)
+        if hot is not None and hot["user_id"] == current_user.id:
+            return fast_json(schemas.Cart, cart_store.render(db, hot, current_user))
         cart = (
             db.query(models.Cart)
             .options(
@@ -99,7 +137,7 @@ def read_cart(
         )
         if not cart:
             raise HTTPException(status_code=404, detail="Carrito no encontrado")
-        return cart
+        return fast_json(schemas.Cart, cart)
     except Exception as e:
         print(f"Error leyendo el carrito {cart_id}: {e}")
         raise HTTPException(status_code=500, detail="Error interno del servidor")
@@ -110,31 +148,19 @@ def add_product_to_cart(
     cart_id: int,
     product: schemas.CartItemCreate,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    if_match: Optional[str] = Header(None)
 ):
     try:
-        cart = db.query(models.Cart).filter(models.Cart.id == cart_id, models.Cart.user_id == current_user.id).first()
-        if not cart:
-            raise HTTPException(status_code=404, detail="Carrito no encontrado o no pertenece al usuario")
-
-        existing_item = db.query(models.CartItem).filter(
-            models.CartItem.cart_id == cart_id,
-            models.CartItem.product_id == product.product.id
-        ).first()
-
-        if existing_item:
-            existing_item.quantity += product.quantity
-        else:
-            new_item = models.CartItem(
-                cart_id=cart_id,
-                product_id=product.product.id,
-                quantity=product.quantity
-            )
-            db.add(new_item)
-
-        db.commit()
-        db.refresh(cart)
+        cart, _ = _edit_cart(db, cart_id, current_user, [
+            schemas.CartOperation(op="add", product_id=product.product.id, quantity=product.quantity)
+        ], if_match)
         return cart
+    except (VersionConflict, StaleDataError):
+        return _conflict(db, cart_id, current_user)
+    except cart_service.CartOperationError as e:
+        db.rollback()
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
     except Exception as e:
         db.rollback()
         raise HTTPException(status_code=500, detail=f"Error interno del servidor: {str(e)}")
@@ -146,28 +172,20 @@ def update_product_quantity_in_cart(
     product_id: int,
     quantity: int,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    if_match: Optional[str] = Header(None)
 ):
     try:
-        cart = db.query(models.Cart).filter(models.Cart.id == cart_id, models.Cart.user_id == current_user.id).first()
-        if not cart:
-            raise HTTPException(status_code=404, detail="Carrito no encontrado o no pertenece al usuario")
-        
-        cart_item = db.query(models.CartItem).filter(
-            models.CartItem.cart_id == cart_id,
-            models.CartItem.product_id == product_id
-        ).first()
-
-        if not cart_item:
-            raise HTTPException(status_code=404, detail="El producto no está en el carrito")
-
-        if quantity <= 0:
-            db.delete(cart_item)
-        else:
-            cart_item.quantity = quantity
-
-        db.commit()
+        # Una cantidad de 0 o menos elimina el producto del carrito
+        cart, _ = _edit_cart(db, cart_id, current_user, [
+            schemas.CartOperation(op="update", product_id=product_id, quantity=max(quantity, 0))
+        ], if_match)
         return cart
+    except (VersionConflict, StaleDataError):
+        return _conflict(db, cart_id, current_user)
+    except cart_service.CartOperationError as e:
+        db.rollback()
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
     except Exception as e:
         db.rollback()
         raise HTTPException(status_code=500, detail=f"Error interno del servidor: {str(e)}")
@@ -178,34 +196,59 @@ def delete_product_from_cart(
     cart_id: int,
     product_id: int,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)  # Corrige la referencia a User
+    current_user: User = Depends(get_current_user),  # Corrige la referencia a User
+    if_match: Optional[str] = Header(None)
 ):
     try:
-        cart = db.query(models.Cart).filter(models.Cart.id == cart_id, models.Cart.user_id == current_user.id).first()
-        if not cart:
-            raise HTTPException(status_code=404, detail="Carrito no encontrado o no pertenece al usuario")
-        cart_item = db.query(models.CartItem).filter(
-            models.CartItem.cart_id == cart_id,
-            models.CartItem.product_id == product_id
-        ).first()
-
-        if not cart_item:
+        _, summary = _edit_cart(db, cart_id, current_user, [
+            schemas.CartOperation(op="remove", product_id=product_id)
+        ], if_match)
+        if not summary["removed"]:
             raise HTTPException(status_code=404, detail="El producto no está en el carrito")
-
-        db.delete(cart_item)
-        db.commit()
+    except (VersionConflict, StaleDataError):
+        return _conflict(db, cart_id, current_user)
+    except cart_service.CartOperationError as e:
+        db.rollback()
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    except HTTPException:
+        db.rollback()
+        raise
     except Exception as e:
         db.rollback()
         raise HTTPException(status_code=500, detail=f"Error interno del servidor: {str(e)}")
 
+# Aplicar varias altas, cambios y bajas de productos en una sola petición y transacción
+@router.post("/{cart_id}/batch", response_model=schemas.Cart)
+def batch_update_cart(
+    cart_id: int,
+    batch: schemas.CartBatchRequest,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+    if_match: Optional[str] = Header(None)
+):
+    try:
+        cart, _ = _edit_cart(db, cart_id, current_user, batch.operations, if_match)
+        return fast_json(schemas.Cart, cart)
+    except (VersionConflict, StaleDataError):
+        return _conflict(db, cart_id, current_user)
+    except cart_service.CartOperationError as e:
+        db.rollback()
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    except Exception as e:
+        db.rollback()
+        print(f"Error aplicando cambios al carrito {cart_id}: {e}")
+        raise HTTPException(status_code=500, detail="Error interno del servidor")
+
 @router.post("/{cart_id}/apply-coupon", response_model=schemas.Cart)
 async def apply_coupon(
     cart_id: int,
     coupon_request: schemas.ApplyCouponRequest,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    if_match: Optional[str] = Header(None)
 ):
     try:
+        cart_store.hydrate(db, cart_id)
         # Verificar si el carrito existe y pertenece al usuario
         cart = db.query(models.Cart).filter(
             models.Cart.id == cart_id,
@@ -215,34 +258,26 @@ async def apply_coupon(
         
         if not cart:
             raise HTTPException(status_code=404, detail="Carrito no encontrado o no está activo")
+        check_version(cart.version, expected_version(if_match))
 
-        # Validar el cupón
-        coupon = db.query(Coupon).filter(Coupon.code == coupon_request.code).first()
-        if not coupon:
-            raise HTTPException(status_code=404, detail="Cupón no encontrado")
+        # Validar el cupón (desde la caché de cupones)
+        try:
+            coupon = validate_coupon(db, coupon_request.code)
+        except CouponError as e:
+            raise HTTPException(status_code=e.status_code, detail=e.detail)
 
-        if not coupon.is_active:
-            raise HTTPException(status_code=400, detail="Cupón no está activo")
-
-        if coupon.current_uses >= coupon.max_uses:
-            raise HTTPException(status_code=400, detail="Cupón ha alcanzado el máximo de usos")
-
-        now = datetime.utcnow()
-        if now < coupon.valid_from or now > coupon.valid_until:
-            raise HTTPException(status_code=400, detail="Cupón no es válido en este momento")
-
-        # Calcular el descuento
-        total = sum(item.quantity * item.product.price for item in cart.items)
-        discount = total * (coupon.discount_percent / 100)
-
-        # Actualizar el carrito con el cupón
-        cart.coupon_id = coupon.id
-        cart.discount_amount = discount
+        # Descuento sobre el subtotal guardado en el carrito, sin cargar items ni productos
+        cart_service.set_discount(cart, coupon.id, coupon.discount_percent)
 
         db.commit()
         db.refresh(cart)
         return cart
 
+    except (VersionConflict, StaleDataError):
+        return _conflict(db, cart_id, current_user)
+    except HTTPException:
+        db.rollback()
+        raise
     except Exception as e:
         db.rollback()
         raise HTTPException(status_code=500, detail=f"Error interno del servidor: {str(e)}")
@@ -252,9 +287,12 @@ async def apply_coupon(
 def checkout_cart(
     cart_id: int,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    if_match: Optional[str] = Header(None)
 ):
     try:
+        # Los cambios pendientes del almacén caliente se escriben antes de cerrar el carrito
+        cart_store.hydrate(db, cart_id)
         cart = db.query(models.Cart).filter(
             models.Cart.id == cart_id,
             models.Cart.user_id == current_user.id,
@@ -263,22 +301,29 @@ def checkout_cart(
         
         if not cart:
             raise HTTPException(status_code=404, detail="Carrito no encontrado o no está activo")
+        # Con If-Match se cierra exactamente el carrito que el cliente revisó
+        check_version(cart.version, expected_version(if_match))
 
-        # Si hay un cupón aplicado, incrementar su contador de usos
-        if cart.coupon_id:
-            coupon = db.query(Coupon).filter(Coupon.id == cart.coupon_id).first()
-            if coupon:
-                coupon.current_uses += 1
-                if coupon.current_uses >= coupon.max_uses:
-                    coupon.is_active = False
+        # Si hay un cupón aplicado, canjearlo con un UPDATE condicional (nunca supera max_uses)
+        if cart.coupon_id and not redeem_coupon(db, cart.coupon_id):
+            raise HTTPException(status_code=409, detail="El cupón aplicado ya no está disponible")
 
         cart.status = "completed"
         db.commit()
         db.refresh(cart)
+        CHECKOUTS_TOTAL.inc(kind="cart", result="success")
         return cart
         
+    except (VersionConflict, StaleDataError):
+        CHECKOUTS_TOTAL.inc(kind="cart", result="conflict")
+        return _conflict(db, cart_id, current_user)
+    except HTTPException:
+        db.rollback()
+        CHECKOUTS_TOTAL.inc(kind="cart", result="rejected")
+        raise
     except Exception as e:
         db.rollback()
+        CHECKOUTS_TOTAL.inc(kind="cart", result="error")
         raise HTTPException(status_code=500, detail=f"Error interno del servidor: {str(e)}")
 
 #Eliminacion del carrito segun el id y el usuario autenticado
@@ -292,6 +337,7 @@ def delete_cart(
         cart = db.query(models.Cart).filter(models.Cart.id == cart_id, models.Cart.user_id == current_user.id).first()
         if not cart:
             raise HTTPException(status_code=404, detail="Carrito no encontrado")
+        cart_store.discard(cart_id)
         # Eliminar primero los items asociados al carrito
         db.query(models.CartItem).filter(models.CartItem.cart_id == cart.id).delete()
         db.delete(cart)
@@ -1,12 +1,17 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+from sqlalchemy import select
 from sqlalchemy.orm import Session
-from typing import List
-from datetime import datetime
+from typing import List, Optional
 
 from app.database import get_db
 from app.models.coupon import Coupon
 from app.schemas.coupon import CouponCreate, CouponResponse, CouponUpdate
-from app.utils.permissions import get_current_user
+from app.utils.permissions import check_rol
+from app.utils.streaming import stream_mode, streaming_response
+from app.services import coupons as coupon_service
+from app.services import carts as cart_service
+from app.services import cart_store
+from app.models.user import User
 
 router = APIRouter(
     prefix="/coupons",
@@ -17,14 +22,8 @@ router = APIRouter(
 async def create_coupon(
     coupon: CouponCreate,
     db: Session = Depends(get_db),
-    current_user: dict = Depends(get_current_user)
+    current_user: User = Depends(check_rol(["admin"]))
 ):
-    if not current_user.get("is_sales_manager"):
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Only sales managers can create coupons"
-        )
-    
     db_coupon = Coupon(
         code=coupon.code,
         discount_percent=coupon.discount_percent,
@@ -37,67 +36,46 @@ async def create_coupon(
     db.add(db_coupon)
     db.commit()
     db.refresh(db_coupon)
+    # El código pudo quedar en caché como inexistente
+    coupon_service.coupon_cache.invalidate(db_coupon.code)
     return db_coupon
 
 @router.get("/", response_model=List[CouponResponse])
 async def get_coupons(
+    request: Request,
+    skip: int = 0,
+    limit: Optional[int] = None,
     db: Session = Depends(get_db),
-    current_user: dict = Depends(get_current_user)
+    current_user: User = Depends(check_rol(["admin"]))
 ):
-    if not current_user.get("is_sales_manager"):
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Only sales managers can view all coupons"
-        )
-    
-    return db.query(Coupon).all()
+    query = select(Coupon).order_by(Coupon.id).offset(skip)
+    if limit is not None:
+        query = query.limit(limit)
+
+    # Con Accept: application/x-ndjson (o ?stream=ndjson / ?stream=json) se envían en streaming
+    mode = stream_mode(request)
+    if mode:
+        return streaming_response(query, CouponResponse, mode)
+    return db.execute(query).scalars().all()
 
 @router.get("/validate/{code}", response_model=CouponResponse)
 async def validate_coupon(
     code: str,
     db: Session = Depends(get_db)
 ):
-    coupon = db.query(Coupon).filter(Coupon.code == code).first()
-    if not coupon:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Coupon not found"
-        )
-    
-    if not coupon.is_active:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Coupon is not active"
-        )
-    
-    if coupon.current_uses >= coupon.max_uses:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Coupon has reached maximum uses"
-        )
-    
-    now = datetime.utcnow()
-    if now < coupon.valid_from or now > coupon.valid_until:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Coupon is not valid at this time"
-        )
-    
-    return coupon
+    # Se resuelve desde la caché de cupones; el límite de usos real se aplica al canjear
+    try:
+        return coupon_service.validate_coupon(db, code)
+    except coupon_service.CouponError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
 
 @router.patch("/{coupon_id}", response_model=CouponResponse)
 async def update_coupon(
     coupon_id: int,
     coupon_update: CouponUpdate,
     db: Session = Depends(get_db),
-    current_user: dict = Depends(get_current_user)
+    current_user: User = Depends(check_rol(["admin"]))
 ):
-    if not current_user.get("is_sales_manager"):
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Only sales managers can update coupons"
-        )
-    
     db_coupon = db.query(Coupon).filter(Coupon.id == coupon_id).first()
     if not db_coupon:
         raise HTTPException(
@@ -105,9 +83,19 @@ async def update_coupon(
             detail="Coupon not found"
         )
     
-    for field, value in coupon_update.dict(exclude_unset=True).items():
+    previous_code = db_coupon.code
+    changes = coupon_update.dict(exclude_unset=True)
+    rediscounted = changes.get("discount_percent") is not None and changes["discount_percent"] != db_coupon.discount_percent
+    if rediscounted:
+        # Los carritos activos con este cupón recalculan descuento y total
+        cart_service.update_coupon_discount(db, coupon_id, changes["discount_percent"])
+    for field, value in changes.items():
         setattr(db_coupon, field, value)
     
     db.commit()
+    # El almacén caliente se actualiza solo si la base confirmó el cambio
+    if rediscounted:
+        cart_store.update_coupon_discount(coupon_id, changes["discount_percent"])
     db.refresh(db_coupon)
+    coupon_service.coupon_cache.invalidate(previous_code, db_coupon.code)
     return db_coupon
\ No newline at end of file
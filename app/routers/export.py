@@ -0,0 +1,85 @@
+import shutil
+import tempfile
+from datetime import date
+from typing import Literal, Optional
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import FileResponse, StreamingResponse
+from starlette.background import BackgroundTask
+from app.database import SessionLocal
+from app.services.export import EXPORT_TABLES, ExportFormatError, available_formats, export_table, iter_csv
+from app.utils.permissions import check_rol
+from app.models.user import User
+
+router = APIRouter(
+    prefix="/export",
+    tags=["export"]
+)
+
+MEDIA_TYPES = {
+    "csv": "text/csv",
+    "parquet": "application/vnd.apache.parquet",
+    "arrow": "application/vnd.apache.arrow.file",
+}
+
+@router.get("/formats")
+def get_export_formats(current_user: User = Depends(check_rol(["vendedor", "admin"]))):
+    """Formatos disponibles en este servidor (Parquet y Arrow requieren pyarrow)"""
+    return {"tables": list(EXPORT_TABLES), "formats": available_formats()}
+
+@router.get("/{table}")
+def export_data(
+    table: Literal["sales", "sale_items", "orders", "order_items"],
+    format: Literal["csv", "parquet", "arrow"] = "csv",
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    include_archive: bool = True,
+    current_user: User = Depends(check_rol(["vendedor", "admin"]))
+):
+    """
+    Exporta una tabla completa en el rango de fechas indicado. El CSV se
+    envía en streaming a medida que se lee; Parquet y Arrow se escriben por
+    lotes a un archivo temporal que se borra después de enviarlo.
+    """
+    if start and end and start > end:
+        raise HTTPException(status_code=400, detail="La fecha de inicio debe ser anterior a la de fin")
+    if format not in available_formats():
+        raise HTTPException(status_code=400, detail=f"El formato {format} no está disponible (requiere pyarrow)")
+
+    # La sesión vive lo mismo que la respuesta, no lo que la dependencia get_db
+    db = SessionLocal()
+    filename = f"{table}-{start or 'inicio'}-{end or 'hoy'}"
+    try:
+        if format == "csv":
+            def stream():
+                try:
+                    yield from iter_csv(db, table, start, end, include_archive)
+                finally:
+                    db.close()
+
+            return StreamingResponse(
+                stream(),
+                media_type=MEDIA_TYPES["csv"],
+                headers={"Content-Disposition": f'attachment; filename="{filename}.csv"'}
+            )
+
+        out_dir = tempfile.mkdtemp(prefix="export-")
+        try:
+            files = export_table(db, table, out_dir, format, start, end, include_archive, rows_per_file=2**62)
+        except Exception:
+            shutil.rmtree(out_dir, ignore_errors=True)
+            raise
+        finally:
+            db.close()
+        return FileResponse(
+            files[0]["path"],
+            media_type=MEDIA_TYPES[format],
+            filename=f"{filename}.{format}",
+            background=BackgroundTask(shutil.rmtree, out_dir, ignore_errors=True)
+        )
+    except ExportFormatError as e:
+        db.close()
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        db.close()
+        print(f"Error exportando {table}: {e}")
+        raise HTTPException(status_code=500, detail="Error interno del servidor")
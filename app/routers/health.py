@@ -0,0 +1,27 @@
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+from app.utils.health import check_readiness, check_deep_health
+
+router = APIRouter(
+    prefix="/health",
+    tags=["health"]
+)
+
+# El proceso está vivo (no toca dependencias externas)
+@router.get("/live")
+def liveness():
+    return {"status": "ok"}
+
+# El worker puede recibir tráfico: base de datos accesible y pool con capacidad
+@router.get("/ready")
+def readiness():
+    result = check_readiness()
+    status_code = 200 if result["status"] == "ok" else 503
+    return JSONResponse(status_code=status_code, content=result)
+
+# Estado detallado: base de datos, pool, SMTP, cola de correo y circuitos externos
+@router.get("/deep")
+def deep_health():
+    result = check_deep_health()
+    status_code = 503 if result["status"] == "unavailable" else 200
+    return JSONResponse(status_code=status_code, content=result)
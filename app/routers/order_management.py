@@ -1,6 +1,7 @@
-from datetime import datetime
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session, joinedload
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Request
+from sqlalchemy import select
+from sqlalchemy.orm import Session, joinedload, selectinload
 from app.database import get_db
 from app.models.orders import Order as OrderModel, OrderItem
 from app.models.order_history import OrderHistory, OrderHistoryItem
@@ -8,12 +9,24 @@ from app.schemas import order as order_schemas
 from app.schemas import order_history as history_schemas
 from app.utils import get_current_user, check_rol
 from app.models.user import User
+from app.services.order_archiver import transition_orders, ALLOWED_TRANSITIONS
+from app.utils.streaming import stream_mode, streaming_response
 
 router = APIRouter(
     prefix="/orders/management",
     tags=["order management"]
 )
 
+# Igual que en ventas: colecciones con selectinload para que LIMIT/OFFSET se
+# apliquen sobre órdenes y no sobre filas multiplicadas por items
+def _order_load_options():
+    return (
+        selectinload(OrderModel.items).selectinload(OrderItem.product),
+        joinedload(OrderModel.user).load_only(
+            User.id, User.email, User.name, User.lastname, User.is_active, User.rol
+        ),
+    )
+
 @router.get("/pending", response_model=list[order_schemas.OrderDetail])
 async def get_pending_orders(
     skip: int = 0,
@@ -26,10 +39,8 @@ async def get_pending_orders(
         orders = (
             db.query(OrderModel)
             .filter(OrderModel.status.in_(["pending", "confirmed", "paid", "processing", "shipped"]))
-            .options(
-                joinedload(OrderModel.items).joinedload(OrderItem.product),
-                joinedload(OrderModel.user)
-            )
+            .options(*_order_load_options())
+            .order_by(OrderModel.created_at.desc())
             .offset(skip)
             .limit(limit)
             .all()
@@ -41,32 +52,62 @@ async def get_pending_orders(
 
 @router.get("/", response_model=list[order_schemas.OrderDetail])
 async def get_all_orders(
+    request: Request,
     skip: int = 0,
-    limit: int = 100,
+    limit: Optional[int] = None,
     status: str = None,
     db: Session = Depends(get_db),
     current_user: User = Depends(check_rol(["vendedor", "admin"]))
 ):
-    """Ver todas las órdenes"""
+    """
+    Ver todas las órdenes. Con `Accept: application/x-ndjson` (o `?stream=ndjson`
+    / `?stream=json`) se envían en streaming y `limit` pasa a ser opcional.
+    """
     try:
-        query = db.query(OrderModel)
+        query = select(OrderModel).options(*_order_load_options()).order_by(OrderModel.created_at.desc())
         if status:
-            query = query.filter(OrderModel.status == status)
+            query = query.where(OrderModel.status == status)
         
-        orders = (
-            query.options(
-                joinedload(OrderModel.items).joinedload(OrderItem.product),
-                joinedload(OrderModel.user)
-            )
-            .offset(skip)
-            .limit(limit)
-            .all()
-        )
+        mode = stream_mode(request)
+        if mode:
+            query = query.offset(skip)
+            if limit is not None:
+                query = query.limit(limit)
+            return streaming_response(query, order_schemas.OrderDetail, mode)
+
+        orders = db.execute(query.offset(skip).limit(limit or 100)).scalars().all()
         return orders
     except Exception as e:
         print(f"Error obteniendo órdenes: {e}")
         raise HTTPException(status_code=500, detail="Error interno del servidor")
 
+# Historial de una orden con items, productos y usuario para la respuesta
+def _load_history_entry(db: Session, order_number: str):
+    return (
+        db.query(OrderHistory)
+        .filter(OrderHistory.order_number == order_number)
+        .options(
+            selectinload(OrderHistory.items).selectinload(OrderHistoryItem.product),
+            joinedload(OrderHistory.user)
+        )
+        .first()
+    )
+
+def _transition_one(db: Session, order: OrderModel, target_status: str):
+    """Aplica la transición a una orden y devuelve su entrada del historial"""
+    order_number = order.order_number
+    result = transition_orders(db, [order.id], target_status)
+    # Otra petición pudo cambiar el estado entre la validación y el bloqueo del lote
+    if not result["processed"]:
+        raise HTTPException(
+            status_code=409,
+            detail="El pedido cambió de estado mientras se procesaba, intente nuevamente"
+        )
+    entry = _load_history_entry(db, order_number)
+    if entry is None:
+        raise HTTPException(status_code=404, detail="Historial del pedido no encontrado")
+    return entry
+
 @router.post("/{order_id}/deliver", response_model=history_schemas.OrderHistory)
 async def mark_as_delivered(
     order_id: int,
@@ -75,54 +116,22 @@ async def mark_as_delivered(
 ):
     """Marcar pedido como entregado"""
     try:
-        order = (
-            db.query(OrderModel)
-            .filter(OrderModel.id == order_id)
-            .options(
-                joinedload(OrderModel.items).joinedload(OrderItem.product),
-                joinedload(OrderModel.user)
-            )
-            .first()
-        )
+        order = db.query(OrderModel).filter(OrderModel.id == order_id).first()
 
         if not order:
             raise HTTPException(status_code=404, detail="Pedido no encontrado")
             
-        if order.status not in ["processing", "shipped"]:
+        if order.status not in ALLOWED_TRANSITIONS["delivered"]:
             raise HTTPException(
                 status_code=400,
                 detail="Solo se pueden entregar pedidos en estado processing o shipped"
             )
         
-        # Crear entrada en el historial
-        history_entry = OrderHistory(
-            order_number=order.order_number,
-            user_id=order.user_id,
-            total_amount=order.total_amount,
-            status="delivered",
-            created_at=order.created_at,
-            delivered_at=datetime.utcnow()
-        )
-        db.add(history_entry)
-        db.flush()  # Para obtener el ID
-        
-        # Mover items al historial
-        for item in order.items:
-            history_item = OrderHistoryItem(
-                order_history_id=history_entry.id,
-                product_id=item.product_id,
-                quantity=item.quantity,
-                unit_price=item.unit_price
-            )
-            db.add(history_item)
-        
-        # Marcar orden original como entregada y moverla al historial
-        order.status = "delivered"
-        
-        db.commit()
-        db.refresh(history_entry)
-        return history_entry
+        # Copiar la orden y sus items al historial y marcarla como entregada
+        return _transition_one(db, order, "delivered")
         
+    except HTTPException:
+        raise
     except Exception as e:
         db.rollback()
         print(f"Error marcando orden como entregada: {e}")
@@ -136,59 +145,38 @@ async def cancel_order(
 ):
     """Anular pedido"""
     try:
-        order = (
-            db.query(OrderModel)
-            .filter(OrderModel.id == order_id)
-            .options(
-                joinedload(OrderModel.items).joinedload(OrderItem.product),
-                joinedload(OrderModel.user)
-            )
-            .first()
-        )
+        order = db.query(OrderModel).filter(OrderModel.id == order_id).first()
         
         if not order:
             raise HTTPException(status_code=404, detail="Pedido no encontrado")
             
-        if order.status not in ["pending", "confirmed", "paid"]:
+        if order.status not in ALLOWED_TRANSITIONS["cancelled"]:
             raise HTTPException(
                 status_code=400,
                 detail="Solo se pueden anular pedidos en estado pending, confirmed o paid"
             )
         
-        # Crear entrada en el historial
-        history_entry = OrderHistory(
-            order_number=order.order_number,
-            user_id=order.user_id,
-            total_amount=order.total_amount,
-            status="cancelled",
-            created_at=order.created_at,
-            cancelled_at=datetime.utcnow()
-        )
-        db.add(history_entry)
-        db.flush()  # Para obtener el ID
-        
-        # Mover items al historial y restaurar stock
-        for item in order.items:
-            history_item = OrderHistoryItem(
-                order_history_id=history_entry.id,
-                product_id=item.product_id,
-                quantity=item.quantity,
-                unit_price=item.unit_price
-            )
-            db.add(history_item)
-            
-            # Restaurar stock
-            product = item.product
-            product.stock += item.quantity
-        
-        # Marcar orden original como cancelada
-        order.status = "cancelled"
-        
-        db.commit()
-        db.refresh(history_entry)
-        return history_entry
+        # Copiar la orden al historial, restaurar stock y marcarla como cancelada
+        return _transition_one(db, order, "cancelled")
         
+    except HTTPException:
+        raise
     except Exception as e:
         db.rollback()
         print(f"Error cancelando orden: {e}")
-        raise HTTPException(status_code=500, detail="Error interno del servidor")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail="Error interno del servidor")
+
+@router.post("/bulk-transition", response_model=history_schemas.BulkTransitionResult)
+def bulk_transition_orders(
+    request: history_schemas.BulkTransitionRequest,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(check_rol(["vendedor", "admin"]))
+):
+    """Entregar o anular muchos pedidos a la vez (por lotes, con INSERT ... SELECT)"""
+    try:
+        result = transition_orders(db, request.order_ids, request.status, request.chunk_size)
+        return result
+    except Exception as e:
+        db.rollback()
+        print(f"Error en la transición masiva de órdenes: {e}")
+        raise HTTPException(status_code=500, detail="Error interno del servidor")
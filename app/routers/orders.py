@@ -1,17 +1,23 @@
 from datetime import datetime
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request
 from fastapi.responses import JSONResponse
 from sqlalchemy.orm import Session, joinedload
-from sqlalchemy import desc, func
+from sqlalchemy.orm.exc import StaleDataError
+from sqlalchemy import desc, select
 from typing import Optional, List
 from app.database import get_db
-from app.models import cart as cart_models
 from app.models.orders import Order, OrderItem
 from app.schemas import order as schemas
 from app.utils import get_current_user, check_rol
-from app.utils.order import generate_order_number, calculate_order_total 
-from app.utils.mail_sender import send_order_confirmation
 from app.models.user import User
+from app.utils.metrics import CHECKOUTS_TOTAL
+from app.services.archive import archived_order_detail, order_summary_source, order_totals
+from app.utils.serialization import fast_json, get_serializer
+from app.services import cart_store
+from app.services import checkout
+from app.services import idempotency
+from app.services import outbox
+from app.utils.concurrency import with_retry
 
 router = APIRouter(
     prefix="/orders",
@@ -30,30 +36,25 @@ async def get_orders(
     current_user: User = Depends(get_current_user)
 ):
     try:
-        query = db.query(Order).filter(Order.user_id == current_user.id)
-        
-        if status:
-            query = query.filter(Order.status == status)
-            
-        if start_date:
-            query = query.filter(Order.created_at >= start_date)
-            
-        if end_date:
-            query = query.filter(Order.created_at <= end_date)
+        # Columnas de OrderSummary con la cantidad de items calculada en una
+        # subconsulta agrupada. Una única consulta sin cargar relaciones; si el
+        # estado no es activo incluye también las órdenes archivadas.
+        summaries = order_summary_source(current_user.id, status, start_date, end_date)
+        query = select(summaries)
             
         if sort:
             if sort == "date_asc":
-                query = query.order_by(Order.created_at)
+                query = query.order_by(summaries.c.created_at)
             elif sort == "date_desc":
-                query = query.order_by(desc(Order.created_at))
+                query = query.order_by(desc(summaries.c.created_at))
             elif sort == "total_asc":
-                query = query.order_by(Order.total_amount)
+                query = query.order_by(summaries.c.total_amount)
             elif sort == "total_desc":
-                query = query.order_by(desc(Order.total_amount))
+                query = query.order_by(desc(summaries.c.total_amount))
         else:
-            query = query.order_by(desc(Order.created_at))  # Default newest first
+            query = query.order_by(desc(summaries.c.created_at))  # Default newest first
             
-        orders = query.offset(skip).limit(limit).all()
+        orders = db.execute(query.offset(skip).limit(limit)).all()
         
         if not orders:
             return JSONResponse(
@@ -61,7 +62,7 @@ async def get_orders(
                 content={"detail": "No hay órdenes para el usuario"}
             )
             
-        return orders
+        return [schemas.OrderSummary.model_validate(row._asdict()) for row in orders]
         
     except Exception as e:
         print(f"Error obteniendo órdenes: {e}")
@@ -80,12 +81,17 @@ async def get_order_detail(
         ).options(
             joinedload(Order.items).joinedload(OrderItem.product)
         ).first()
+        if not order:
+            # Las órdenes cerradas y antiguas se leen de las tablas frías
+            order = archived_order_detail(db, order_id, current_user.id)
         
         if not order:
             raise HTTPException(status_code=404, detail="Orden no encontrada")
             
-        return order
+        return fast_json(schemas.OrderDetail, order)
         
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error obteniendo detalles de la orden: {e}")
         raise HTTPException(status_code=500, detail="Error interno del servidor")
@@ -93,80 +99,61 @@ async def get_order_detail(
 @router.post("/create", response_model=schemas.OrderDetail)
 async def create_order(
     cart_id: int,
+    request: Request,
+    idempotency_key: Optional[str] = Header(None),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
+    # Un reintento con la misma Idempotency-Key repite la primera respuesta en lugar de otra compra
     try:
-        # 1. Obtener el carrito y validar
-        cart = db.query(cart_models.Cart).filter(
-            cart_models.Cart.id == cart_id,
-            cart_models.Cart.user_id == current_user.id,
-            cart_models.Cart.status == "active"
-        ).options(
-            joinedload(cart_models.Cart.items).joinedload(cart_models.CartItem.product)
-        ).first()
-        
-        if not cart:
-            raise HTTPException(status_code=404, detail="Carrito no encontrado o no está activo")
-        
-        if not cart.items:
-            raise HTTPException(status_code=400, detail="El carrito está vacío")
+        replay = await idempotency.claim("orders.create", current_user.id, idempotency_key, request)
+    except idempotency.IdempotencyError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    if replay is not None:
+        return replay
 
-        # 2. Validar stock disponible
-        for item in cart.items:
-            if item.quantity > item.product.stock:
-                raise HTTPException(
-                    status_code=400,
-                    detail=f"Stock insuficiente para el producto: {item.product.name}"
-                )
+    # Una vez confirmada la orden la clave no se libera: el reintento debe repetir la respuesta, no comprar otra vez
+    committed = False
+    try:
+        # 1. Cambios pendientes del almacén caliente de carritos escritos en la base
+        cart_store.hydrate(db, cart_id)
 
-        # 3. Crear la orden
-        total_amount = calculate_order_total(cart.items)
-        order_number = generate_order_number()
-        
-        new_order = Order(
-            order_number=order_number,
-            user_id=current_user.id,
-            status="pending",
-            total_amount=total_amount,
-            shipping_address=current_user.default_address,  # Asumiendo que existe este campo
-            created_at=datetime.utcnow()
-        )
-        db.add(new_order)
-        db.flush()  # Para obtener el ID de la orden
+        # 2. Validar, descontar stock, crear orden e items y cerrar el carrito (ORM o una sola sentencia SQL,
+        #    según CHECKOUT_MODE) y guardar el evento order.created en la misma transacción: el relay del
+        #    outbox encola el correo de confirmación. En el camino ORM, si otra compra cambió el stock se repite.
+        def place(db: Session) -> int:
+            order_id = checkout.place_order(db, cart_id, current_user.id)
+            outbox.record(db, "order.created", "order", order_id, order_id=order_id, user_id=current_user.id)
+            return order_id
 
-        # 4. Crear items de la orden y actualizar stock
-        for cart_item in cart.items:
-            order_item = OrderItem(
-                order_id=new_order.id,
-                product_id=cart_item.product_id,
-                quantity=cart_item.quantity,
-                unit_price=cart_item.product.price,
-                subtotal=cart_item.quantity * cart_item.product.price
-            )
-            db.add(order_item)
-            
-            # Actualizar stock
-            cart_item.product.stock -= cart_item.quantity
+        order_id = with_retry(db, place)
+        committed = True
+        CHECKOUTS_TOTAL.inc(kind="order", result="success")
 
-        # 5. Marcar carrito como procesado
-        cart.status = "processed"
-        
-        db.commit()
-        
-        # 6. Enviar confirmación por email
-        await send_order_confirmation(
-            to_email=current_user.email,
-            order_number=order_number,
-            total_amount=total_amount,
-            items=cart.items
-        )
-        
-        # 7. Retornar orden creada con todos sus detalles
-        return await get_order_detail(new_order.id, db, current_user)
-        
+        order = db.query(Order).filter(Order.id == order_id).options(
+            joinedload(Order.items).joinedload(OrderItem.product)
+        ).one()
+
+        # 3. Retornar orden creada con todos sus detalles
+        if idempotency_key is not None:
+            return idempotency.complete(current_user.id, idempotency_key, get_serializer(schemas.OrderDetail).dump(order))
+        return fast_json(schemas.OrderDetail, order)
+
+    except checkout.CheckoutError as e:
+        db.rollback()
+        idempotency.release(current_user.id, idempotency_key)
+        CHECKOUTS_TOTAL.inc(kind="order", result="rejected")
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    except StaleDataError:
+        db.rollback()
+        idempotency.release(current_user.id, idempotency_key)
+        CHECKOUTS_TOTAL.inc(kind="order", result="conflict")
+        raise HTTPException(status_code=409, detail="El carrito o el stock cambiaron mientras se creaba la orden, intente nuevamente")
     except Exception as e:
         db.rollback()
+        if not committed:
+            idempotency.release(current_user.id, idempotency_key)
+        CHECKOUTS_TOTAL.inc(kind="order", result="error")
         print(f"Error creando la orden: {e}")
         raise HTTPException(status_code=500, detail="Error interno del servidor")
 
@@ -176,26 +163,8 @@ async def get_order_stats(
     current_user: User = Depends(get_current_user)
 ):
     try:
-        total_orders = db.query(Order).filter(Order.user_id == current_user.id).count()
-        pending_orders = db.query(Order).filter(
-            Order.user_id == current_user.id,
-            Order.status == "pending"
-        ).count()
-        completed_orders = db.query(Order).filter(
-            Order.user_id == current_user.id,
-            Order.status == "completed"
-        ).count()
-        total_spent = db.query(func.sum(Order.total_amount)).filter(
-            Order.user_id == current_user.id,
-            Order.status == "completed"
-        ).scalar() or 0.0
-        
-        return {
-            "total_orders": total_orders,
-            "pending_orders": pending_orders,
-            "completed_orders": completed_orders,
-            "total_spent": total_spent
-        }
+        # Una sola consulta agregada sobre las órdenes calientes y archivadas
+        return order_totals(db, current_user.id)
         
     except Exception as e:
         print(f"Error obteniendo estadísticas: {e}")
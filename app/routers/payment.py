@@ -1,14 +1,20 @@
-from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks, Request
+from fastapi import APIRouter, Depends, Header, HTTPException, Request
+from sqlalchemy import func, select, union_all
 from sqlalchemy.orm import Session
 from app.database import get_db
 from app.schemas.payment import PaymentRequest, PaymentResponse, PaymentStatus
 from app.models.sales import Payment, Sale
 from app.models.orders import Order
+from app.models.archive import sales_archive
 from app.models.user import User
-from app.utils.mail_sender import send_payment_confirmation
+from app.services import idempotency, outbox
 from app.utils import get_current_user
+from app.utils.circuit_breaker import get_breaker
+from app.utils.metrics import PAYMENTS_TOTAL
+from app.utils.tracing import tracer
 from datetime import datetime
 import mercadopago
+import json
 import os
 from dotenv import load_dotenv
 import random
@@ -23,24 +29,87 @@ router = APIRouter(
 
 # Inicializar SDK de Mercado Pago
 sdk = mercadopago.SDK(os.getenv("MP_ACCESS_TOKEN"))
+mp_breaker = get_breaker("mercadopago")
 
 def generate_invoice_number(db: Session) -> int:
     """Generate a unique invoice number"""
-    last_sale = db.query(Sale).order_by(Sale.invoice_number.desc()).first()
-    if last_sale:
-        return last_sale.invoice_number + 1
+    # Las ventas archivadas conservan su número: el máximo sale de ambas tablas
+    last_numbers = union_all(
+        select(func.max(Sale.invoice_number).label("invoice_number")),
+        select(func.max(sales_archive.c.invoice_number).label("invoice_number"))
+    ).subquery()
+    last_invoice = db.execute(select(func.max(last_numbers.c.invoice_number))).scalar()
+    if last_invoice is not None:
+        return last_invoice + 1
     return 1000  # Start from 1000
 
 def calculate_tax(amount: float) -> float:
     """Calculate tax amount (IVA 21%)"""
     return amount * 0.21
 
+def _locked_payment(db: Session, order_id: int) -> Optional[Payment]:
+    """Pago de la orden bloqueado hasta el commit: serializa la redirección de éxito y los webhooks"""
+    return db.query(Payment).filter(Payment.order_id == order_id).with_for_update().first()
+
+def _settle_payment(db: Session, payment: Payment, order: Optional[Order], transaction_id: str) -> bool:
+    """
+    Marca el pago como PAID y crea la venta pendiente y el evento
+    payment.completed, sin confirmar. Si el pago ya estaba pagado o la orden
+    ya tiene venta no hace nada y devuelve False.
+    """
+    if payment.status == PaymentStatus.PAID:
+        return False
+    if db.query(Sale.id).filter(Sale.order_id == payment.order_id).first() is not None:
+        return False
+
+    payment.status = PaymentStatus.PAID
+    payment.transaction_id = transaction_id
+    payment.payment_date = datetime.utcnow()
+
+    # La venta queda pendiente para el vendedor; se acumula en los rollups al completarla
+    sale = Sale(
+        order_id=payment.order_id,
+        user_id=order.user_id if order else None,
+        order_number=order.order_number if order else None,
+        payment_id=payment.id,
+        total_amount=payment.amount,
+        tax_amount=calculate_tax(payment.amount),
+        invoice_number=generate_invoice_number(db),
+        status="pending"
+    )
+    db.add(sale)
+
+    if order:
+        order.status = "completed"
+        # Evento en la misma transacción que el pago; el relay encola el correo de confirmación
+        outbox.record(
+            db, "payment.completed", "order", order.id,
+            payment_id=payment.id,
+            email=order.user.email,
+            order_id=order.id,
+            amount=payment.amount,
+            invoice_number=sale.invoice_number
+        )
+    return True
+
 @router.post("/create-preference")
 async def create_payment_preference(
     order_id: int,
+    request: Request,
+    idempotency_key: Optional[str] = Header(None),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
+    # Un reintento con la misma Idempotency-Key no crea otra preferencia ni otro Payment
+    try:
+        replay = await idempotency.claim("payment.create_preference", current_user.id, idempotency_key, request)
+    except idempotency.IdempotencyError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    if replay is not None:
+        return replay
+
+    # Una vez confirmado el Payment la clave no se libera: el reintento repite la respuesta
+    committed = False
     try:
         # Obtener la orden
         order = db.query(Order).filter(Order.id == order_id).first()
@@ -84,7 +153,8 @@ async def create_payment_preference(
             "auto_return": "approved",
         }
 
-        preference_response = sdk.preference().create(preference_data)
+        with tracer.start_span("mercadopago.preference.create", "client", {"order_id": order_id}):
+            preference_response = mp_breaker.call(sdk.preference().create, preference_data)
         preference = preference_response["response"]
 
         # Crear registro de pago pendiente
@@ -97,12 +167,20 @@ async def create_payment_preference(
         )
         db.add(payment)
         db.commit()
+        committed = True
+        PAYMENTS_TOTAL.inc(event="preference", status="created")
 
-        return {
+        result = {
             "init_point": preference["init_point"],
             "preference_id": preference["id"]
         }
+        if idempotency_key is not None:
+            return idempotency.complete(current_user.id, idempotency_key, json.dumps(result).encode())
+        return result
     except Exception as e:
+        if not committed:
+            idempotency.release(current_user.id, idempotency_key)
+        PAYMENTS_TOTAL.inc(event="preference", status="error")
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/success")
@@ -118,39 +196,26 @@ async def payment_success(
         if not order:
             raise HTTPException(status_code=404, detail="Order not found")
 
-        # Update payment status
-        payment = db.query(Payment).filter(Payment.order_id == order_id).first()
+        # Los parámetros de la redirección los controla el cliente: liquidar solo
+        # si Mercado Pago confirma que el pago está aprobado y es de esta orden
+        with tracer.start_span("mercadopago.payment.get", "client", {"mp.payment_id": payment_id}):
+            payment_info = mp_breaker.call(sdk.payment().get, payment_id)
+        payment_data = payment_info["response"] if payment_info["status"] == 200 else {}
+        if payment_data.get("status") != "approved" or str(payment_data.get("external_reference")) != str(order_id):
+            PAYMENTS_TOTAL.inc(event="success", status="unverified")
+            raise HTTPException(status_code=400, detail="Payment not approved")
+
+        # Liquidar el pago (idempotente: el webhook pudo haberlo hecho antes)
+        payment = _locked_payment(db, order_id)
         if payment:
-            payment.status = PaymentStatus.COMPLETED
-            payment.mp_payment_id = payment_id
-            payment.payment_date = datetime.utcnow()
-            
-            # Create sale record
-            sale = Sale(
-                order_id=order_id,
-                payment_id=payment.id,
-                sale_date=datetime.utcnow(),
-                total_amount=payment.amount,
-                tax_amount=calculate_tax(payment.amount),
-                invoice_number=generate_invoice_number(db)
-            )
-            db.add(sale)
-            
-            # Update order status
-            order.status = "completed"
-            
+            settled = _settle_payment(db, payment, order, str(payment_data["id"]))
             db.commit()
-
-            # Send confirmation email
-            background_tasks = BackgroundTasks()
-            background_tasks.add_task(
-                send_payment_confirmation,
-                order.user.email,
-                order.id,
-                payment.amount
-            )
+            PAYMENTS_TOTAL.inc(event="success", status="paid" if settled else "duplicate")
 
             return {"message": "Payment processed successfully", "order_id": order_id}
+    except HTTPException:
+        db.rollback()
+        raise
     except Exception as e:
         db.rollback()
         raise HTTPException(status_code=500, detail=str(e))
@@ -168,9 +233,10 @@ async def payment_failure(
             payment = db.query(Payment).filter(Payment.order_id == order_id).first()
             if payment:
                 payment.status = PaymentStatus.FAILED
-                payment.mp_payment_id = payment_id
+                payment.transaction_id = payment_id
                 payment.payment_date = datetime.utcnow()
                 db.commit()
+                PAYMENTS_TOTAL.inc(event="failure", status="failed")
         except:
             pass
     
@@ -188,9 +254,10 @@ async def payment_pending(
         payment = db.query(Payment).filter(Payment.order_id == order_id).first()
         if payment:
             payment.status = PaymentStatus.PENDING
-            payment.mp_payment_id = payment_id
+            payment.transaction_id = payment_id
             payment.payment_date = datetime.utcnow()
             db.commit()
+            PAYMENTS_TOTAL.inc(event="pending", status="pending")
             
         return {"message": "Payment is pending", "order_id": order_id}
     except Exception as e:
@@ -202,54 +269,32 @@ async def payment_webhook(request: Request, db: Session = Depends(get_db)):
         data = await request.json()
         
         if data["type"] == "payment":
-            payment_info = sdk.payment().get(data["data"]["id"])
+            with tracer.start_span("mercadopago.payment.get", "client", {"mp.payment_id": str(data["data"]["id"])}):
+                payment_info = mp_breaker.call(sdk.payment().get, data["data"]["id"])
             
             if payment_info["status"] == 200:
                 payment_data = payment_info["response"]
                 order_id = int(payment_data["external_reference"])
                 
-                payment = db.query(Payment).filter(Payment.order_id == order_id).first()
+                payment = _locked_payment(db, order_id)
                 if payment:
                     # Update payment status based on MP status
                     mp_status = payment_data["status"]
                     if mp_status == "approved":
-                        payment.status = PaymentStatus.COMPLETED
-                    elif mp_status == "rejected":
-                        payment.status = PaymentStatus.FAILED
-                    else:
-                        payment.status = PaymentStatus.PENDING
-                    
-                    payment.mp_payment_id = str(payment_data["id"])
-                    payment.payment_date = datetime.utcnow()
-                    
-                    # If payment is completed, create sale record
-                    if mp_status == "approved":
-                        sale = Sale(
-                            order_id=order_id,
-                            payment_id=payment.id,
-                            sale_date=datetime.utcnow(),
-                            total_amount=payment.amount,
-                            tax_amount=calculate_tax(payment.amount),
-                            invoice_number=generate_invoice_number(db)
-                        )
-                        db.add(sale)
-                        
-                        # Update order status
+                        # Idempotente: la redirección de éxito o una entrega repetida pudo haberlo liquidado
                         order = db.query(Order).filter(Order.id == order_id).first()
-                        if order:
-                            order.status = "completed"
-                    
+                        if not _settle_payment(db, payment, order, str(payment_data["id"])):
+                            mp_status = "duplicate"
+                    elif payment.status == PaymentStatus.PAID:
+                        # Un aviso atrasado no revierte un pago ya acreditado
+                        mp_status = "duplicate"
+                    else:
+                        payment.status = PaymentStatus.FAILED if mp_status == "rejected" else PaymentStatus.PENDING
+                        payment.transaction_id = str(payment_data["id"])
+                        payment.payment_date = datetime.utcnow()
+
                     db.commit()
-                    
-                    # Send confirmation email for completed payments
-                    if mp_status == "approved":
-                        background_tasks = BackgroundTasks()
-                        background_tasks.add_task(
-                            send_payment_confirmation,
-                            order.user.email,
-                            order_id,
-                            payment.amount
-                        )
+                    PAYMENTS_TOTAL.inc(event="webhook", status=mp_status)
         
         return {"message": "Webhook processed successfully"}
     except Exception as e:
@@ -1,6 +1,8 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
+from datetime import datetime
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, Response
 from fastapi.responses import JSONResponse
 from sqlalchemy.orm import Session
+from sqlalchemy.orm.exc import StaleDataError
 from sqlalchemy import desc
 from typing import Optional, List
 from app.database import get_db
@@ -8,12 +10,23 @@ from app.models import product as models
 from app.schemas import product as schemas
 from app.utils import get_current_user, check_rol
 from app.models.user import User
+from app.utils.serialization import fast_json
+from app.utils import http_cache
+from app.services import carts as cart_service
+from app.services import cart_store
+from app.utils.concurrency import VersionConflict, check_version, conflict_response, expected_version
 
 router = APIRouter(
     prefix="/products",
     tags=["products"]
 )
 
+def _conflict(db: Session, product_id: int):
+    """409 con el producto tal como está ahora, para que el cliente reintente sobre esa versión"""
+    db.rollback()
+    current = db.query(models.Product).filter(models.Product.id == product_id).first()
+    return conflict_response(schemas.Product, current, "El producto fue modificado por otra petición")
+
 # Agregar Nuevos productos, solo si es vendedor
 @router.post("/", response_model=schemas.Product)
 def create_product(
@@ -50,6 +63,8 @@ def search_products(
 # Listar todos los productos
 @router.get("/", response_model=List[schemas.Product])
 def read_products(
+    request: Request,
+    response: Response,
     skip: int = 0,
     limit: int = 100,
     search: Optional[str] = None,
@@ -61,6 +76,13 @@ def read_products(
     db: Session = Depends(get_db)
 ):
     try:
+        # Revalidación: si el catálogo no cambió, 304 sin consultar ni serializar los productos
+        version, last_modified = http_cache.catalog_version(db)
+        etag = http_cache.make_etag("products", version, http_cache.canonical_query(request))
+        headers = http_cache.cache_headers(etag, last_modified, http_cache.catalog_cache_control())
+        if http_cache.is_not_modified(request, etag, last_modified):
+            return http_cache.not_modified_response(headers)
+
         query = db.query(models.Product)
         
         # Aplicar filtros
@@ -91,19 +113,28 @@ def read_products(
             query = query.order_by(desc(models.Product.created_at))
         # Si sort es 'none', no se aplica ningún ordenamiento
         products = query.offset(skip).limit(limit).all()
-        return products
+        response.headers.update(headers)
+        return fast_json(List[schemas.Product], products, headers=headers)
     except Exception as e:
         print(f"Error leyendo los productos: {e}")
         raise HTTPException(status_code=500, detail="Error interno del servidor")
 
         
 @router.get("/{product_id}", response_model=schemas.Product)
-def read_product(product_id: int, db: Session = Depends(get_db)):
+def read_product(product_id: int, request: Request, response: Response, db: Session = Depends(get_db)):
     try:
         product = db.query(models.Product).filter(models.Product.id == product_id).first()
         if not product:
             raise HTTPException(status_code=404, detail="Producto no encontrado")
-        return product
+
+        version, last_modified = http_cache.product_version(product)
+        etag = http_cache.make_etag("product", version)
+        headers = http_cache.cache_headers(etag, last_modified, http_cache.catalog_cache_control())
+        if http_cache.is_not_modified(request, etag, last_modified):
+            return http_cache.not_modified_response(headers)
+
+        response.headers.update(headers)
+        return fast_json(schemas.Product, product, headers=headers)
     except Exception as e:
         print(f"Error leyendo el producto: {e}")
         raise HTTPException(status_code=404, detail="Producto no encontrado")
@@ -115,24 +146,40 @@ def update_product(
     product_id: int,
     product_update: schemas.ProductUpdate,
     db: Session = Depends(get_db),
-    current_user: User = Depends(check_rol(["vendedor", "admin"]))
+    current_user: User = Depends(check_rol(["vendedor", "admin"])),
+    if_match: Optional[str] = Header(None)
 ):
     try:
         db_product = db.query(models.Product).filter(models.Product.id == product_id).first()
         if not db_product:
             raise HTTPException(status_code=404, detail="Producto no encontrado")
+        # Con If-Match solo se aplica sobre la versión que vio el cliente
+        check_version(db_product.version, expected_version(if_match))
             
         # Actualizar solo los campos proporcionados
-        for field, value in product_update.dict(exclude_unset=True).items():
+        changes = product_update.dict(exclude_unset=True)
+        repriced = changes.get("price") is not None and changes["price"] != db_product.price
+        if repriced:
+            # Ajusta subtotal y total de los carritos activos que tienen el producto
+            cart_service.reprice_product(db, product_id, changes["price"])
+        for field, value in changes.items():
             setattr(db_product, field, value)
             
         db_product.updated_at = datetime.utcnow()
         db_product.updated_by = current_user.id
         
         db.commit()
+        # El almacén caliente se actualiza solo si la base confirmó el nuevo precio
+        if repriced:
+            cart_store.reprice_product(product_id, changes["price"])
         db.refresh(db_product)
         return db_product
+    except (VersionConflict, StaleDataError):
+        return _conflict(db, product_id)
+    except HTTPException:
+        raise
     except Exception as e:
+        db.rollback()
         print(f"Error actualizando el producto: {e}")
         raise HTTPException(status_code=500, detail="Error interno del servidor")
 
@@ -162,12 +209,14 @@ def update_stock(
     product_id: int,
     stock_update: schemas.StockUpdate,
     db: Session = Depends(get_db),
-    current_user: User = Depends(check_rol(["vendedor", "admin"]))
+    current_user: User = Depends(check_rol(["vendedor", "admin"])),
+    if_match: Optional[str] = Header(None)
 ):
     try:
         db_product = db.query(models.Product).filter(models.Product.id == product_id).first()
         if not db_product:
             raise HTTPException(status_code=404, detail="Producto no encontrado")
+        check_version(db_product.version, expected_version(if_match))
             
         db_product.stock = stock_update.stock
         db_product.updated_at = datetime.utcnow()
@@ -176,6 +225,11 @@ def update_stock(
         db.commit()
         db.refresh(db_product)
         return db_product
+    except (VersionConflict, StaleDataError):
+        return _conflict(db, product_id)
+    except HTTPException:
+        raise
     except Exception as e:
+        db.rollback()
         print(f"Error actualizando el stock: {e}")
         raise HTTPException(status_code=500, detail="Error interno del servidor")
\ No newline at end of file
@@ -1,17 +1,33 @@
+from datetime import datetime
 from fastapi import APIRouter, Depends, HTTPException
 from fastapi.responses import JSONResponse
-from sqlalchemy.orm import Session, joinedload
+from sqlalchemy import select
+from sqlalchemy.orm import Session, joinedload, selectinload
 from app.database import get_db
-from app.models.sales import Sale as SaleModel
+from app.models.sales import Sale as SaleModel, SaleItem
 from app.schemas import sales as schemas
 from app.utils.permissions import check_rol
 from app.models.user import User
+from app.services.analytics import record_sale_completion
+from app.services.archive import ACTIVE_SALE_STATUSES, archived_sales, sale_page_source
 
 router = APIRouter(
     prefix="/sales",
     tags=["sales"]
 )
 
+# Carga de relaciones para los listados de ventas:
+# - items y productos con selectinload (un SELECT ... WHERE id IN (...) por nivel)
+#   para no multiplicar filas ni obligar a envolver LIMIT/OFFSET en una subconsulta
+# - usuario con joinedload (muchos-a-uno, no multiplica filas) y solo las columnas del schema
+def _sale_load_options():
+    return (
+        selectinload(SaleModel.items).selectinload(SaleItem.product),
+        joinedload(SaleModel.user).load_only(
+            User.id, User.email, User.name, User.lastname, User.is_active, User.rol
+        ),
+    )
+
 # Facturas pendientes
 @router.get("/pending", response_model=list[schemas.Sale])
 def read_pending_sales(
@@ -24,10 +40,7 @@ def read_pending_sales(
         sales = (
             db.query(SaleModel)
             .filter(SaleModel.status == "pending")
-            .options(
-                joinedload(SaleModel.items).joinedload(SaleModel.product),
-                joinedload(SaleModel.user)
-            )
+            .options(*_sale_load_options())
             .order_by(SaleModel.created_at.desc())
             .offset(skip)
             .limit(limit)
@@ -49,15 +62,17 @@ def get_sale(
         sale = (
             db.query(SaleModel)
             .filter(SaleModel.id == sale_id)
-            .options(
-                joinedload(SaleModel.items).joinedload(SaleModel.product),
-                joinedload(SaleModel.user)
-            )
+            .options(*_sale_load_options())
             .first()
         )
+        if not sale:
+            # Las ventas de órdenes archivadas se leen de las tablas frías
+            sale = archived_sales(db, [sale_id]).get(sale_id)
         if not sale:
             raise HTTPException(status_code=404, detail="Venta no encontrada")
         return sale
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error leyendo la venta: {e}")
         raise HTTPException(status_code=500, detail="Error interno del servidor")
@@ -78,19 +93,66 @@ def get_sales_summary(
                 detail="Estado no válido. Estados permitidos: pending, completed, cancelled"
             )
 
-        sales = (
-            db.query(SaleModel)
-            .filter(SaleModel.status == status)
-            .options(
-                joinedload(SaleModel.items).joinedload(SaleModel.product),
-                joinedload(SaleModel.user)
+        if status in ACTIVE_SALE_STATUSES:
+            # Las ventas pendientes nunca se archivan
+            return (
+                db.query(SaleModel)
+                .filter(SaleModel.status == status)
+                .options(*_sale_load_options())
+                .order_by(SaleModel.created_at.desc())
+                .offset(skip)
+                .limit(limit)
+                .all()
             )
-            .order_by(SaleModel.created_at.desc())
-            .offset(skip)
-            .limit(limit)
-            .all()
-        )
-        return sales
+
+        # Página sobre ventas calientes y archivadas; cada venta se carga de su tabla
+        pages = sale_page_source(status)
+        page = db.execute(
+            select(pages).order_by(pages.c.created_at.desc(), pages.c.id.desc()).offset(skip).limit(limit)
+        ).all()
+        hot_ids = [row.id for row in page if not row.archived]
+        hot = {}
+        if hot_ids:
+            hot = {
+                sale.id: sale
+                for sale in db.query(SaleModel).filter(SaleModel.id.in_(hot_ids)).options(*_sale_load_options()).all()
+            }
+        cold = archived_sales(db, [row.id for row in page if row.archived])
+        return [cold[row.id] if row.archived else hot[row.id] for row in page]
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error obteniendo el resumen de ventas: {e}")
-        raise HTTPException(status_code=500, detail="Error interno del servidor")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail="Error interno del servidor")
+
+# Completar una venta y acumularla en los rollups diarios (misma transacción)
+@router.post("/{sale_id}/complete", response_model=schemas.Sale)
+def complete_sale(
+    sale_id: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(check_rol(["vendedor", "admin"]))
+):
+    try:
+        sale = db.query(SaleModel).filter(SaleModel.id == sale_id).with_for_update().first()
+        if not sale:
+            raise HTTPException(status_code=404, detail="Venta no encontrada")
+        if sale.status != "pending":
+            raise HTTPException(status_code=400, detail="Solo se pueden completar ventas pendientes")
+
+        sale.status = "completed"
+        sale.completed_at = datetime.utcnow()
+        record_sale_completion(db, sale)
+        db.commit()
+
+        return (
+            db.query(SaleModel)
+            .filter(SaleModel.id == sale_id)
+            .options(*_sale_load_options())
+            .first()
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        db.rollback()
+        print(f"Error completando la venta: {e}")
+        raise HTTPException(status_code=500, detail="Error interno del servidor")
@@ -0,0 +1,29 @@
+from fastapi import APIRouter, Depends, HTTPException
+from app.models.user import User
+from app.utils.permissions import check_rol
+from app.utils.tracing import tracer, InMemorySpanExporter
+
+router = APIRouter(
+    prefix="/traces",
+    tags=["traces"]
+)
+
+def _memory_exporter() -> InMemorySpanExporter:
+    if not isinstance(tracer.exporter, InMemorySpanExporter):
+        raise HTTPException(status_code=404, detail="El exportador de trazas en memoria no está activo")
+    return tracer.exporter
+
+# Últimas trazas registradas (un resumen por traza a partir de su span raíz). Incluyen SQL e IDs: solo admin
+@router.get("/")
+def list_traces(limit: int = 50, current_user: User = Depends(check_rol(["admin"]))):
+    exporter = _memory_exporter()
+    roots = [span for span in list(exporter.spans) if span["parent_id"] is None or span["kind"] == "server"]
+    return roots[-limit:][::-1]
+
+# Todos los spans de una traza
+@router.get("/{trace_id}")
+def get_trace(trace_id: str, current_user: User = Depends(check_rol(["admin"]))):
+    spans = _memory_exporter().get_trace(trace_id)
+    if not spans:
+        raise HTTPException(status_code=404, detail="Traza no encontrada")
+    return sorted(spans, key=lambda span: span["start_time"])
@@ -1,5 +1,7 @@
-from fastapi import APIRouter, Depends, HTTPException
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Request
 from fastapi.responses import JSONResponse
+from sqlalchemy import select
 from sqlalchemy.orm import Session
 from app.database import get_db
 from app.models import user as models
@@ -7,6 +9,7 @@ from app.schemas import user as schemas
 from app.utils import get_password_hash, verify_password
 from app.utils import get_current_user, check_rol
 from app.models.user import User
+from app.utils.streaming import stream_mode, streaming_response
 
 router = APIRouter(
     prefix="/user",
@@ -39,13 +42,22 @@ def create_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
 
 @router.get("/", response_model=list[schemas.User])
 def read_users(
+    request: Request,
     skip: int = 0,
-    limit: int = 100,
+    limit: Optional[int] = None,
     db: Session = Depends(get_db),
     current_user: User = Depends(check_rol(["vendedor"]))
 ):
     try:
-        users = db.query(models.User).offset(skip).limit(limit).all()
+        # Streaming NDJSON / JSON para listados completos (limit opcional)
+        mode = stream_mode(request)
+        if mode:
+            query = select(models.User).order_by(models.User.id).offset(skip)
+            if limit is not None:
+                query = query.limit(limit)
+            return streaming_response(query, schemas.User, mode)
+
+        users = db.query(models.User).offset(skip).limit(limit or 100).all()
         return users
     except Exception as e:
         print(f"Error leyendo usuarios: {e}")
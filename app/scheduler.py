@@ -0,0 +1,66 @@
+"""
+Planificador de tareas periódicas en un proceso aparte (ver
+app/services/scheduler.py). Se pueden correr varios: cada ejecución la
+hace uno solo.
+
+    python -m app.scheduler
+    python -m app.scheduler --list        # tareas, próxima y última ejecución
+    python -m app.scheduler --run reaper  # ejecuta una tarea ahora
+"""
+import argparse
+import signal
+import threading
+from sqlalchemy import select
+from app.database import SessionLocal
+from app.models.scheduler import ScheduledRun
+from app.services import scheduler
+from app.services import schedules  # noqa: F401  registra las tareas
+
+def print_schedules():
+    db = SessionLocal()
+    try:
+        runs = {run.name: run for run in db.execute(select(ScheduledRun)).scalars()}
+    finally:
+        db.close()
+    for schedule in scheduler.schedules():
+        run = runs.get(schedule.name)
+        if run is None:
+            print(f"{schedule.name:<20} {schedule.description:<16} sin ejecuciones")
+            continue
+        duration = f"{run.last_duration:.2f} s" if run.last_duration is not None else "-"
+        print(
+            f"{schedule.name:<20} {schedule.description:<16} próxima {run.next_run_at:%Y-%m-%d %H:%M}  "
+            f"última {run.last_status or '-'} ({duration}, {run.last_node or '-'})"
+        )
+
+def main():
+    parser = argparse.ArgumentParser(description="Planificador de tareas periódicas")
+    parser.add_argument("--list", action="store_true", help="Muestra las tareas y su última ejecución")
+    parser.add_argument("--run", metavar="NAME", help="Ejecuta una tarea ahora (si ninguna réplica la está ejecutando)")
+    args = parser.parse_args()
+
+    if args.list:
+        print_schedules()
+        return
+
+    runner = scheduler.background_scheduler
+    if args.run:
+        found = [schedule for schedule in scheduler.schedules() if schedule.name == args.run]
+        if not found:
+            parser.error(f"Tarea desconocida: {args.run}")
+        print(f"Resultado: {scheduler.run_schedule(found[0], runner.node, force=True)}")
+        return
+
+    stopped = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stopped.set())
+    print(f"Planificador {runner.node}: {', '.join(schedule.name for schedule in scheduler.schedules())}")
+    runner.start()
+    try:
+        while not stopped.wait(1):
+            pass
+    except KeyboardInterrupt:
+        pass
+    runner.stop()
+
+if __name__ == "__main__":
+    main()
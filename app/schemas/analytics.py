@@ -0,0 +1,19 @@
+from datetime import date
+from pydantic import BaseModel
+from typing import List, Literal
+
+class SalesRollupRow(BaseModel):
+    key: str  # día (YYYY-MM-DD), id de producto o categoría según la agrupación
+    revenue: float
+    tax: float
+    units: int
+    sales_count: int
+
+class SalesAnalytics(BaseModel):
+    start: date
+    end: date
+    group_by: Literal["day", "product", "category"]
+    total_revenue: float
+    total_tax: float
+    total_units: int
+    rows: List[SalesRollupRow]
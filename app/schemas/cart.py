@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import List, Optional
+from typing import List, Literal, Optional
 from app.schemas.product import Product
 from app.schemas.user import User
 from app.schemas.coupon import CouponResponse
@@ -11,8 +11,9 @@ class CartItemCreate(CartItemBase):
     product: Product
 
 class CartItem(CartItemBase):
-    id: int
+    id: Optional[int] = None  # Nulo mientras el item solo existe en el almacén caliente de carritos
     cart_id: int
+    unit_price: Optional[float] = None
     product: Product
 
     class Config:
@@ -30,11 +31,22 @@ class Cart(BaseModel):
     user: User
     items: List[CartItem]
     coupon: Optional[CouponResponse] = None
+    subtotal: float = 0.0
     discount_amount: float = 0.0
+    total: float = 0.0
     status: str
+    version: Optional[int] = None  # Enviar en If-Match al modificar el carrito
 
     class Config:
         from_attributes = True
 
 class ApplyCouponRequest(BaseModel):
-    code: str
\ No newline at end of file
+    code: str
+
+class CartOperation(BaseModel):
+    op: Literal["add", "update", "remove"] = Field(..., description="add suma cantidad, update la reemplaza (0 elimina), remove quita el producto")
+    product_id: int
+    quantity: int = Field(1, ge=0, description="Cantidad a sumar (add) o cantidad final (update)")
+
+class CartBatchRequest(BaseModel):
+    operations: List[CartOperation] = Field(..., min_length=1, max_length=200)
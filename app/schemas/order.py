@@ -52,13 +52,13 @@ class OrderDetail(BaseModel):
     items: List[OrderItem]
     status: OrderStatus
     total_amount: float
-    shipping_address: Optional[str]
-    notes: Optional[str]
+    shipping_address: Optional[str] = None
+    notes: Optional[str] = None
     created_at: datetime
-    updated_at: Optional[datetime]
-    payment_status: Optional[str]
-    tracking_number: Optional[str]
-    estimated_delivery: Optional[datetime]
+    updated_at: Optional[datetime] = None
+    payment_status: Optional[str] = None
+    tracking_number: Optional[str] = None
+    estimated_delivery: Optional[datetime] = None
 
     class Config:
         from_attributes = True
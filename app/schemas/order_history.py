@@ -1,5 +1,5 @@
 from datetime import datetime
-from typing import List, Optional
+from typing import List, Literal, Optional
 from pydantic import BaseModel, Field
 from app.schemas.user import User
 from app.schemas.product import Product
@@ -28,4 +28,17 @@ class OrderHistory(BaseModel):
     cancelled_at: Optional[datetime] = None
 
     class Config:
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
+
+class BulkTransitionRequest(BaseModel):
+    order_ids: List[int] = Field(..., min_length=1, description="IDs de las órdenes a transicionar")
+    status: Literal["delivered", "cancelled"] = Field(..., description="Estado final: delivered o cancelled")
+    chunk_size: int = Field(500, ge=1, le=5000, description="Órdenes por lote (cada lote se confirma por separado)")
+
+class BulkTransitionResult(BaseModel):
+    status: str
+    requested: int
+    processed: int
+    skipped: int = Field(..., description="Órdenes omitidas por no estar en un estado válido para la transición")
+    chunks: int
+    processed_ids: List[int]
@@ -51,6 +51,7 @@ class Product(ProductBase):
     updated_at: Optional[datetime]
     created_by: Optional[int] = None
     updated_by: Optional[int] = None
+    version: Optional[int] = None  # Enviar en If-Match al modificar el producto
 
     class Config:
         from_attributes = True
\ No newline at end of file
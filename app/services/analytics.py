@@ -0,0 +1,243 @@
+"""
+Rollups diarios de ventas completadas (ingresos, impuestos y unidades por
+día y producto, con la categoría desnormalizada).
+
+Cada venta se acumula una sola vez al completarse (record_sale_completion,
+en la misma transacción que el cambio de estado). Las consultas por rango
+leen solo los rollups. El backfill lee las tablas calientes y las frías
+(app/services/archive.py), así los rangos ya archivados no se pierden.
+Para datos existentes:
+
+    python -m app.services.analytics backfill --start 2025-01-01 --end 2025-12-31
+"""
+import argparse
+from datetime import date, datetime, time, timedelta
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import delete, func, select, union_all
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+from app.models.analytics import SalesDailyRollup, SalesRollupEntry
+from app.models.archive import order_items_archive, sale_items_archive, sales_archive
+from app.models.orders import OrderItem
+from app.models.product import Product
+from app.models.sales import Sale, SaleItem
+
+GROUPINGS = ("day", "product", "category")
+
+# (día, product_id) -> [category, revenue, tax, units, sales_count]
+RollupBuffer = Dict[Tuple[date, int], list]
+
+def _sale_day(sale: Sale) -> date:
+    return (sale.completed_at or sale.updated_at or sale.created_at or datetime.utcnow()).date()
+
+def _lines(db: Session, tables: list, key: str, values) -> Dict[int, List[tuple]]:
+    """Líneas de `tables` cuyo `key` está en `values`, agrupadas por ese valor (un solo SELECT)"""
+    queries = [
+        select(table.c[key], table.c.product_id, Product.category, table.c.quantity, table.c.unit_price)
+        .join(Product, Product.id == table.c.product_id)
+        .where(table.c[key].in_(values))
+        for table in tables
+    ]
+    lines: Dict[int, List[tuple]] = {}
+    for owner, *line in db.execute(queries[0] if len(queries) == 1 else union_all(*queries)):
+        lines.setdefault(owner, []).append(tuple(line))
+    return lines
+
+def _sales_lines(db: Session, sales: list, include_archive: bool = False) -> Dict[int, List[tuple]]:
+    """
+    (product_id, category, quantity, unit_price) de cada venta por id; las
+    que no tienen items usan los de su orden. Con include_archive también
+    lee las tablas frías. Dos consultas como máximo, sin importar cuántas ventas.
+    """
+    sale_items = [SaleItem.__table__] + ([sale_items_archive] if include_archive else [])
+    order_items = [OrderItem.__table__] + ([order_items_archive] if include_archive else [])
+    lines = _lines(db, sale_items, "sale_id", [sale.id for sale in sales])
+    missing = [sale for sale in sales if sale.id not in lines and sale.order_id is not None]
+    if missing:
+        order_lines = _lines(db, order_items, "order_id", {sale.order_id for sale in missing})
+        for sale in missing:
+            lines[sale.id] = order_lines.get(sale.order_id, [])
+    return lines
+
+def _completed_sales(start_at: datetime, end_at: datetime):
+    """Ventas completadas en [start_at, end_at) de la tabla caliente y de la fría"""
+    def sales_select(sales):
+        completed_at = func.coalesce(sales.c.completed_at, sales.c.updated_at, sales.c.created_at)
+        return select(
+            sales.c.id,
+            sales.c.order_id,
+            sales.c.tax_amount,
+            sales.c.completed_at,
+            sales.c.updated_at,
+            sales.c.created_at,
+        ).where(sales.c.status == "completed", completed_at >= start_at, completed_at < end_at)
+
+    return union_all(sales_select(Sale.__table__), sales_select(sales_archive)).subquery("completed_sales")
+
+def _accumulate(buffer: RollupBuffer, day: date, sale: Sale, lines: List[tuple]):
+    gross = sum((quantity or 0) * (unit_price or 0) for _, _, quantity, unit_price in lines)
+    # El impuesto de la venta se reparte proporcionalmente entre sus líneas
+    tax_ratio = (sale.tax_amount or 0) / gross if gross else 0
+    for product_id, category, quantity, unit_price in lines:
+        revenue = (quantity or 0) * (unit_price or 0)
+        entry = buffer.setdefault((day, product_id), [category, 0.0, 0.0, 0, 0])
+        entry[1] += revenue
+        entry[2] += revenue * tax_ratio
+        entry[3] += quantity or 0
+        entry[4] += 1
+
+def _upsert(db: Session, buffer: RollupBuffer):
+    """Suma el buffer a los rollups existentes (INSERT ... ON CONFLICT DO UPDATE)"""
+    if not buffer:
+        return
+    dialect = db.get_bind().dialect.name
+    rows = [
+        {
+            "day": day, "product_id": product_id, "category": values[0], "revenue": values[1],
+            "tax": values[2], "units": values[3], "sales_count": values[4], "updated_at": datetime.utcnow()
+        }
+        for (day, product_id), values in buffer.items()
+    ]
+    if dialect in ("postgresql", "sqlite"):
+        insert = postgresql.insert if dialect == "postgresql" else sqlite.insert
+        statement = insert(SalesDailyRollup)
+        table = SalesDailyRollup.__table__
+        statement = statement.on_conflict_do_update(
+            index_elements=["day", "product_id"],
+            set_={
+                "revenue": table.c.revenue + statement.excluded.revenue,
+                "tax": table.c.tax + statement.excluded.tax,
+                "units": table.c.units + statement.excluded.units,
+                "sales_count": table.c.sales_count + statement.excluded.sales_count,
+                "category": statement.excluded.category,
+                "updated_at": statement.excluded.updated_at,
+            }
+        )
+        db.execute(statement, rows)
+        return
+
+    # Otros motores: lectura y actualización fila por fila
+    for row in rows:
+        rollup = db.query(SalesDailyRollup).filter(
+            SalesDailyRollup.day == row["day"], SalesDailyRollup.product_id == row["product_id"]
+        ).with_for_update().first()
+        if rollup is None:
+            db.add(SalesDailyRollup(**row))
+        else:
+            rollup.revenue += row["revenue"]
+            rollup.tax += row["tax"]
+            rollup.units += row["units"]
+            rollup.sales_count += row["sales_count"]
+
+def record_sale_completion(db: Session, sale: Sale) -> bool:
+    """
+    Acumula una venta completada en los rollups. No confirma la transacción:
+    se llama junto con el cambio de estado de la venta. Devuelve False si la
+    venta ya estaba acumulada.
+    """
+    if db.get(SalesRollupEntry, sale.id) is not None:
+        return False
+    day = _sale_day(sale)
+    buffer: RollupBuffer = {}
+    _accumulate(buffer, day, sale, _sales_lines(db, [sale]).get(sale.id, []))
+    db.add(SalesRollupEntry(sale_id=sale.id, day=day))
+    db.flush()
+    _upsert(db, buffer)
+    return True
+
+def backfill(db: Session, start: date, end: date, batch_size: int = 1000) -> int:
+    """
+    Recalcula los rollups de [start, end] a partir de las ventas completadas,
+    calientes y archivadas. Borra los rollups del rango y los vuelve a construir, así que puede
+    ejecutarse varias veces. Devuelve la cantidad de ventas procesadas.
+    """
+    start_at = datetime.combine(start, time.min)
+    end_at = datetime.combine(end + timedelta(days=1), time.min)
+
+    db.execute(delete(SalesDailyRollup).where(SalesDailyRollup.day >= start, SalesDailyRollup.day <= end))
+    db.execute(delete(SalesRollupEntry).where(SalesRollupEntry.day >= start, SalesRollupEntry.day <= end))
+
+    buffer: RollupBuffer = {}
+    entries = []
+    processed = 0
+    source = _completed_sales(start_at, end_at)
+    sales = db.execute(
+        select(source).order_by(source.c.id).execution_options(yield_per=batch_size)
+    )
+    # Las líneas de cada lote de ventas se leen juntas, no venta por venta
+    for batch in sales.partitions():
+        lines = _sales_lines(db, batch, include_archive=True)
+        for sale in batch:
+            day = _sale_day(sale)
+            _accumulate(buffer, day, sale, lines.get(sale.id, []))
+            entries.append({"sale_id": sale.id, "day": day, "created_at": datetime.utcnow()})
+            processed += 1
+
+    if entries:
+        db.execute(SalesRollupEntry.__table__.insert(), entries)
+    _upsert(db, buffer)
+    db.commit()
+    return processed
+
+def query_rollups(db: Session, start: date, end: date, group_by: str = "day", category: Optional[str] = None) -> List[dict]:
+    """Totales por día, producto o categoría entre start y end (inclusive), leídos solo de los rollups"""
+    if group_by not in GROUPINGS:
+        raise ValueError(f"Agrupación no soportada: {group_by}")
+    key = {
+        "day": SalesDailyRollup.day,
+        "product": SalesDailyRollup.product_id,
+        "category": SalesDailyRollup.category,
+    }[group_by]
+    query = (
+        select(
+            key.label("key"),
+            func.sum(SalesDailyRollup.revenue).label("revenue"),
+            func.sum(SalesDailyRollup.tax).label("tax"),
+            func.sum(SalesDailyRollup.units).label("units"),
+            func.sum(SalesDailyRollup.sales_count).label("sales_count"),
+        )
+        .where(SalesDailyRollup.day >= start, SalesDailyRollup.day <= end)
+        .group_by(key)
+        .order_by(key)
+    )
+    if category:
+        query = query.where(SalesDailyRollup.category == category)
+    return [
+        {
+            "key": str(row.key),
+            "revenue": round(row.revenue or 0, 2),
+            "tax": round(row.tax or 0, 2),
+            "units": int(row.units or 0),
+            "sales_count": int(row.sales_count or 0),
+        }
+        for row in db.execute(query)
+    ]
+
+def main():
+    from app.database import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Rollups diarios de ventas")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    backfill_parser = subparsers.add_parser("backfill", help="Reconstruye los rollups de un rango de fechas")
+    backfill_parser.add_argument("--start", type=date.fromisoformat, required=True)
+    backfill_parser.add_argument("--end", type=date.fromisoformat, default=date.today())
+    backfill_parser.add_argument("--days-per-batch", type=int, default=31)
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        # Un rango por transacción para no mantener bloqueos largos
+        current = args.start
+        total = 0
+        while current <= args.end:
+            until = min(current + timedelta(days=args.days_per_batch - 1), args.end)
+            processed = backfill(db, current, until)
+            total += processed
+            print(f"{current} a {until}: {processed} ventas")
+            current = until + timedelta(days=1)
+        print(f"Listo: {total} ventas acumuladas")
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,303 @@
+"""
+Separación caliente / fría de órdenes, ventas e historial.
+
+Las órdenes cerradas (entregadas, canceladas, completadas o reembolsadas)
+más antiguas que HOT_WINDOW_DAYS se mueven, junto con sus items, pagos y
+ventas, a las tablas *_archive (salvo las que tienen la venta todavía
+pendiente). Así las tablas calientes solo crecen con la actividad
+reciente y los listados por estado activo no recorren el historial
+completo. El movimiento se hace por lotes con INSERT ... SELECT y DELETE,
+confirmando cada lote. Las lecturas de órdenes y ventas cerradas unen
+caliente y fría (order_summary_source, order_totals, archived_*).
+
+    python -m app.services.archive --older-than-days 90
+"""
+import argparse
+import os
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional
+from dotenv import load_dotenv
+from sqlalchemy import case, delete, func, insert, literal, select, DateTime, union_all
+from sqlalchemy.orm import Session
+from app.models.orders import Order, OrderItem
+from app.models.product import Product
+from app.models.user import User
+from app.models.sales import Payment, Sale, SaleItem
+from app.models.order_history import OrderHistory, OrderHistoryItem
+from app.models.archive import (
+    orders_archive,
+    order_items_archive,
+    payments_archive,
+    sales_archive,
+    sale_items_archive,
+    order_history_archive,
+    order_history_items_archive,
+)
+
+load_dotenv()
+
+# Días que una orden cerrada permanece en las tablas calientes
+HOT_WINDOW_DAYS = int(os.getenv("HOT_WINDOW_DAYS", "90"))
+CLOSED_ORDER_STATUSES = ["delivered", "cancelled", "completed", "refunded"]
+ACTIVE_ORDER_STATUSES = ["pending", "confirmed", "paid", "processing", "shipped"]
+# Una orden con la venta pendiente sigue en las tablas calientes hasta que el vendedor la cierre
+ACTIVE_SALE_STATUSES = ["pending"]
+DEFAULT_CHUNK_SIZE = 1000
+
+ProgressCallback = Callable[[int, int], None]
+
+def is_hot_only(status: Optional[str]) -> bool:
+    """Las consultas por un estado activo nunca necesitan las tablas frías"""
+    return status is not None and status in ACTIVE_ORDER_STATUSES
+
+def default_cutoff() -> datetime:
+    return datetime.utcnow() - timedelta(days=HOT_WINDOW_DAYS)
+
+def _copy(db: Session, hot, cold, where, now: datetime):
+    columns = [column.name for column in hot.columns]
+    db.execute(
+        insert(cold).from_select(
+            columns + ["archived_at"],
+            select(*[hot.c[name] for name in columns], literal(now, DateTime)).where(where)
+        )
+    )
+
+def _archive_orders_chunk(db: Session, order_ids: List[int], now: datetime):
+    orders, items, payments = Order.__table__, OrderItem.__table__, Payment.__table__
+    sales, sale_items = Sale.__table__, SaleItem.__table__
+    sale_ids = select(sales.c.id).where(sales.c.order_id.in_(order_ids))
+
+    _copy(db, orders, orders_archive, orders.c.id.in_(order_ids), now)
+    _copy(db, items, order_items_archive, items.c.order_id.in_(order_ids), now)
+    _copy(db, payments, payments_archive, payments.c.order_id.in_(order_ids), now)
+    _copy(db, sales, sales_archive, sales.c.order_id.in_(order_ids), now)
+    _copy(db, sale_items, sale_items_archive, sale_items.c.sale_id.in_(sale_ids), now)
+
+    # Borrado en orden inverso a las claves foráneas
+    db.execute(delete(sale_items).where(sale_items.c.sale_id.in_(sale_ids)))
+    db.execute(delete(sales).where(sales.c.order_id.in_(order_ids)))
+    db.execute(delete(payments).where(payments.c.order_id.in_(order_ids)))
+    db.execute(delete(items).where(items.c.order_id.in_(order_ids)))
+    db.execute(delete(orders).where(orders.c.id.in_(order_ids)))
+
+def archive_cold_orders(
+    db: Session,
+    older_than: Optional[datetime] = None,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    progress: Optional[ProgressCallback] = None
+) -> int:
+    """Mueve las órdenes cerradas anteriores a `older_than` a las tablas frías. Devuelve cuántas movió"""
+    older_than = older_than or default_cutoff()
+    moved = 0
+    last_id = 0
+    while True:
+        order_ids = db.execute(
+            select(Order.id)
+            .where(
+                Order.id > last_id,
+                Order.status.in_(CLOSED_ORDER_STATUSES),
+                Order.created_at < older_than,
+                ~select(Sale.id).where(Sale.order_id == Order.id, Sale.status.in_(ACTIVE_SALE_STATUSES)).exists()
+            )
+            .order_by(Order.id)
+            .limit(chunk_size)
+            .with_for_update(skip_locked=True)
+        ).scalars().all()
+        if not order_ids:
+            break
+        last_id = order_ids[-1]
+        try:
+            _archive_orders_chunk(db, order_ids, datetime.utcnow())
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        moved += len(order_ids)
+        if progress:
+            progress(moved, last_id)
+    return moved
+
+def archive_cold_history(
+    db: Session,
+    older_than: Optional[datetime] = None,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    progress: Optional[ProgressCallback] = None
+) -> int:
+    """Mueve las entradas de order_history anteriores a `older_than` a las tablas frías"""
+    older_than = older_than or default_cutoff()
+    history, history_items = OrderHistory.__table__, OrderHistoryItem.__table__
+    closed_at = func.coalesce(history.c.delivered_at, history.c.cancelled_at, history.c.created_at)
+    moved = 0
+    last_id = 0
+    while True:
+        history_ids = db.execute(
+            select(history.c.id)
+            .where(history.c.id > last_id, closed_at < older_than)
+            .order_by(history.c.id)
+            .limit(chunk_size)
+        ).scalars().all()
+        if not history_ids:
+            break
+        last_id = history_ids[-1]
+        now = datetime.utcnow()
+        try:
+            _copy(db, history, order_history_archive, history.c.id.in_(history_ids), now)
+            _copy(db, history_items, order_history_items_archive, history_items.c.order_history_id.in_(history_ids), now)
+            db.execute(delete(history_items).where(history_items.c.order_history_id.in_(history_ids)))
+            db.execute(delete(history).where(history.c.id.in_(history_ids)))
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        moved += len(history_ids)
+        if progress:
+            progress(moved, last_id)
+    return moved
+
+def order_summary_source(
+    user_id: Optional[int] = None,
+    status: Optional[str] = None,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None
+):
+    """
+    Subconsulta con las columnas de OrderSummary (id, order_number, status,
+    total_amount, created_at, items_count). Si el estado pedido es activo
+    solo lee la tabla caliente; si no, une caliente y fría. Los filtros se
+    aplican dentro de cada rama para que usen los índices de cada tabla.
+    """
+    def summary_select(orders, items):
+        counts = select(items.c.order_id, func.count(items.c.id).label("items_count")).group_by(items.c.order_id)
+        query = select(
+            orders.c.id,
+            orders.c.order_number,
+            orders.c.status,
+            orders.c.total_amount,
+            orders.c.created_at,
+        )
+        if user_id is not None:
+            counts = counts.where(
+                items.c.order_id.in_(select(orders.c.id).where(orders.c.user_id == user_id))
+            )
+            query = query.where(orders.c.user_id == user_id)
+        if status is not None:
+            query = query.where(orders.c.status == status)
+        if start_date is not None:
+            query = query.where(orders.c.created_at >= start_date)
+        if end_date is not None:
+            query = query.where(orders.c.created_at <= end_date)
+        counts = counts.subquery()
+        return (
+            query.add_columns(func.coalesce(counts.c.items_count, 0).label("items_count"))
+            .outerjoin_from(orders, counts, counts.c.order_id == orders.c.id)
+        )
+
+    hot = summary_select(Order.__table__, OrderItem.__table__)
+    if is_hot_only(status):
+        return hot.subquery("order_summaries")
+    cold = summary_select(orders_archive, order_items_archive)
+    return union_all(hot, cold).subquery("order_summaries")
+
+def order_totals(db: Session, user_id: int) -> dict:
+    """Cantidad de órdenes del usuario, pendientes, completadas y total gastado, sumando caliente y fría"""
+    def totals_select(orders):
+        return select(orders.c.status, orders.c.total_amount).where(orders.c.user_id == user_id)
+
+    orders = union_all(totals_select(Order.__table__), totals_select(orders_archive)).subquery("user_orders")
+    completed = orders.c.status == "completed"
+    row = db.execute(
+        select(
+            func.count().label("total_orders"),
+            func.coalesce(func.sum(case((orders.c.status == "pending", 1), else_=0)), 0).label("pending_orders"),
+            func.coalesce(func.sum(case((completed, 1), else_=0)), 0).label("completed_orders"),
+            func.coalesce(func.sum(case((completed, orders.c.total_amount), else_=0)), 0).label("total_spent"),
+        )
+    ).one()
+    return row._asdict()
+
+def _by_id(db: Session, model, ids) -> dict:
+    if not ids:
+        return {}
+    return {row.id: row for row in db.query(model).filter(model.id.in_(ids)).all()}
+
+def archived_order_detail(db: Session, order_id: int, user_id: int) -> Optional[dict]:
+    """Orden archivada del usuario con la forma de OrderDetail (usuario, items y productos), o None"""
+    order = db.execute(
+        select(orders_archive).where(orders_archive.c.id == order_id, orders_archive.c.user_id == user_id)
+    ).mappings().first()
+    if order is None:
+        return None
+    items = db.execute(
+        select(order_items_archive).where(order_items_archive.c.order_id == order_id).order_by(order_items_archive.c.id)
+    ).mappings().all()
+    products = _by_id(db, Product, {item["product_id"] for item in items})
+    return {
+        **order,
+        "user": db.get(User, order["user_id"]),
+        "items": [
+            {
+                **item,
+                "subtotal": (item["quantity"] or 0) * (item["unit_price"] or 0),
+                "product": products.get(item["product_id"]),
+            }
+            for item in items
+        ],
+    }
+
+def archived_sales(db: Session, sale_ids: List[int]) -> Dict[int, dict]:
+    """Ventas archivadas por id con la forma del schema Sale (usuario, items y productos)"""
+    if not sale_ids:
+        return {}
+    sales = db.execute(select(sales_archive).where(sales_archive.c.id.in_(sale_ids))).mappings().all()
+    items = db.execute(
+        select(sale_items_archive)
+        .where(sale_items_archive.c.sale_id.in_(sale_ids))
+        .order_by(sale_items_archive.c.id)
+    ).mappings().all()
+    products = _by_id(db, Product, {item["product_id"] for item in items})
+    users = _by_id(db, User, {sale["user_id"] for sale in sales})
+    result = {sale["id"]: {**sale, "user": users.get(sale["user_id"]), "items": []} for sale in sales}
+    for item in items:
+        result[item["sale_id"]]["items"].append({**item, "product": products.get(item["product_id"])})
+    return result
+
+def sale_page_source(status: str):
+    """
+    Subconsulta (id, created_at, archived) con las ventas en `status` de las
+    tablas caliente y fría, para paginar por fecha y después cargar cada
+    venta de su tabla. Los ids se conservan al archivar, no se repiten.
+    """
+    def page_select(sales, archived: bool):
+        return select(
+            sales.c.id,
+            sales.c.created_at,
+            literal(archived).label("archived"),
+        ).where(sales.c.status == status)
+
+    return union_all(page_select(Sale.__table__, False), page_select(sales_archive, True)).subquery("sale_pages")
+
+def main():
+    from app.database import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Mueve órdenes cerradas e historial antiguo a las tablas frías")
+    parser.add_argument("--older-than-days", type=int, default=HOT_WINDOW_DAYS)
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    args = parser.parse_args()
+    older_than = datetime.utcnow() - timedelta(days=args.older_than_days)
+
+    db = SessionLocal()
+    try:
+        orders = archive_cold_orders(
+            db, older_than, args.chunk_size,
+            lambda moved, last_id: print(f"Órdenes archivadas: {moved} (último id {last_id})")
+        )
+        history = archive_cold_history(
+            db, older_than, args.chunk_size,
+            lambda moved, last_id: print(f"Historial archivado: {moved} (último id {last_id})")
+        )
+        print(f"Listo: {orders} órdenes y {history} entradas de historial movidas a las tablas frías")
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    main()
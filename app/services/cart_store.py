@@ -0,0 +1,555 @@
+"""
+Almacén caliente de carritos activos (opcional).
+
+Con CART_STORE=memory o CART_STORE=redis las altas, cambios y bajas de
+productos de un carrito activo se aplican sobre una copia del carrito en un
+almacén clave-valor con vencimiento (CART_STORE_TTL segundos sin cambios) y
+no abren una transacción de escritura en PostgreSQL:
+
+- El carrito se carga desde la base la primera vez que se edita.
+- Cada cambio marca el carrito como pendiente; un hilo (WriteBehindFlusher)
+  escribe los pendientes cada CART_STORE_FLUSH_INTERVAL segundos, de a
+  CART_STORE_FLUSH_BATCH carritos por transacción (write-behind).
+- Antes de cualquier operación que lee o modifica el carrito en la base
+  (cupón, checkout, crear la orden, borrar o reemplazar el carrito) se
+  llama a hydrate: escribe el carrito de forma sincrónica y lo saca del
+  almacén, así la base vuelve a ser la fuente de verdad.
+
+El backend memory vive en el proceso (tests, desarrollo o un único
+worker); redis (pip install redis, REDIS_URL) se comparte entre workers.
+CART_STORE_TTL debe ser mucho mayor que CART_STORE_FLUSH_INTERVAL: un
+carrito pendiente que vence antes de escribirse pierde sus últimos cambios.
+
+Los items agregados en el almacén tienen id nulo hasta que se escriben.
+La versión del carrito (If-Match, ver app.utils.concurrency) avanza con
+cada cambio en el almacén y se copia a la base al escribirlo.
+
+Comparación de ediciones por segundo: python -m benchmarks.cart_store
+"""
+import json
+import os
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+from dotenv import load_dotenv
+from sqlalchemy import bindparam, select, update
+from sqlalchemy.orm import Session
+from app.models.cart import Cart, CartItem
+from app.models.coupon import Coupon
+from app.models.product import Product
+from app.schemas.cart import CartOperation
+from app.services.carts import CartOperationError
+from app.utils.concurrency import check_version
+from app.utils.metrics import CART_STORE_FLUSHED_TOTAL
+
+try:
+    import redis
+except ImportError:  # redis es opcional
+    redis = None
+
+load_dotenv()
+
+CART_STORE = os.getenv("CART_STORE", "none").lower()
+CART_STORE_TTL = int(os.getenv("CART_STORE_TTL", "3600"))
+CART_STORE_FLUSH_INTERVAL = float(os.getenv("CART_STORE_FLUSH_INTERVAL", "2"))
+CART_STORE_FLUSH_BATCH = int(os.getenv("CART_STORE_FLUSH_BATCH", "200"))
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+
+class MemoryCartStore:
+    """Carritos en un diccionario del proceso, con vencimiento y conjunto de pendientes"""
+
+    def __init__(self, ttl: int = CART_STORE_TTL):
+        self.ttl = ttl
+        self._entries: Dict[int, Tuple[float, dict]] = {}
+        self._dirty: set = set()
+        self._lock = threading.Lock()
+
+    def _live(self, cart_id: int) -> Optional[dict]:
+        entry = self._entries.get(cart_id)
+        if entry is None:
+            return None
+        if entry[0] < time.monotonic():
+            del self._entries[cart_id]
+            return None
+        return entry[1]
+
+    def get(self, cart_id: int) -> Optional[dict]:
+        with self._lock:
+            state = self._live(cart_id)
+        return json.loads(json.dumps(state)) if state is not None else None
+
+    def get_many(self, cart_ids: Iterable[int]) -> Dict[int, dict]:
+        states = {}
+        for cart_id in cart_ids:
+            state = self.get(cart_id)
+            if state is not None:
+                states[cart_id] = state
+        return states
+
+    def update(self, cart_id: int, change: Callable[[Optional[dict]], Optional[dict]], dirty: bool = True) -> Optional[dict]:
+        """Aplica `change` al carrito de forma atómica; devolver None lo quita del almacén"""
+        with self._lock:
+            current = self._live(cart_id)
+            state = change(json.loads(json.dumps(current)) if current is not None else None)
+            if state is None:
+                self._entries.pop(cart_id, None)
+                self._dirty.discard(cart_id)
+                return None
+            self._entries[cart_id] = (time.monotonic() + self.ttl, state)
+            if dirty:
+                self._dirty.add(cart_id)
+        return state
+
+    def delete(self, cart_id: int):
+        with self._lock:
+            self._entries.pop(cart_id, None)
+            self._dirty.discard(cart_id)
+
+    def mark_dirty(self, cart_ids: Iterable[int]):
+        with self._lock:
+            self._dirty.update(cart_ids)
+
+    def pop_dirty(self, limit: int) -> List[int]:
+        with self._lock:
+            cart_ids = [self._dirty.pop() for _ in range(min(limit, len(self._dirty)))]
+        return cart_ids
+
+    def cart_ids(self) -> List[int]:
+        with self._lock:
+            return list(self._entries)
+
+class RedisCartStore:
+    """Carritos como JSON en Redis (SET con EX) y un SET de pendientes compartido entre workers"""
+
+    def __init__(self, url: str = REDIS_URL, ttl: int = CART_STORE_TTL, prefix: str = "carts"):
+        self.client = redis.Redis.from_url(url)
+        self.ttl = ttl
+        self.prefix = prefix
+        self.dirty_key = f"{prefix}:dirty"
+
+    def _key(self, cart_id: int) -> str:
+        return f"{self.prefix}:{cart_id}"
+
+    def get(self, cart_id: int) -> Optional[dict]:
+        raw = self.client.get(self._key(cart_id))
+        return json.loads(raw) if raw else None
+
+    def get_many(self, cart_ids: Iterable[int]) -> Dict[int, dict]:
+        cart_ids = list(cart_ids)
+        if not cart_ids:
+            return {}
+        raws = self.client.mget([self._key(cart_id) for cart_id in cart_ids])
+        return {cart_id: json.loads(raw) for cart_id, raw in zip(cart_ids, raws) if raw}
+
+    def update(self, cart_id: int, change: Callable[[Optional[dict]], Optional[dict]], dirty: bool = True) -> Optional[dict]:
+        """WATCH / MULTI: si otro worker cambia el carrito en el medio, `change` se reintenta"""
+        key = self._key(cart_id)
+
+        def apply(pipe):
+            raw = pipe.get(key)
+            state = change(json.loads(raw) if raw else None)
+            pipe.multi()
+            if state is None:
+                pipe.delete(key)
+                pipe.srem(self.dirty_key, cart_id)
+            else:
+                pipe.set(key, json.dumps(state), ex=self.ttl)
+                if dirty:
+                    pipe.sadd(self.dirty_key, cart_id)
+            return state
+
+        return self.client.transaction(apply, key, value_from_callable=True)
+
+    def delete(self, cart_id: int):
+        pipe = self.client.pipeline()
+        pipe.delete(self._key(cart_id))
+        pipe.srem(self.dirty_key, cart_id)
+        pipe.execute()
+
+    def mark_dirty(self, cart_ids: Iterable[int]):
+        cart_ids = list(cart_ids)
+        if cart_ids:
+            self.client.sadd(self.dirty_key, *cart_ids)
+
+    def pop_dirty(self, limit: int) -> List[int]:
+        return [int(cart_id) for cart_id in self.client.spop(self.dirty_key, limit) or []]
+
+    def cart_ids(self) -> List[int]:
+        return [
+            int(key.decode().rsplit(":", 1)[1])
+            for key in self.client.scan_iter(match=f"{self.prefix}:*", count=500)
+            if key.decode() != self.dirty_key
+        ]
+
+def build_store():
+    if CART_STORE == "memory":
+        return MemoryCartStore()
+    if CART_STORE == "redis":
+        if redis is None:
+            raise RuntimeError("CART_STORE=redis requiere el paquete redis (pip install redis)")
+        return RedisCartStore()
+    return None
+
+store = build_store()
+
+def enabled() -> bool:
+    return store is not None
+
+def totals(state: dict, discount_percent: Optional[float] = None) -> dict:
+    """Subtotal, descuento y total del carrito en el almacén"""
+    if discount_percent is None:
+        discount_percent = state["discount_percent"]
+    subtotal = sum(line["quantity"] * line["unit_price"] for line in state["items"])
+    discount = subtotal * (discount_percent or 0.0) / 100
+    return {"subtotal": subtotal, "discount_amount": discount, "total": subtotal - discount}
+
+def _load_state(db: Session, cart_id: int, user_id: int) -> dict:
+    cart = db.execute(
+        select(Cart.id, Cart.user_id, Cart.coupon_id, Cart.discount_percent, Cart.version)
+        .where(Cart.id == cart_id, Cart.user_id == user_id, Cart.status == "active")
+    ).first()
+    if cart is None:
+        raise CartOperationError("Carrito no encontrado o no está activo", status_code=404)
+    rows = db.execute(
+        select(CartItem.id, CartItem.product_id, CartItem.quantity, CartItem.unit_price, Product.price)
+        .join(Product, Product.id == CartItem.product_id)
+        .where(CartItem.cart_id == cart_id)
+        .order_by(CartItem.id)
+    ).all()
+    return {
+        "id": cart.id,
+        "user_id": cart.user_id,
+        "coupon_id": cart.coupon_id,
+        "discount_percent": cart.discount_percent or 0.0,
+        "version": cart.version,
+        "items": [
+            {
+                "id": row.id,
+                "product_id": row.product_id,
+                "quantity": row.quantity,
+                "unit_price": row.unit_price if row.unit_price is not None else (row.price or 0.0),
+            }
+            for row in rows
+        ],
+    }
+
+def _apply(state: dict, operations: List[CartOperation], prices: Dict[int, float], summary: dict) -> dict:
+    # Mismas reglas que app.services.carts.apply_operations, sobre la copia del almacén
+    for key in summary:
+        summary[key] = 0
+    items = {line["product_id"]: line for line in state["items"]}
+    for operation in operations:
+        line = items.get(operation.product_id)
+        if operation.op == "add":
+            if operation.quantity <= 0:
+                raise CartOperationError("La cantidad a agregar debe ser mayor que 0")
+            if line is None:
+                line = {"id": None, "product_id": operation.product_id, "quantity": 0,
+                        "unit_price": prices[operation.product_id] or 0.0}
+                items[operation.product_id] = line
+            line["quantity"] += operation.quantity
+            summary["added"] += 1
+        elif operation.op == "update":
+            if line is None:
+                raise CartOperationError(f"El producto {operation.product_id} no está en el carrito", status_code=404)
+            if operation.quantity == 0:
+                del items[operation.product_id]
+                summary["removed"] += 1
+            else:
+                line["quantity"] = operation.quantity
+                summary["updated"] += 1
+        elif line is not None:
+            del items[operation.product_id]
+            summary["removed"] += 1
+    state["items"] = list(items.values())
+    if any(summary.values()):
+        state["version"] += 1
+    return state
+
+def apply_operations(db: Session, cart_id: int, user_id: int, operations: List[CartOperation],
+                     expected_version: Optional[int] = None) -> Tuple[dict, Dict[str, int]]:
+    """
+    Aplica las operaciones al carrito en el almacén y lo marca pendiente de
+    escritura. Solo lee de la base: el carrito la primera vez y el precio de
+    los productos que se agregan. Lanza VersionConflict si se indica una
+    versión esperada y no es la actual.
+    """
+    loaded = store.get(cart_id) or _load_state(db, cart_id, user_id)
+
+    added_ids = {operation.product_id for operation in operations if operation.op == "add"}
+    prices: Dict[int, float] = {}
+    if added_ids:
+        prices = dict(db.execute(
+            select(Product.id, Product.price).where(Product.id.in_(added_ids), Product.is_active.is_(True))
+        ).all())
+        missing = sorted(added_ids - prices.keys())
+        if missing:
+            raise CartOperationError(f"Productos no encontrados: {missing}", status_code=404)
+
+    summary = {"added": 0, "updated": 0, "removed": 0}
+
+    def change(current: Optional[dict]) -> dict:
+        state = current if current is not None else json.loads(json.dumps(loaded))
+        if state["user_id"] != user_id:
+            raise CartOperationError("Carrito no encontrado o no está activo", status_code=404)
+        check_version(state["version"], expected_version)
+        return _apply(state, operations, prices, summary)
+
+    return store.update(cart_id, change), summary
+
+def cached(cart_ids: Iterable[int]) -> Dict[int, dict]:
+    """Carritos presentes en el almacén, para responder lecturas con los últimos cambios"""
+    if store is None:
+        return {}
+    return store.get_many(cart_ids)
+
+def render(db: Session, state: dict, user) -> dict:
+    """Carrito del almacén con la forma de schemas.Cart (productos, usuario y cupón desde la base)"""
+    product_ids = [line["product_id"] for line in state["items"]]
+    products = {
+        product.id: product
+        for product in db.execute(select(Product).where(Product.id.in_(product_ids))).scalars()
+    } if product_ids else {}
+    return {
+        "id": state["id"],
+        "user": user,
+        "items": [
+            {
+                "id": line["id"],
+                "cart_id": state["id"],
+                "quantity": line["quantity"],
+                "unit_price": line["unit_price"],
+                "product": products[line["product_id"]],
+            }
+            for line in state["items"]
+            if line["product_id"] in products
+        ],
+        "coupon": db.get(Coupon, state["coupon_id"]) if state["coupon_id"] else None,
+        "status": "active",
+        "version": state["version"],
+        **totals(state),
+    }
+
+def persist(db: Session, states: List[dict]) -> int:
+    """
+    Escribe los carritos del almacén en la base en una transacción: una
+    consulta para los carritos (bloqueados), una para sus items y las
+    altas, cambios y bajas necesarias. Ignora los que ya no están activos.
+    Devuelve los carritos escritos.
+    """
+    by_id = {state["id"]: state for state in states}
+    if not by_id:
+        return 0
+    # El cupón solo se aplica por la base: su porcentaje se toma de ahí
+    active = dict(db.execute(
+        select(Cart.id, Cart.discount_percent).where(Cart.id.in_(by_id), Cart.status == "active").with_for_update()
+    ).all())
+    if not active:
+        db.commit()
+        return 0
+
+    existing = {
+        (item.cart_id, item.product_id): item
+        for item in db.execute(select(CartItem).where(CartItem.cart_id.in_(active))).scalars()
+    }
+    kept = set()
+    for cart_id in active:
+        for line in by_id[cart_id]["items"]:
+            key = (cart_id, line["product_id"])
+            kept.add(key)
+            item = existing.get(key)
+            if item is None:
+                db.add(CartItem(cart_id=cart_id, product_id=line["product_id"],
+                                quantity=line["quantity"], unit_price=line["unit_price"]))
+            else:
+                item.quantity = line["quantity"]
+                item.unit_price = line["unit_price"]
+    for key, item in existing.items():
+        if key not in kept:
+            db.delete(item)
+    db.flush()
+    # La fila está bloqueada y solo cambia por la base después de hydrate: la versión del almacén es la
+    # vigente. UPDATE de Core (executemany) porque el del ORM exigiría la versión anterior en el WHERE.
+    carts = Cart.__table__
+    db.execute(
+        update(carts)
+        .where(carts.c.id == bindparam("cart_id"))
+        .values(
+            subtotal=bindparam("new_subtotal"),
+            discount_amount=bindparam("new_discount_amount"),
+            total=bindparam("new_total"),
+            version=bindparam("new_version"),
+        ),
+        [
+            {
+                "cart_id": cart_id,
+                "new_version": by_id[cart_id]["version"],
+                **{f"new_{key}": value for key, value in totals(by_id[cart_id], discount_percent).items()},
+            }
+            for cart_id, discount_percent in active.items()
+        ],
+    )
+    db.commit()
+    return len(active)
+
+def _remember_item_ids(db: Session, cart_ids: Iterable[int]):
+    # Los items agregados en el almacén reciben su id al escribirse
+    ids = {
+        (row.cart_id, row.product_id): row.id
+        for row in db.execute(
+            select(CartItem.id, CartItem.cart_id, CartItem.product_id).where(CartItem.cart_id.in_(list(cart_ids)))
+        )
+    }
+
+    for cart_id in {cart_id for cart_id, _ in ids}:
+        def change(current: Optional[dict], cart_id=cart_id) -> Optional[dict]:
+            if current is not None:
+                for line in current["items"]:
+                    line["id"] = ids.get((cart_id, line["product_id"]), line["id"])
+            return current
+
+        store.update(cart_id, change, dirty=False)
+
+def flush(db: Session, limit: int = CART_STORE_FLUSH_BATCH) -> int:
+    """Escribe hasta `limit` carritos pendientes; si falla, vuelven a quedar pendientes"""
+    cart_ids = store.pop_dirty(limit)
+    if not cart_ids:
+        return 0
+    return _write(db, cart_ids)
+
+def flush_all(db: Session, batch_size: int = CART_STORE_FLUSH_BATCH) -> int:
+    """
+    Escribe todos los pendientes por lotes. Termina cuando no quedan ids
+    pendientes, no cuando un lote no escribe nada: un lote puede tener solo
+    carritos que ya no están activos o que salieron del almacén.
+    """
+    written = 0
+    while True:
+        cart_ids = store.pop_dirty(batch_size)
+        if not cart_ids:
+            return written
+        written += _write(db, cart_ids)
+
+def _write(db: Session, cart_ids: List[int]) -> int:
+    try:
+        written = persist(db, list(store.get_many(cart_ids).values()))
+    except Exception:
+        db.rollback()
+        store.mark_dirty(cart_ids)
+        CART_STORE_FLUSHED_TOTAL.inc(len(cart_ids), result="error")
+        raise
+    CART_STORE_FLUSHED_TOTAL.inc(written, result="success")
+    _remember_item_ids(db, cart_ids)
+    return written
+
+def hydrate(db: Session, cart_id: int):
+    """
+    Escribe el carrito en la base de forma sincrónica y lo saca del
+    almacén. Se llama antes de leer o modificar el carrito por la base.
+    """
+    if store is None:
+        return
+    while True:
+        state = store.get(cart_id)
+        if state is None:
+            return
+        # Se escribe aunque no figure pendiente: el hilo puede haberlo tomado y no escrito todavía
+        persist(db, [state])
+        CART_STORE_FLUSHED_TOTAL.inc(result="hydrate")
+
+        # Se saca del almacén solo si sigue en la versión escrita; si otra petición
+        # lo cambió mientras tanto se vuelve a escribir en lugar de perder el cambio
+        def change(current: Optional[dict], version=state["version"]) -> Optional[dict]:
+            if current is not None and current["version"] != version:
+                return current
+            return None
+
+        if store.update(cart_id, change, dirty=False) is None:
+            return
+
+def discard(cart_id: int):
+    """Saca el carrito del almacén sin escribirlo (se va a vaciar o borrar)"""
+    if store is not None:
+        store.delete(cart_id)
+
+def refresh_cached(match: Callable[[dict], bool], change: Callable[[dict], dict]) -> int:
+    """
+    Aplica `change` a los carritos del almacén que cumplen `match` (cambio
+    de precio de un producto o de porcentaje de un cupón). Recorre todo el
+    almacén: solo para operaciones poco frecuentes.
+    """
+    if store is None:
+        return 0
+    changed = 0
+    for cart_id in store.cart_ids():
+        def apply(current: Optional[dict]) -> Optional[dict]:
+            if current is None or not match(current):
+                return current
+            state = change(current)
+            state["version"] += 1
+            return state
+
+        state = store.get(cart_id)
+        if state is not None and match(state):
+            store.update(cart_id, apply)
+            changed += 1
+    return changed
+
+def reprice_product(product_id: int, new_price: float) -> int:
+    def change(state: dict) -> dict:
+        for line in state["items"]:
+            if line["product_id"] == product_id:
+                line["unit_price"] = new_price
+        return state
+
+    return refresh_cached(lambda state: any(line["product_id"] == product_id for line in state["items"]), change)
+
+def update_coupon_discount(coupon_id: int, discount_percent: float) -> int:
+    def change(state: dict) -> dict:
+        state["discount_percent"] = discount_percent
+        return state
+
+    return refresh_cached(lambda state: state["coupon_id"] == coupon_id, change)
+
+class WriteBehindFlusher:
+    """Hilo que escribe los carritos pendientes cada `interval` segundos"""
+
+    def __init__(self, interval: float = CART_STORE_FLUSH_INTERVAL, batch_size: int = CART_STORE_FLUSH_BATCH):
+        self.interval = interval
+        self.batch_size = batch_size
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def flush_pending(self) -> int:
+        from app.database import SessionLocal
+
+        db = SessionLocal()
+        try:
+            return flush_all(db, self.batch_size)
+        except Exception as e:
+            print(f"Error escribiendo carritos pendientes: {e}")
+            return 0
+        finally:
+            db.close()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.flush_pending()
+
+    def start(self):
+        if store is None or self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="cart-store-flusher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Detiene el hilo y escribe lo que quede pendiente"""
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        self.flush_pending()
+
+flusher = WriteBehindFlusher()
@@ -0,0 +1,269 @@
+"""
+Mutaciones de carritos.
+
+apply_operations aplica una lista de altas, cambios de cantidad y bajas en
+una sola transacción: un control de propiedad, una consulta para los items
+actuales y una para todos los productos involucrados, sin importar cuántas
+operaciones haya. La fila del carrito no se bloquea: cada cambio incrementa
+su versión (version_id_col) y una edición concurrente falla con
+StaleDataError al confirmar (ver app.utils.concurrency).
+
+Totales desnormalizados: cada CartItem guarda el precio unitario del
+producto al agregarlo (unit_price) y cada Cart su subtotal, descuento y
+total. Las mutaciones ajustan el subtotal por diferencia, reprice_product
+propaga un cambio de precio a los carritos activos con dos UPDATE y leer el
+total de un carrito no necesita joins ni cargar productos.
+
+Bases creadas antes de estas columnas (create_all no altera tablas):
+
+    ALTER TABLE carts ADD COLUMN subtotal FLOAT DEFAULT 0;
+    ALTER TABLE carts ADD COLUMN discount_percent FLOAT DEFAULT 0;
+    ALTER TABLE carts ADD COLUMN total FLOAT DEFAULT 0;
+    ALTER TABLE cart_items ADD COLUMN unit_price FLOAT;
+
+    python -m app.services.carts recalculate
+"""
+import argparse
+from typing import Dict, List
+from sqlalchemy import func, select, update
+from sqlalchemy.orm import Session, joinedload, selectinload
+from sqlalchemy.orm.attributes import flag_modified
+from app.models.cart import Cart, CartItem
+from app.models.coupon import Coupon
+from app.models.product import Product
+from app.schemas.cart import CartOperation
+
+class CartOperationError(Exception):
+    """Carrito o producto inexistente (404) u operación inválida (400)"""
+
+    def __init__(self, detail: str, status_code: int = 400):
+        super().__init__(detail)
+        self.detail = detail
+        self.status_code = status_code
+
+def get_active_cart(db: Session, cart_id: int, user_id: int) -> Cart:
+    """Carrito activo del usuario (sin bloqueo: la versión detecta escrituras concurrentes)"""
+    cart = db.execute(
+        select(Cart)
+        .where(Cart.id == cart_id, Cart.user_id == user_id, Cart.status == "active")
+    ).scalar_one_or_none()
+    if cart is None:
+        raise CartOperationError("Carrito no encontrado o no está activo", status_code=404)
+    return cart
+
+def _discard(db: Session, item: CartItem):
+    # Un item agregado en esta misma tanda todavía no existe en la base
+    if item in db.new:
+        db.expunge(item)
+    else:
+        db.delete(item)
+
+def refresh_totals(cart: Cart):
+    """Descuento y total a partir del subtotal y el porcentaje del cupón"""
+    subtotal = cart.subtotal or 0.0
+    cart.discount_amount = subtotal * (cart.discount_percent or 0.0) / 100
+    cart.total = subtotal - cart.discount_amount
+
+def _set_quantity(cart: Cart, item: CartItem, quantity: int):
+    # El subtotal se ajusta por la diferencia, sin recorrer los demás items
+    cart.subtotal = (cart.subtotal or 0.0) + (quantity - (item.quantity or 0)) * item.unit_price
+    item.quantity = quantity
+
+def _snapshot_legacy_prices(db: Session, cart: Cart, items: Dict[int, CartItem]):
+    # Items anteriores a unit_price: se toma el precio actual y se rehace el subtotal una vez
+    pending = [product_id for product_id, item in items.items() if item.unit_price is None]
+    if not pending:
+        return
+    prices = dict(db.execute(select(Product.id, Product.price).where(Product.id.in_(pending))).all())
+    for product_id in pending:
+        items[product_id].unit_price = prices.get(product_id) or 0.0
+    cart.subtotal = sum(item.quantity * item.unit_price for item in items.values())
+
+def apply_operations(db: Session, cart: Cart, operations: List[CartOperation]) -> Dict[str, int]:
+    """
+    Aplica las operaciones en orden sobre los items del carrito. No confirma
+    la transacción. `remove` de un producto que no está en el carrito se
+    ignora, así una ráfaga repetida desde el frontend no falla. Deja
+    actualizados el subtotal, el descuento y el total del carrito.
+    """
+    items: Dict[int, CartItem] = {
+        item.product_id: item
+        for item in db.execute(select(CartItem).where(CartItem.cart_id == cart.id)).scalars()
+    }
+    _snapshot_legacy_prices(db, cart, items)
+
+    added_ids = {operation.product_id for operation in operations if operation.op == "add"}
+    prices: Dict[int, float] = {}
+    if added_ids:
+        prices = dict(db.execute(
+            select(Product.id, Product.price).where(Product.id.in_(added_ids), Product.is_active.is_(True))
+        ).all())
+        missing = sorted(added_ids - prices.keys())
+        if missing:
+            raise CartOperationError(f"Productos no encontrados: {missing}", status_code=404)
+
+    summary = {"added": 0, "updated": 0, "removed": 0}
+    for operation in operations:
+        item = items.get(operation.product_id)
+        if operation.op == "add":
+            if operation.quantity <= 0:
+                raise CartOperationError("La cantidad a agregar debe ser mayor que 0")
+            if item is None:
+                item = CartItem(
+                    cart_id=cart.id,
+                    product_id=operation.product_id,
+                    quantity=0,
+                    unit_price=prices[operation.product_id] or 0.0,
+                )
+                db.add(item)
+                items[operation.product_id] = item
+            _set_quantity(cart, item, item.quantity + operation.quantity)
+            summary["added"] += 1
+        elif operation.op == "update":
+            if item is None:
+                raise CartOperationError(f"El producto {operation.product_id} no está en el carrito", status_code=404)
+            _set_quantity(cart, item, operation.quantity)
+            if operation.quantity == 0:
+                _discard(db, item)
+                del items[operation.product_id]
+                summary["removed"] += 1
+            else:
+                summary["updated"] += 1
+        elif item is not None:
+            _set_quantity(cart, item, 0)
+            _discard(db, item)
+            del items[operation.product_id]
+            summary["removed"] += 1
+    refresh_totals(cart)
+    if any(summary.values()):
+        # El UPDATE del carrito incrementa su versión aunque los totales no cambien
+        flag_modified(cart, "subtotal")
+    return summary
+
+def clear_items(db: Session, cart: Cart):
+    """Vacía el carrito y deja sus totales en cero"""
+    db.query(CartItem).filter(CartItem.cart_id == cart.id).delete(synchronize_session=False)
+    cart.subtotal = 0.0
+    refresh_totals(cart)
+
+def set_discount(cart: Cart, coupon_id: int, discount_percent: float):
+    """Aplica el cupón al carrito; no recorre los items"""
+    cart.coupon_id = coupon_id
+    cart.discount_percent = discount_percent
+    refresh_totals(cart)
+
+def _update_cart_totals(db: Session, *criteria):
+    # En UPDATE el lado derecho ve los valores previos: el subtotal se ajusta en una sentencia aparte
+    discount = Cart.subtotal * Cart.discount_percent / 100
+    db.execute(
+        update(Cart)
+        .where(*criteria)
+        .values(discount_amount=discount, total=Cart.subtotal - discount)
+        .execution_options(synchronize_session=False)
+    )
+
+def reprice_product(db: Session, product_id: int, new_price: float) -> int:
+    """
+    Propaga un cambio de precio a los carritos activos que tienen el producto:
+    ajusta su subtotal por (precio nuevo - precio guardado) * cantidad y
+    actualiza el precio guardado de sus items. Los carritos cerrados
+    conservan el precio con el que se compró. No confirma la transacción;
+    devuelve la cantidad de carritos afectados.
+    """
+    affected = (
+        Cart.status == "active",
+        Cart.id.in_(select(CartItem.cart_id).where(CartItem.product_id == product_id, CartItem.unit_price.is_not(None))),
+    )
+    delta = (
+        select(func.coalesce(func.sum((new_price - CartItem.unit_price) * CartItem.quantity), 0.0))
+        .where(CartItem.cart_id == Cart.id, CartItem.product_id == product_id)
+        .scalar_subquery()
+    )
+    result = db.execute(
+        update(Cart)
+        .where(*affected)
+        .values(subtotal=func.coalesce(Cart.subtotal, 0.0) + delta, version=Cart.version + 1)
+        .execution_options(synchronize_session=False)
+    )
+    _update_cart_totals(db, *affected)
+    db.execute(
+        update(CartItem)
+        .where(
+            CartItem.product_id == product_id,
+            CartItem.unit_price.is_not(None),
+            CartItem.cart_id.in_(select(Cart.id).where(Cart.status == "active")),
+        )
+        .values(unit_price=new_price)
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount
+
+def update_coupon_discount(db: Session, coupon_id: int, discount_percent: float) -> int:
+    """Nuevo porcentaje de un cupón en los carritos activos que lo tienen aplicado"""
+    criteria = (Cart.coupon_id == coupon_id, Cart.status == "active")
+    result = db.execute(
+        update(Cart)
+        .where(*criteria)
+        .values(discount_percent=discount_percent, version=Cart.version + 1)
+        .execution_options(synchronize_session=False)
+    )
+    _update_cart_totals(db, *criteria)
+    return result.rowcount
+
+def recalculate_totals(db: Session) -> int:
+    """
+    Rehace precios guardados y totales de todos los carritos desde los items.
+    Para bases anteriores a las columnas de totales o para verificar que los
+    ajustes incrementales no se desviaron. Confirma la transacción.
+    """
+    db.execute(
+        update(CartItem)
+        .where(CartItem.unit_price.is_(None))
+        .values(unit_price=select(Product.price).where(Product.id == CartItem.product_id).scalar_subquery())
+        .execution_options(synchronize_session=False)
+    )
+    result = db.execute(
+        update(Cart)
+        .values(
+            subtotal=select(func.coalesce(func.sum(CartItem.quantity * CartItem.unit_price), 0.0))
+            .where(CartItem.cart_id == Cart.id)
+            .scalar_subquery(),
+            discount_percent=func.coalesce(
+                select(Coupon.discount_percent).where(Coupon.id == Cart.coupon_id).scalar_subquery(), 0.0
+            ),
+            version=Cart.version + 1,
+        )
+        .execution_options(synchronize_session=False)
+    )
+    _update_cart_totals(db)
+    db.commit()
+    return result.rowcount
+
+def load_cart(db: Session, cart_id: int) -> Cart:
+    """Carrito con usuario, items y productos para la respuesta"""
+    return db.execute(
+        select(Cart)
+        .where(Cart.id == cart_id)
+        .options(
+            joinedload(Cart.user),
+            selectinload(Cart.items).selectinload(CartItem.product),
+        )
+        .execution_options(populate_existing=True)
+    ).scalar_one()
+
+def main():
+    from app.database import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Mantenimiento de carritos")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("recalculate", help="Rehace subtotal, descuento y total de todos los carritos")
+    parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        print(f"Listo: {recalculate_totals(db)} carritos recalculados")
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+"""
+Creación de una orden a partir de un carrito activo.
+
+Dos caminos con el mismo resultado (orden pendiente con los precios
+actuales, stock descontado y carrito en estado processed):
+
+- orm (por defecto): carga el carrito con sus productos, valida el stock en
+  Python, inserta la orden y cada item y descuenta el stock objeto por
+  objeto. Carrito y productos son versionados (ver app.utils.concurrency):
+  quien lo llame debe reintentar con with_retry.
+- sql (CHECKOUT_MODE=sql, solo PostgreSQL): una única sentencia con CTEs
+  que bloquea el carrito y los productos (en orden de id), valida, descuenta el stock,
+  inserta la orden y sus items y cierra el carrito. Una sola ida y vuelta a
+  la base y los bloqueos duran lo que dura la sentencia. Si la validación
+  falla no modifica nada. Con otro motor se usa el camino orm.
+
+Comparación para carritos de 1, 10 y 100 productos:
+
+    python -m benchmarks.checkout
+"""
+import os
+from datetime import datetime
+from dotenv import load_dotenv
+from sqlalchemy import text
+from sqlalchemy.orm import Session, joinedload
+from app.models.cart import Cart, CartItem
+from app.models.orders import Order, OrderItem
+from app.models.product import Product
+from app.utils.order import calculate_order_total, generate_order_number
+
+load_dotenv()
+
+CHECKOUT_MODE = os.getenv("CHECKOUT_MODE", "orm").lower()
+
+class CheckoutError(Exception):
+    """Carrito inexistente (404), vacío o sin stock suficiente (400)"""
+
+    def __init__(self, detail: str, status_code: int = 400):
+        super().__init__(detail)
+        self.detail = detail
+        self.status_code = status_code
+
+# Validación, descuento de stock, orden, items y cierre del carrito en una sentencia.
+# Las CTE que modifican datos se ejecutan aunque la consulta final no las lea. El SQL
+# no pasa por el onupdate del ORM: updated_at se fija a mano (ETags del catálogo, reaper).
+CHECKOUT_SQL = text("""
+WITH cart AS (
+    SELECT id FROM carts
+    WHERE id = :cart_id AND user_id = :user_id AND status = 'active'
+    FOR UPDATE
+),
+locked_products AS (
+    -- Bloqueo en orden de id: dos compras con productos en común no se bloquean mutuamente (deadlock).
+    -- FOR UPDATE devuelve el stock vigente aunque otra compra lo haya cambiado recién.
+    SELECT p.id, p.price, p.stock
+    FROM products p
+    WHERE p.id IN (SELECT ci.product_id FROM cart_items ci JOIN cart c ON c.id = ci.cart_id)
+    ORDER BY p.id
+    FOR UPDATE
+),
+lines AS (
+    SELECT ci.product_id, ci.quantity, p.price, p.stock
+    FROM cart_items ci
+    JOIN cart c ON c.id = ci.cart_id
+    JOIN locked_products p ON p.id = ci.product_id
+),
+needed AS (
+    SELECT product_id, SUM(quantity) AS quantity, MIN(stock) AS stock
+    FROM lines
+    GROUP BY product_id
+),
+verdict AS (
+    SELECT
+        EXISTS (SELECT 1 FROM cart) AS cart_found,
+        (SELECT COUNT(*) FROM lines) AS item_count,
+        (SELECT MIN(product_id) FROM needed WHERE quantity > stock) AS short_product_id
+),
+ok AS (
+    SELECT 1 FROM verdict WHERE cart_found AND item_count > 0 AND short_product_id IS NULL
+),
+stock_update AS (
+    UPDATE products p
+    SET stock = p.stock - n.quantity, version = p.version + 1, updated_at = :now
+    FROM needed n
+    WHERE p.id = n.product_id AND EXISTS (SELECT 1 FROM ok)
+    RETURNING p.id
+),
+new_order AS (
+    INSERT INTO orders (order_number, user_id, status, total_amount, created_at)
+    SELECT :order_number, :user_id, 'pending', (SELECT COALESCE(SUM(quantity * price), 0) FROM lines), :now
+    FROM ok
+    RETURNING id
+),
+new_items AS (
+    INSERT INTO order_items (order_id, product_id, quantity, unit_price)
+    SELECT o.id, l.product_id, l.quantity, l.price
+    FROM new_order o CROSS JOIN lines l
+    RETURNING id
+),
+closed_cart AS (
+    UPDATE carts SET status = 'processed', version = version + 1, updated_at = :now
+    WHERE id = :cart_id AND EXISTS (SELECT 1 FROM ok)
+    RETURNING id
+)
+SELECT v.cart_found, v.item_count, v.short_product_id, (SELECT id FROM new_order) AS order_id
+FROM verdict v
+""")
+
+def sql_checkout_available(db: Session) -> bool:
+    return db.get_bind().dialect.name == "postgresql"
+
+def _insufficient_stock(db: Session, product_id: int) -> CheckoutError:
+    name = db.query(Product.name).filter(Product.id == product_id).scalar()
+    return CheckoutError(f"Stock insuficiente para el producto: {name}")
+
+def place_order_orm(db: Session, cart_id: int, user_id: int) -> int:
+    """Camino ORM; no confirma la transacción. Devuelve el id de la orden"""
+    cart = db.query(Cart).filter(
+        Cart.id == cart_id,
+        Cart.user_id == user_id,
+        Cart.status == "active"
+    ).options(
+        joinedload(Cart.items).joinedload(CartItem.product)
+    ).first()
+
+    if not cart:
+        raise CheckoutError("Carrito no encontrado o no está activo", status_code=404)
+    if not cart.items:
+        raise CheckoutError("El carrito está vacío")
+
+    for item in cart.items:
+        if item.quantity > item.product.stock:
+            raise _insufficient_stock(db, item.product_id)
+
+    new_order = Order(
+        order_number=generate_order_number(),
+        user_id=user_id,
+        status="pending",
+        total_amount=calculate_order_total(cart.items),
+        created_at=datetime.utcnow()
+    )
+    db.add(new_order)
+    db.flush()  # Para obtener el ID de la orden
+
+    for cart_item in cart.items:
+        db.add(OrderItem(
+            order_id=new_order.id,
+            product_id=cart_item.product_id,
+            quantity=cart_item.quantity,
+            unit_price=cart_item.product.price
+        ))
+        cart_item.product.stock -= cart_item.quantity
+
+    cart.status = "processed"
+    return new_order.id
+
+def place_order_sql(db: Session, cart_id: int, user_id: int) -> int:
+    """Camino de una sola sentencia (PostgreSQL); no confirma la transacción"""
+    row = db.execute(CHECKOUT_SQL, {
+        "cart_id": cart_id,
+        "user_id": user_id,
+        "order_number": generate_order_number(),
+        "now": datetime.utcnow(),
+    }).one()
+    if not row.cart_found:
+        raise CheckoutError("Carrito no encontrado o no está activo", status_code=404)
+    if not row.item_count:
+        raise CheckoutError("El carrito está vacío")
+    if row.short_product_id is not None:
+        raise _insufficient_stock(db, row.short_product_id)
+    # La sentencia cambió filas que la sesión pudo haber cargado antes
+    db.expire_all()
+    return row.order_id
+
+def place_order(db: Session, cart_id: int, user_id: int) -> int:
+    """Crea la orden con el camino configurado en CHECKOUT_MODE"""
+    if CHECKOUT_MODE == "sql" and sql_checkout_available(db):
+        return place_order_sql(db, cart_id, user_id)
+    return place_order_orm(db, cart_id, user_id)
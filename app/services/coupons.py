@@ -0,0 +1,130 @@
+"""
+Validación y canje de cupones.
+
+- Caché en memoria por código (COUPON_CACHE_TTL segundos, incluye los
+  códigos inexistentes) para que validar o aplicar un cupón muy usado no
+  consulte la base en cada intento. Se invalida al crear o editar un cupón
+  y cuando un canje falla porque el cupón ya no admite usos.
+- Canje atómico: un único UPDATE ... SET current_uses = current_uses + 1
+  WHERE current_uses < max_uses, sin leer el contador antes. Dos checkouts
+  simultáneos no pueden superar max_uses.
+
+Prueba de carga (1000 canjes concurrentes de un mismo código):
+
+    python -m benchmarks.coupon_redemption --requests 1000 --max-uses 100
+"""
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+from dotenv import load_dotenv
+from sqlalchemy import case, update
+from sqlalchemy.orm import Session
+from app.models.coupon import Coupon
+from app.schemas.coupon import CouponResponse
+
+load_dotenv()
+
+COUPON_CACHE_TTL = float(os.getenv("COUPON_CACHE_TTL", "30"))
+
+class CouponError(Exception):
+    """Cupón inexistente (404) o no aplicable (400)"""
+
+    def __init__(self, detail: str, status_code: int = 400):
+        super().__init__(detail)
+        self.detail = detail
+        self.status_code = status_code
+
+class CouponCache:
+    """Cupones por código con vencimiento; guarda también los códigos que no existen"""
+
+    def __init__(self, ttl: float = COUPON_CACHE_TTL):
+        self.ttl = ttl
+        self._entries: Dict[str, Tuple[float, Optional[CouponResponse]]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, code: str) -> Tuple[bool, Optional[CouponResponse]]:
+        with self._lock:
+            entry = self._entries.get(code)
+        if entry is None or entry[0] < time.monotonic():
+            return False, None
+        return True, entry[1]
+
+    def put(self, code: str, coupon: Optional[CouponResponse]):
+        with self._lock:
+            self._entries[code] = (time.monotonic() + self.ttl, coupon)
+
+    def invalidate(self, *codes: str):
+        with self._lock:
+            for code in codes:
+                self._entries.pop(code, None)
+
+    def invalidate_id(self, coupon_id: int):
+        with self._lock:
+            for code, (_, coupon) in list(self._entries.items()):
+                if coupon is not None and coupon.id == coupon_id:
+                    del self._entries[code]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+coupon_cache = CouponCache()
+
+def get_coupon(db: Session, code: str) -> Optional[CouponResponse]:
+    """Cupón por código, desde la caché si está vigente"""
+    found, coupon = coupon_cache.get(code)
+    if found:
+        return coupon
+    db_coupon = db.query(Coupon).filter(Coupon.code == code).first()
+    coupon = CouponResponse.model_validate(db_coupon) if db_coupon else None
+    coupon_cache.put(code, coupon)
+    return coupon
+
+def validate_coupon(db: Session, code: str, now: Optional[datetime] = None) -> CouponResponse:
+    """
+    Comprueba que el cupón exista, esté activo, tenga usos disponibles y esté
+    dentro de su vigencia. El contador de usos de la caché puede estar
+    atrasado: el límite real se aplica al canjear (redeem_coupon).
+    """
+    coupon = get_coupon(db, code)
+    if coupon is None:
+        raise CouponError("Cupón no encontrado", status_code=404)
+    if not coupon.is_active:
+        raise CouponError("Cupón no está activo")
+    if coupon.current_uses >= coupon.max_uses:
+        raise CouponError("Cupón ha alcanzado el máximo de usos")
+    now = now or datetime.utcnow()
+    if now < coupon.valid_from or now > coupon.valid_until:
+        raise CouponError("Cupón no es válido en este momento")
+    return coupon
+
+def redeem_coupon(db: Session, coupon_id: int, now: Optional[datetime] = None) -> bool:
+    """
+    Suma un uso con un UPDATE condicional y devuelve False si el cupón ya no
+    admite usos (agotado, inactivo o fuera de vigencia). No confirma la
+    transacción: se llama dentro del checkout.
+    """
+    now = now or datetime.utcnow()
+    result = db.execute(
+        update(Coupon)
+        .where(
+            Coupon.id == coupon_id,
+            Coupon.is_active.is_(True),
+            Coupon.current_uses < Coupon.max_uses,
+            Coupon.valid_from <= now,
+            Coupon.valid_until >= now,
+        )
+        .values(
+            current_uses=Coupon.current_uses + 1,
+            # El lado derecho usa los valores previos de la fila
+            is_active=case((Coupon.current_uses + 1 >= Coupon.max_uses, False), else_=Coupon.is_active),
+        )
+        .execution_options(synchronize_session=False)
+    )
+    redeemed = result.rowcount == 1
+    if not redeemed:
+        # La caché decía que era válido y ya no lo es: la próxima validación va a la base
+        coupon_cache.invalidate_id(coupon_id)
+    return redeemed
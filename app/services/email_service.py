@@ -1,6 +1,7 @@
 from typing import Optional, Dict, Any
 from app.schemas.email import EmailTemplate, UserEmailContext
-from app.utils.ai import client
+from app.utils.ai import client, groq_breaker
+from app.utils.tracing import traced
 
 DEFAULT_STYLES = {
     "colors": {
@@ -16,6 +17,7 @@ DEFAULT_STYLES = {
     }
 }
 
+@traced("groq.completion", "client")
 def generate_email_content(
     template: EmailTemplate,
     user_context: Optional[UserEmailContext] = None,
@@ -58,7 +60,8 @@ def generate_email_content(
     """
     
     try:
-        response = client.chat.completions.create(
+        response = groq_breaker.call(
+            client.chat.completions.create,
             messages=[
                 {"role": "system", "content": system_prompt},
                 {"role": "user", "content": "Generate the HTML email template."}
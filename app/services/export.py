@@ -0,0 +1,234 @@
+"""
+Exportación columnar de ventas y órdenes para análisis offline.
+
+Recorre sales, sale_items, orders y order_items (tablas calientes y, si se
+pide, las frías *_archive) con un cursor del lado del servidor y escribe
+por lotes, así la memoria usada no depende del tamaño del rango. Formatos:
+Parquet o Arrow IPC si pyarrow está instalado (pip install pyarrow) y CSV
+en cualquier caso. Los archivos se parten cada `rows_per_file` filas.
+
+    python -m app.services.export --format parquet --start 2025-01-01 --end 2025-03-31 --out exports/
+"""
+import argparse
+import csv
+import io
+import os
+from datetime import date, datetime, time, timedelta
+from typing import Iterator, List, Optional
+from dotenv import load_dotenv
+from sqlalchemy import Boolean, Date, DateTime, Float, Integer, select, union_all
+from sqlalchemy.orm import Session
+from app.models.orders import Order, OrderItem
+from app.models.sales import Sale, SaleItem
+from app.models.archive import orders_archive, order_items_archive, sales_archive, sale_items_archive
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:  # pyarrow es opcional: sin él solo se exporta CSV
+    pyarrow = None
+
+load_dotenv()
+
+EXPORT_DIR = os.getenv("EXPORT_DIR", "exports")
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "5000"))
+EXPORT_ROWS_PER_FILE = int(os.getenv("EXPORT_ROWS_PER_FILE", "1000000"))
+
+FORMATS = {"parquet": ".parquet", "arrow": ".arrow", "csv": ".csv"}
+
+# tabla -> (tabla caliente, tabla fría, tabla padre con created_at, columna que apunta al padre)
+EXPORT_TABLES = {
+    "sales": (Sale.__table__, sales_archive, None, None),
+    "sale_items": (SaleItem.__table__, sale_items_archive, "sales", "sale_id"),
+    "orders": (Order.__table__, orders_archive, None, None),
+    "order_items": (OrderItem.__table__, order_items_archive, "orders", "order_id"),
+}
+
+class ExportFormatError(Exception):
+    """Formato no disponible (por ejemplo Parquet sin pyarrow)"""
+
+def available_formats() -> List[str]:
+    return list(FORMATS) if pyarrow is not None else ["csv"]
+
+def _date_filter(table, start: Optional[date], end: Optional[date]):
+    conditions = []
+    if start is not None:
+        conditions.append(table.c.created_at >= datetime.combine(start, time.min))
+    if end is not None:
+        conditions.append(table.c.created_at < datetime.combine(end + timedelta(days=1), time.min))
+    return conditions
+
+def build_query(name: str, start: Optional[date] = None, end: Optional[date] = None, include_archive: bool = True):
+    """SELECT de la tabla (y su tabla fría) con las columnas de la tabla caliente y el filtro de fechas"""
+    hot, cold, parent_name, parent_key = EXPORT_TABLES[name]
+    columns = [column.name for column in hot.columns]
+
+    def branch(table, parent):
+        query = select(*[table.c[column] for column in columns])
+        if parent_name is None:
+            return query.where(*_date_filter(table, start, end))
+        conditions = _date_filter(parent, start, end)
+        if conditions:
+            query = query.where(table.c[parent_key].in_(select(parent.c.id).where(*conditions)))
+        return query
+
+    parent_hot, parent_cold, _, _ = EXPORT_TABLES.get(parent_name, (None, None, None, None))
+    query = branch(hot, parent_hot)
+    if include_archive:
+        query = union_all(query, branch(cold, parent_cold))
+    return query, hot
+
+def iter_batches(db: Session, query, batch_size: int = EXPORT_BATCH_SIZE) -> Iterator[List[tuple]]:
+    """Filas en lotes de `batch_size` con cursor del lado del servidor (stream_results)"""
+    result = db.connection().execution_options(stream_results=True, max_row_buffer=batch_size).execute(query)
+    for partition in result.partitions(batch_size):
+        yield [tuple(row) for row in partition]
+
+def _arrow_type(column_type):
+    if isinstance(column_type, Boolean):
+        return pyarrow.bool_()
+    if isinstance(column_type, Integer):
+        return pyarrow.int64()
+    if isinstance(column_type, Float):
+        return pyarrow.float64()
+    if isinstance(column_type, DateTime):
+        return pyarrow.timestamp("us")
+    if isinstance(column_type, Date):
+        return pyarrow.date32()
+    return pyarrow.string()
+
+class _CsvWriter:
+    def __init__(self, path: str, table):
+        self.file = open(path, "w", newline="", encoding="utf-8")
+        self.writer = csv.writer(self.file)
+        self.writer.writerow([column.name for column in table.columns])
+
+    def write(self, rows: List[tuple]):
+        self.writer.writerows(rows)
+
+    def close(self):
+        self.file.close()
+
+class _ArrowWriter:
+    def __init__(self, path: str, table, fmt: str):
+        self.schema = pyarrow.schema([(column.name, _arrow_type(column.type)) for column in table.columns])
+        if fmt == "parquet":
+            self.writer = pyarrow.parquet.ParquetWriter(path, self.schema)
+        else:
+            self.writer = pyarrow.ipc.new_file(path, self.schema)
+
+    def write(self, rows: List[tuple]):
+        # Transponer el lote a columnas: cada lote es un row group / record batch
+        columns = list(zip(*rows))
+        arrays = [pyarrow.array(values, type=field.type) for values, field in zip(columns, self.schema)]
+        self.writer.write_batch(pyarrow.RecordBatch.from_arrays(arrays, schema=self.schema))
+
+    def close(self):
+        self.writer.close()
+
+def open_writer(path: str, table, fmt: str):
+    if fmt not in FORMATS:
+        raise ExportFormatError(f"Formato no soportado: {fmt}")
+    if fmt == "csv":
+        return _CsvWriter(path, table)
+    if pyarrow is None:
+        raise ExportFormatError(f"El formato {fmt} requiere pyarrow (pip install pyarrow)")
+    return _ArrowWriter(path, table, fmt)
+
+def iter_csv(db: Session, name: str, start: Optional[date] = None, end: Optional[date] = None,
+             include_archive: bool = True, batch_size: int = EXPORT_BATCH_SIZE) -> Iterator[str]:
+    """CSV de una tabla como fragmentos de texto, uno por lote (para respuestas en streaming)"""
+    if name not in EXPORT_TABLES:
+        raise ValueError(f"Tabla no exportable: {name}")
+    query, table = build_query(name, start, end, include_archive)
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow([column.name for column in table.columns])
+    for batch in iter_batches(db, query, batch_size):
+        writer.writerows(batch)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+def export_table(
+    db: Session,
+    name: str,
+    out_dir: str = EXPORT_DIR,
+    fmt: str = "parquet",
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    include_archive: bool = True,
+    batch_size: int = EXPORT_BATCH_SIZE,
+    rows_per_file: int = EXPORT_ROWS_PER_FILE
+) -> List[dict]:
+    """
+    Exporta una tabla a `out_dir` en archivos <tabla>-00001<ext>, abriendo
+    uno nuevo cada `rows_per_file` filas. Devuelve [{"path", "rows"}].
+    """
+    if name not in EXPORT_TABLES:
+        raise ValueError(f"Tabla no exportable: {name}")
+    if fmt not in FORMATS:
+        raise ExportFormatError(f"Formato no soportado: {fmt}")
+    if fmt != "csv" and pyarrow is None:
+        raise ExportFormatError(f"El formato {fmt} requiere pyarrow (pip install pyarrow)")
+
+    os.makedirs(out_dir, exist_ok=True)
+    query, table = build_query(name, start, end, include_archive)
+    files: List[dict] = []
+    writer = None
+
+    def rotate():
+        nonlocal writer
+        if writer is not None:
+            writer.close()
+        path = os.path.join(out_dir, f"{name}-{len(files) + 1:05d}{FORMATS[fmt]}")
+        writer = open_writer(path, table, fmt)
+        files.append({"path": path, "rows": 0})
+
+    try:
+        rotate()
+        for batch in iter_batches(db, query, batch_size):
+            while batch:
+                room = rows_per_file - files[-1]["rows"]
+                if room <= 0:
+                    rotate()
+                    continue
+                chunk, batch = batch[:room], batch[room:]
+                writer.write(chunk)
+                files[-1]["rows"] += len(chunk)
+    finally:
+        if writer is not None:
+            writer.close()
+    return files
+
+def main():
+    from app.database import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Exporta ventas y órdenes a Parquet, Arrow IPC o CSV")
+    parser.add_argument("--table", action="append", choices=sorted(EXPORT_TABLES), help="Tabla a exportar (repetible, por defecto todas)")
+    parser.add_argument("--format", default="parquet" if pyarrow is not None else "csv", choices=sorted(FORMATS))
+    parser.add_argument("--start", type=date.fromisoformat, default=None)
+    parser.add_argument("--end", type=date.fromisoformat, default=None)
+    parser.add_argument("--out", default=EXPORT_DIR)
+    parser.add_argument("--batch-size", type=int, default=EXPORT_BATCH_SIZE)
+    parser.add_argument("--rows-per-file", type=int, default=EXPORT_ROWS_PER_FILE)
+    parser.add_argument("--hot-only", action="store_true", help="No incluir las tablas frías (*_archive)")
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        for name in args.table or list(EXPORT_TABLES):
+            files = export_table(
+                db, name, args.out, args.format, args.start, args.end,
+                not args.hot_only, args.batch_size, args.rows_per_file
+            )
+            for exported in files:
+                print(f"{exported['path']}: {exported['rows']} filas")
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    main()
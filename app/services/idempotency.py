@@ -0,0 +1,232 @@
+"""
+Idempotency-Key para rutas que crean recursos (orden, preferencia de pago).
+
+El cliente manda `Idempotency-Key: <uuid>` y repite la misma clave en los
+reintentos. La primera petición reserva la clave (fila in_progress en
+idempotency_keys, confirmada en su propia transacción para que la vean las
+demás) y, si termina bien, guarda el código y el cuerpo de la respuesta:
+
+- reintento después de terminar: se responde lo guardado, sin rehacer el
+  trabajo, con `Idempotent-Replayed: true`.
+- reintento mientras la original sigue en curso (en este u otro proceso):
+  espera a que termine y responde lo mismo; pasados
+  IDEMPOTENCY_WAIT_TIMEOUT segundos, 409.
+- misma clave con otra petición (otra ruta, query o cuerpo): 422.
+- si la original falla se libera la clave y el reintento hace el trabajo.
+  Una reserva de un proceso caído vence a los IDEMPOTENCY_LOCK_TIMEOUT
+  segundos.
+
+Las claves son por usuario y duran IDEMPOTENCY_TTL_HOURS. Limpieza:
+
+    python -m app.services.idempotency purge
+"""
+import argparse
+import asyncio
+import hashlib
+import os
+import time
+from datetime import datetime, timedelta
+from typing import Optional
+from dotenv import load_dotenv
+from fastapi import Request
+from fastapi.responses import Response
+from sqlalchemy import delete, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from app.database import SessionLocal
+from app.models.idempotency import IdempotencyKey
+from app.utils.metrics import IDEMPOTENCY_TOTAL
+
+load_dotenv()
+
+IDEMPOTENCY_TTL_HOURS = int(os.getenv("IDEMPOTENCY_TTL_HOURS", "24"))
+IDEMPOTENCY_LOCK_TIMEOUT = float(os.getenv("IDEMPOTENCY_LOCK_TIMEOUT", "60"))
+IDEMPOTENCY_WAIT_TIMEOUT = float(os.getenv("IDEMPOTENCY_WAIT_TIMEOUT", "30"))
+IDEMPOTENCY_POLL_INTERVAL = 0.1
+IDEMPOTENCY_COMPLETE_ATTEMPTS = 3
+
+REPLAY_HEADER = "Idempotent-Replayed"
+MAX_KEY_LENGTH = 255
+
+class IdempotencyError(Exception):
+    """Clave inválida (400), en curso (409) o reutilizada con otra petición (422)"""
+
+    def __init__(self, detail: str, status_code: int = 409):
+        super().__init__(detail)
+        self.detail = detail
+        self.status_code = status_code
+
+async def fingerprint(request: Request) -> str:
+    """sha256 de método, ruta, query ordenada y cuerpo"""
+    query = "&".join(f"{name}={value}" for name, value in sorted(request.query_params.multi_items()))
+    digest = hashlib.sha256(f"{request.method} {request.url.path}?{query}\n".encode())
+    digest.update(await request.body())
+    return digest.hexdigest()
+
+def _replay(record: IdempotencyKey) -> Response:
+    return Response(
+        content=record.response_body or "",
+        status_code=record.response_status,
+        headers={REPLAY_HEADER: "true"},
+        media_type="application/json"
+    )
+
+def _try_claim(db: Session, user_id: int, key: str, request_fingerprint: str):
+    """
+    Reserva la clave. Devuelve None si quedó reservada para esta petición,
+    la respuesta guardada si ya terminó o "wait" si sigue en curso.
+    """
+    while True:
+        now = datetime.utcnow()
+        db.add(IdempotencyKey(
+            user_id=user_id, key=key, fingerprint=request_fingerprint,
+            status="in_progress", created_at=now, locked_at=now
+        ))
+        try:
+            db.commit()
+            return None
+        except IntegrityError:
+            db.rollback()
+
+        record = db.execute(
+            select(IdempotencyKey).where(IdempotencyKey.user_id == user_id, IdempotencyKey.key == key)
+        ).scalar_one_or_none()
+        if record is None:
+            continue  # La original falló y liberó la clave en el medio
+        if record.created_at < now - timedelta(hours=IDEMPOTENCY_TTL_HOURS):
+            db.delete(record)
+            db.commit()
+            continue
+        if record.fingerprint != request_fingerprint:
+            raise IdempotencyError(
+                "La Idempotency-Key ya se usó con otra petición", status_code=422
+            )
+        if record.status == "completed":
+            return _replay(record)
+        if record.locked_at < now - timedelta(seconds=IDEMPOTENCY_LOCK_TIMEOUT):
+            # El proceso que la reservó no terminó: la toma esta petición
+            taken = db.execute(
+                update(IdempotencyKey)
+                .where(
+                    IdempotencyKey.id == record.id,
+                    IdempotencyKey.status == "in_progress",
+                    IdempotencyKey.locked_at == record.locked_at,
+                )
+                .values(locked_at=now)
+            ).rowcount
+            db.commit()
+            if taken:
+                return None
+        db.rollback()
+        return "wait"
+
+async def claim(scope: str, user_id: int, key: Optional[str], request: Request) -> Optional[Response]:
+    """
+    Devuelve None si la petición debe hacer el trabajo (sin clave o con la
+    clave reservada) o la respuesta a repetir. Espera a la original si está
+    en curso. Lanza IdempotencyError.
+    """
+    if key is None:
+        return None
+    if not key or len(key) > MAX_KEY_LENGTH:
+        raise IdempotencyError(f"Idempotency-Key debe tener entre 1 y {MAX_KEY_LENGTH} caracteres", status_code=400)
+
+    request_fingerprint = await fingerprint(request)
+    deadline = time.monotonic() + IDEMPOTENCY_WAIT_TIMEOUT
+    waited = False
+    db = SessionLocal()
+    try:
+        while True:
+            try:
+                result = _try_claim(db, user_id, key, request_fingerprint)
+            except IdempotencyError:
+                IDEMPOTENCY_TOTAL.inc(scope=scope, result="mismatch")
+                raise
+            if result is None:
+                IDEMPOTENCY_TOTAL.inc(scope=scope, result="claimed")
+                return None
+            if result != "wait":
+                IDEMPOTENCY_TOTAL.inc(scope=scope, result="waited" if waited else "replayed")
+                return result
+            if time.monotonic() >= deadline:
+                IDEMPOTENCY_TOTAL.inc(scope=scope, result="in_progress")
+                raise IdempotencyError("La petición original con esta Idempotency-Key sigue en curso")
+            waited = True
+            await asyncio.sleep(IDEMPOTENCY_POLL_INTERVAL)
+    finally:
+        db.close()
+
+def complete(user_id: int, key: Optional[str], body: bytes, status_code: int = 200) -> Response:
+    """
+    Guarda la respuesta de la petición que reservó la clave y la devuelve.
+    Se llama con el trabajo ya confirmado: reintenta antes de fallar, y si
+    falla la clave no se libera (queda en curso hasta IDEMPOTENCY_LOCK_TIMEOUT).
+    """
+    if key is not None:
+        for attempt in range(IDEMPOTENCY_COMPLETE_ATTEMPTS):
+            db = SessionLocal()
+            try:
+                db.execute(
+                    update(IdempotencyKey)
+                    .where(IdempotencyKey.user_id == user_id, IdempotencyKey.key == key)
+                    .values(
+                        status="completed",
+                        response_status=status_code,
+                        response_body=body.decode(),
+                        completed_at=datetime.utcnow(),
+                    )
+                )
+                db.commit()
+                break
+            except Exception as e:
+                db.rollback()
+                print(f"Error guardando la respuesta de la Idempotency-Key (intento {attempt + 1}): {e}")
+                if attempt == IDEMPOTENCY_COMPLETE_ATTEMPTS - 1:
+                    raise
+                time.sleep(IDEMPOTENCY_POLL_INTERVAL * 2 ** attempt)
+            finally:
+                db.close()
+    return Response(content=body, status_code=status_code, media_type="application/json")
+
+def release(user_id: int, key: Optional[str]):
+    """Libera la clave de una petición que falló, así el reintento rehace el trabajo"""
+    if key is None:
+        return
+    db = SessionLocal()
+    try:
+        db.execute(
+            delete(IdempotencyKey)
+            .where(
+                IdempotencyKey.user_id == user_id,
+                IdempotencyKey.key == key,
+                IdempotencyKey.status == "in_progress",
+            )
+        )
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        print(f"Error liberando Idempotency-Key: {e}")
+    finally:
+        db.close()
+
+def purge_expired(db: Session) -> int:
+    """Borra las claves vencidas; confirma la transacción"""
+    cutoff = datetime.utcnow() - timedelta(hours=IDEMPOTENCY_TTL_HOURS)
+    result = db.execute(delete(IdempotencyKey).where(IdempotencyKey.created_at < cutoff))
+    db.commit()
+    return result.rowcount
+
+def main():
+    parser = argparse.ArgumentParser(description="Mantenimiento de Idempotency-Key")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("purge", help=f"Borra las claves de más de {IDEMPOTENCY_TTL_HOURS} horas")
+    parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        print(f"Listo: {purge_expired(db)} claves borradas")
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    main()
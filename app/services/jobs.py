@@ -0,0 +1,233 @@
+"""
+Cola de tareas en segundo plano sobre la tabla `jobs`.
+
+- enqueue agrega la tarea a la transacción de quien la llama: si la ruta
+  hace rollback la tarea no existe, y si confirma queda guardada aunque el
+  proceso se caiga después.
+- Los workers toman una tarea por vez con SELECT ... FOR UPDATE SKIP
+  LOCKED (PostgreSQL) y la marcan `running` con un UPDATE condicionado al
+  estado, así dos workers nunca ejecutan la misma tarea (en SQLite, sin
+  SKIP LOCKED, el UPDATE condicionado es el que decide).
+- Si la tarea falla se reintenta con espera exponencial
+  (JOB_RETRY_BACKOFF * 2^(intento - 1) segundos); al agotar max_attempts
+  queda `dead` con el último error, para revisarla y reencolarla.
+- Una tarea `running` de un worker caído vuelve a la cola pasados
+  JOB_LOCK_TIMEOUT segundos.
+
+Workers: `python -m app.worker` (proceso aparte, ver app/worker.py) o,
+con JOB_WORKER_IN_PROCESS=true, hilos dentro del proceso de la API. Las
+tareas se registran con @task en app/services/tasks.py.
+
+Bases existentes: create_all crea la tabla `jobs` al iniciar.
+"""
+import json
+import os
+import socket
+import threading
+import time
+import traceback
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional
+from dotenv import load_dotenv
+from sqlalchemy import select, update
+from sqlalchemy.orm import Session
+from app.database import SessionLocal
+from app.models.jobs import Job
+from app.utils.metrics import JOB_DURATION, JOBS_TOTAL
+
+load_dotenv()
+
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "5"))
+JOB_RETRY_BACKOFF = float(os.getenv("JOB_RETRY_BACKOFF", "5"))
+JOB_LOCK_TIMEOUT = float(os.getenv("JOB_LOCK_TIMEOUT", "300"))
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "1"))
+JOB_WORKER_CONCURRENCY = int(os.getenv("JOB_WORKER_CONCURRENCY", "4"))
+JOB_WORKER_IN_PROCESS = os.getenv("JOB_WORKER_IN_PROCESS", "true").lower() == "true"
+
+_handlers: Dict[str, Callable] = {}
+
+def task(name: str):
+    """Registra `func(**payload)` como la tarea `name`; si lanza una excepción se reintenta"""
+    def register(func: Callable) -> Callable:
+        _handlers[name] = func
+        return func
+    return register
+
+def enqueue(db: Session, name: str, delay: float = 0, max_attempts: int = JOB_MAX_ATTEMPTS, **payload) -> Job:
+    """Agrega la tarea a la sesión; se ejecuta cuando quien llama confirma. El payload debe ser JSON"""
+    job = Job(
+        name=name,
+        payload=json.dumps(payload),
+        status="queued",
+        attempts=0,
+        max_attempts=max_attempts,
+        run_at=datetime.utcnow() + timedelta(seconds=delay),
+    )
+    db.add(job)
+    JOBS_TOTAL.inc(name=name, result="enqueued")
+    return job
+
+def claim(db: Session, worker_id: str) -> Optional[Job]:
+    """Toma la próxima tarea lista y la marca running; None si no hay ninguna"""
+    now = datetime.utcnow()
+    job_id = db.execute(
+        select(Job.id)
+        .where(Job.status == "queued", Job.run_at <= now)
+        .order_by(Job.run_at, Job.id)
+        .limit(1)
+        .with_for_update(skip_locked=True)
+    ).scalar()
+    if job_id is None:
+        db.rollback()
+        return None
+    claimed = db.execute(
+        update(Job)
+        .where(Job.id == job_id, Job.status == "queued")
+        .values(status="running", attempts=Job.attempts + 1, locked_at=now, locked_by=worker_id)
+    ).rowcount
+    db.commit()
+    return db.get(Job, job_id) if claimed else None
+
+def _finish(db: Session, job: Job, worker_id: str, values: dict):
+    # Solo si la tarea sigue siendo de este worker (no fue recuperada por vencida)
+    db.execute(
+        update(Job)
+        .where(Job.id == job.id, Job.status == "running", Job.locked_by == worker_id)
+        .values(locked_at=None, locked_by=None, **values)
+    )
+    db.commit()
+
+def execute(db: Session, job: Job, worker_id: str):
+    """Ejecuta una tarea tomada y registra el resultado: done, reintento o dead"""
+    name, attempts, max_attempts = job.name, job.attempts, job.max_attempts
+    start = time.perf_counter()
+    try:
+        handler = _handlers.get(name)
+        if handler is None:
+            raise LookupError(f"Tarea no registrada: {name}")
+        handler(**json.loads(job.payload))
+    except Exception as e:
+        db.rollback()
+        error = "".join(traceback.format_exception_only(type(e), e)).strip()
+        print(f"Error en la tarea {name} #{job.id} (intento {attempts}/{max_attempts}): {error}")
+        if attempts >= max_attempts:
+            _finish(db, job, worker_id, {"status": "dead", "last_error": error, "finished_at": datetime.utcnow()})
+            JOBS_TOTAL.inc(name=name, result="dead")
+        else:
+            delay = JOB_RETRY_BACKOFF * 2 ** (attempts - 1)
+            _finish(db, job, worker_id, {
+                "status": "queued",
+                "last_error": error,
+                "run_at": datetime.utcnow() + timedelta(seconds=delay),
+            })
+            JOBS_TOTAL.inc(name=name, result="retry")
+    else:
+        _finish(db, job, worker_id, {"status": "done", "last_error": None, "finished_at": datetime.utcnow()})
+        JOBS_TOTAL.inc(name=name, result="done")
+    finally:
+        JOB_DURATION.observe(time.perf_counter() - start, name=name)
+
+def recover_stale(db: Session) -> int:
+    """Devuelve a la cola (o descarta, si agotaron los intentos) las tareas de workers caídos"""
+    cutoff = datetime.utcnow() - timedelta(seconds=JOB_LOCK_TIMEOUT)
+    stale = (Job.status == "running", Job.locked_at < cutoff)
+    dead = db.execute(
+        update(Job)
+        .where(*stale, Job.attempts >= Job.max_attempts)
+        .values(status="dead", last_error="Worker caído o tarea vencida", locked_at=None, locked_by=None,
+                finished_at=datetime.utcnow())
+    ).rowcount
+    requeued = db.execute(
+        update(Job)
+        .where(*stale)
+        .values(status="queued", locked_at=None, locked_by=None)
+    ).rowcount
+    db.commit()
+    return dead + requeued
+
+def retry_dead(db: Session, job_ids: Optional[List[int]] = None) -> int:
+    """Vuelve a encolar tareas descartadas (todas o las indicadas) con los intentos en cero"""
+    criteria = [Job.status == "dead"]
+    if job_ids:
+        criteria.append(Job.id.in_(job_ids))
+    result = db.execute(
+        update(Job)
+        .where(*criteria)
+        .values(status="queued", attempts=0, run_at=datetime.utcnow(), finished_at=None)
+    )
+    db.commit()
+    return result.rowcount
+
+class Worker:
+    """Hilos que toman tareas de la cola y las ejecutan"""
+
+    def __init__(self, concurrency: int = JOB_WORKER_CONCURRENCY, poll_interval: float = JOB_POLL_INTERVAL,
+                 name: Optional[str] = None):
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self.name = name or f"{socket.gethostname()}-{os.getpid()}"
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+
+    def run_next(self, db: Session, worker_id: str) -> bool:
+        """Ejecuta una tarea si hay alguna lista; devuelve si ejecutó"""
+        job = claim(db, worker_id)
+        if job is None:
+            return False
+        execute(db, job, worker_id)
+        return True
+
+    def run_burst(self) -> int:
+        """Ejecuta en este hilo todo lo que esté listo y termina (tests, cron)"""
+        executed = 0
+        db = SessionLocal()
+        try:
+            recover_stale(db)
+            while self.run_next(db, f"{self.name}-burst"):
+                executed += 1
+        finally:
+            db.close()
+        return executed
+
+    def _run(self, index: int):
+        worker_id = f"{self.name}-{index}"
+        db = SessionLocal()
+        try:
+            while not self._stop.is_set():
+                try:
+                    if self.run_next(db, worker_id):
+                        continue
+                    if index == 0:
+                        recover_stale(db)
+                except Exception as e:
+                    db.rollback()
+                    print(f"Error en el worker {worker_id}: {e}")
+                self._stop.wait(self.poll_interval)
+        finally:
+            db.close()
+
+    def start(self):
+        if self._threads:
+            return
+        self._stop.clear()
+        self._threads = [
+            threading.Thread(target=self._run, args=(index,), name=f"job-worker-{index}", daemon=True)
+            for index in range(self.concurrency)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self):
+        """Deja de tomar tareas y espera a que terminen las que están en curso"""
+        self._stop.set()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def wait(self):
+        """Bloquea hasta que los hilos terminen (join con timeout para atender señales)"""
+        for thread in list(self._threads):
+            while thread.is_alive():
+                thread.join(1)
+
+in_process_worker = Worker()
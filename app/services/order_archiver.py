@@ -0,0 +1,203 @@
+"""
+Transiciones masivas de órdenes a entregadas / canceladas.
+
+Mueve las órdenes al historial con sentencias set-based (INSERT ... SELECT
+en order_history y order_history_items) y, en las cancelaciones, restaura
+el stock con un único UPDATE agregado por producto. Procesa por lotes y
+confirma cada lote por separado para no mantener bloqueos largos. Cada
+orden procesada deja un evento order.delivered / order.cancelled en el
+outbox, en la misma transacción que su lote.
+
+Uso como tarea programada (por ejemplo al cierre del día):
+
+    python -m app.services.order_archiver --from-status shipped --to-status delivered --older-than-days 3
+"""
+import argparse
+from datetime import datetime, timedelta
+from typing import Callable, Iterable, List, Optional
+from sqlalchemy import DateTime, String, func, insert, literal, select, update
+from sqlalchemy.orm import Session
+from app.models.orders import Order, OrderItem
+from app.models.order_history import OrderHistory, OrderHistoryItem
+from app.models.product import Product
+from app.services import outbox
+
+# Estados desde los que se permite cada transición
+ALLOWED_TRANSITIONS = {
+    "delivered": ["processing", "shipped"],
+    "cancelled": ["pending", "confirmed", "paid"],
+}
+DEFAULT_CHUNK_SIZE = 500
+
+ProgressCallback = Callable[[int, int, int], None]
+
+def _chunks(ids: List[int], size: int) -> Iterable[List[int]]:
+    for index in range(0, len(ids), size):
+        yield ids[index:index + size]
+
+def _transition_chunk(db: Session, order_ids: List[int], target_status: str, now: datetime) -> List[int]:
+    """Aplica la transición a un lote y devuelve los IDs efectivamente procesados"""
+    # Bloquea las órdenes del lote que siguen en un estado válido
+    rows = db.execute(
+        select(Order.id, Order.order_number, Order.user_id)
+        .where(Order.id.in_(order_ids), Order.status.in_(ALLOWED_TRANSITIONS[target_status]))
+        .with_for_update()
+    ).all()
+    if not rows:
+        return []
+    eligible = [row.id for row in rows]
+
+    timestamp_column = "delivered_at" if target_status == "delivered" else "cancelled_at"
+
+    # 1. Cabeceras del historial
+    db.execute(
+        insert(OrderHistory).from_select(
+            ["order_number", "user_id", "total_amount", "status", "created_at", timestamp_column],
+            select(
+                Order.order_number,
+                Order.user_id,
+                Order.total_amount,
+                literal(target_status, String),
+                Order.created_at,
+                literal(now, DateTime),
+            ).where(Order.id.in_(eligible))
+        )
+    )
+
+    # 2. Items del historial, enlazados por número de orden
+    db.execute(
+        insert(OrderHistoryItem).from_select(
+            ["order_history_id", "product_id", "quantity", "unit_price"],
+            select(OrderHistory.id, OrderItem.product_id, OrderItem.quantity, OrderItem.unit_price)
+            .join(Order, Order.id == OrderItem.order_id)
+            .join(OrderHistory, OrderHistory.order_number == Order.order_number)
+            .where(Order.id.in_(eligible))
+        )
+    )
+
+    # 3. Restaurar stock en cancelaciones: un UPDATE con la cantidad agregada por producto
+    if target_status == "cancelled":
+        restored = (
+            select(func.coalesce(func.sum(OrderItem.quantity), 0))
+            .where(OrderItem.order_id.in_(eligible), OrderItem.product_id == Product.id)
+            .scalar_subquery()
+        )
+        db.execute(
+            update(Product)
+            .where(Product.id.in_(select(OrderItem.product_id).where(OrderItem.order_id.in_(eligible))))
+            .values(stock=Product.stock + restored, version=Product.version + 1)
+            .execution_options(synchronize_session=False)
+        )
+
+    # 4. Estado final de las órdenes
+    db.execute(
+        update(Order)
+        .where(Order.id.in_(eligible))
+        .values(status=target_status)
+        .execution_options(synchronize_session=False)
+    )
+
+    # 5. Eventos de dominio, en la misma transacción que el lote
+    outbox.record_many(db, f"order.{target_status}", "order", [
+        {"aggregate_id": row.id, "order_id": row.id, "order_number": row.order_number, "user_id": row.user_id}
+        for row in rows
+    ])
+    return eligible
+
+def transition_orders(
+    db: Session,
+    order_ids: List[int],
+    target_status: str,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    progress: Optional[ProgressCallback] = None
+) -> dict:
+    """
+    Pasa las órdenes indicadas a `target_status` ("delivered" o "cancelled")
+    y las copia al historial. Las órdenes que no están en un estado válido
+    para la transición se omiten. Cada lote se confirma por separado.
+    """
+    if target_status not in ALLOWED_TRANSITIONS:
+        raise ValueError(f"Transición no soportada: {target_status}")
+
+    order_ids = sorted(set(order_ids))
+    processed: List[int] = []
+    chunks = 0
+    for chunk in _chunks(order_ids, chunk_size):
+        try:
+            processed.extend(_transition_chunk(db, chunk, target_status, datetime.utcnow()))
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        chunks += 1
+        if progress:
+            progress(chunks, min(chunks * chunk_size, len(order_ids)), len(order_ids))
+
+    return {
+        "status": target_status,
+        "requested": len(order_ids),
+        "processed": len(processed),
+        "skipped": len(order_ids) - len(processed),
+        "chunks": chunks,
+        "processed_ids": processed,
+    }
+
+def archive_orders(
+    db: Session,
+    from_statuses: List[str],
+    target_status: str,
+    older_than: Optional[datetime] = None,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    progress: Optional[ProgressCallback] = None
+) -> dict:
+    """
+    Archivador programado: recorre por keyset (id creciente) las órdenes en
+    `from_statuses` creadas antes de `older_than` y las transiciona por lotes.
+    """
+    invalid = set(from_statuses) - set(ALLOWED_TRANSITIONS.get(target_status, []))
+    if invalid:
+        raise ValueError(f"No se puede pasar de {sorted(invalid)} a {target_status}")
+
+    total = {"status": target_status, "requested": 0, "processed": 0, "skipped": 0, "chunks": 0}
+    last_id = 0
+    while True:
+        query = select(Order.id).where(Order.id > last_id, Order.status.in_(from_statuses))
+        if older_than is not None:
+            query = query.where(Order.created_at < older_than)
+        batch = db.execute(query.order_by(Order.id).limit(chunk_size)).scalars().all()
+        if not batch:
+            break
+        last_id = batch[-1]
+        result = transition_orders(db, batch, target_status, chunk_size)
+        for key in ("requested", "processed", "skipped", "chunks"):
+            total[key] += result[key]
+        if progress:
+            progress(total["chunks"], total["processed"], total["requested"])
+    return total
+
+def main():
+    from app.database import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Archiva órdenes en el historial por lotes")
+    parser.add_argument("--from-status", action="append", required=True, help="Estado de origen (repetible)")
+    parser.add_argument("--to-status", required=True, choices=sorted(ALLOWED_TRANSITIONS))
+    parser.add_argument("--older-than-days", type=int, default=None)
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    args = parser.parse_args()
+
+    older_than = None
+    if args.older_than_days is not None:
+        older_than = datetime.utcnow() - timedelta(days=args.older_than_days)
+
+    def report(chunks: int, processed: int, requested: int):
+        print(f"Lote {chunks}: {processed} órdenes archivadas de {requested} revisadas")
+
+    db = SessionLocal()
+    try:
+        result = archive_orders(db, args.from_status, args.to_status, older_than, args.chunk_size, report)
+        print(f"Listo: {result['processed']} archivadas, {result['skipped']} omitidas en {result['chunks']} lotes")
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,265 @@
+"""
+Outbox transaccional de eventos de dominio.
+
+Las rutas no ejecutan efectos secundarios después de confirmar: record()
+agrega un evento (order.created, payment.completed, order.delivered,
+order.cancelled) a la misma transacción que el cambio de estado. Si la
+transacción se confirma el evento existe, y si hace rollback no.
+
+El relay publica los pendientes por lotes en orden de id:
+
+- Suscriptores en el proceso (@subscriber en app/services/subscribers.py)
+  que reciben la sesión del relay: lo que escriben (por ejemplo una tarea
+  en la cola de jobs) se confirma junto con la marca de publicado.
+- Con OUTBOX_PUBLISHER=redis, además, un Redis Stream
+  (OUTBOX_REDIS_STREAM) para consumidores externos. Entrega al menos una
+  vez: los consumidores deduplican por `id`.
+
+Orden por agregado: un solo relay activo a la vez en el clúster (advisory
+lock, ver app/services/scheduler.py), y si un evento falla los siguientes
+del mismo agregado esperan a que se publique. Un evento fallido se
+reintenta con espera exponencial (OUTBOX_RETRY_BACKOFF * 2^(intento - 1)
+segundos, en next_attempt_at); tras OUTBOX_MAX_ATTEMPTS intentos queda
+`dead` y deja de bloquear a su agregado.
+
+Para bases existentes:
+
+    ALTER TABLE outbox_events ADD COLUMN next_attempt_at TIMESTAMP;
+
+El relay corre en la API (OUTBOX_RELAY_ENABLED=true) o en
+`python -m app.worker --relay`.
+"""
+import json
+import os
+import threading
+import traceback
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional, Set
+from dotenv import load_dotenv
+from sqlalchemy import delete, exists, insert, select
+from sqlalchemy.orm import Session, aliased
+from app.database import SessionLocal
+from app.models.outbox import OutboxEvent
+from app.services.scheduler import leader_lock
+from app.utils.metrics import OUTBOX_EVENTS_TOTAL, OUTBOX_LAG
+
+try:
+    import redis
+except ImportError:  # redis es opcional
+    redis = None
+
+load_dotenv()
+
+OUTBOX_RELAY_ENABLED = os.getenv("OUTBOX_RELAY_ENABLED", "true").lower() == "true"
+OUTBOX_RELAY_INTERVAL = float(os.getenv("OUTBOX_RELAY_INTERVAL", "0.5"))
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "100"))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "10"))
+OUTBOX_RETRY_BACKOFF = float(os.getenv("OUTBOX_RETRY_BACKOFF", "1"))
+OUTBOX_RETENTION_HOURS = int(os.getenv("OUTBOX_RETENTION_HOURS", "72"))
+OUTBOX_PUBLISHER = os.getenv("OUTBOX_PUBLISHER", "local").lower()
+OUTBOX_REDIS_STREAM = os.getenv("OUTBOX_REDIS_STREAM", "domain-events")
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+
+_subscribers: Dict[str, List[Callable[[Session, dict], None]]] = {}
+
+def subscriber(event_type: str):
+    """Registra `func(db, event)`; event tiene id, type, aggregate_type, aggregate_id, payload y created_at"""
+    def register(func: Callable[[Session, dict], None]) -> Callable[[Session, dict], None]:
+        _subscribers.setdefault(event_type, []).append(func)
+        return func
+    return register
+
+def record(db: Session, event_type: str, aggregate_type: str, aggregate_id, **payload) -> OutboxEvent:
+    """Agrega el evento a la transacción de `db`; se publica cuando quien llama confirma"""
+    event = OutboxEvent(
+        event_type=event_type,
+        aggregate_type=aggregate_type,
+        aggregate_id=str(aggregate_id),
+        payload=json.dumps(payload, default=str),
+        status="pending",
+        attempts=0,
+        created_at=datetime.utcnow(),
+    )
+    db.add(event)
+    OUTBOX_EVENTS_TOTAL.inc(event_type=event_type, result="recorded")
+    return event
+
+def record_many(db: Session, event_type: str, aggregate_type: str, events: List[dict]):
+    """Varios eventos del mismo tipo en un INSERT; cada dict trae aggregate_id y el payload"""
+    if not events:
+        return
+    now = datetime.utcnow()
+    db.execute(insert(OutboxEvent), [
+        {
+            "event_type": event_type,
+            "aggregate_type": aggregate_type,
+            "aggregate_id": str(payload["aggregate_id"]),
+            "payload": json.dumps({k: v for k, v in payload.items() if k != "aggregate_id"}, default=str),
+            "status": "pending",
+            "attempts": 0,
+            "created_at": now,
+        }
+        for payload in events
+    ])
+    OUTBOX_EVENTS_TOTAL.inc(len(events), event_type=event_type, result="recorded")
+
+class RedisStreamPublisher:
+    """Publica cada evento en un Redis Stream (XADD) para consumidores externos"""
+
+    def __init__(self, url: str = REDIS_URL, stream: str = OUTBOX_REDIS_STREAM):
+        self.client = redis.Redis.from_url(url)
+        self.stream = stream
+
+    def publish(self, event: dict):
+        self.client.xadd(self.stream, {"id": event["id"], "type": event["type"], "data": json.dumps(event, default=str)})
+
+def build_publisher():
+    if OUTBOX_PUBLISHER == "redis":
+        if redis is None:
+            raise RuntimeError("OUTBOX_PUBLISHER=redis requiere el paquete redis (pip install redis)")
+        return RedisStreamPublisher()
+    return None
+
+publisher = build_publisher()
+
+def _as_message(event: OutboxEvent) -> dict:
+    return {
+        "id": event.id,
+        "type": event.event_type,
+        "aggregate_type": event.aggregate_type,
+        "aggregate_id": event.aggregate_id,
+        "payload": json.loads(event.payload),
+        "created_at": event.created_at.isoformat() if event.created_at else None,
+    }
+
+def _dispatch(db: Session, message: dict):
+    for handler in _subscribers.get(message["type"], []):
+        handler(db, message)
+    if publisher is not None:
+        publisher.publish(message)
+
+def relay_batch(db: Session, batch_size: int = OUTBOX_BATCH_SIZE) -> int:
+    """
+    Publica hasta `batch_size` eventos pendientes en orden de id y confirma.
+    Cada evento corre en un savepoint: si falla se deshace solo lo suyo, se
+    programa el reintento y los siguientes de su agregado quedan esperando.
+    Devuelve cuántos eventos se publicaron o quedaron `dead`; los que
+    fallaron o quedaron retenidos detrás de uno fallido no cuentan.
+    """
+    # Un evento que espera su reintento retiene a los siguientes de su agregado; sin
+    # ocupar el lote, para que no frene a los demás agregados
+    waiting = aliased(OutboxEvent)
+    events = db.execute(
+        select(OutboxEvent)
+        .where(
+            OutboxEvent.status == "pending",
+            ~exists().where(
+                waiting.aggregate_type == OutboxEvent.aggregate_type,
+                waiting.aggregate_id == OutboxEvent.aggregate_id,
+                waiting.id <= OutboxEvent.id,
+                waiting.status == "pending",
+                waiting.next_attempt_at > datetime.utcnow(),
+            )
+        )
+        .order_by(OutboxEvent.id)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+    ).scalars().all()
+    blocked: Set[tuple] = set()
+    processed = 0
+    for event in events:
+        aggregate = (event.aggregate_type, event.aggregate_id)
+        if aggregate in blocked:
+            continue
+        message = _as_message(event)
+        try:
+            with db.begin_nested():
+                _dispatch(db, message)
+        except Exception as e:
+            error = "".join(traceback.format_exception_only(type(e), e)).strip()
+            print(f"Error publicando el evento {event.event_type} #{event.id}: {error}")
+            event.attempts = (event.attempts or 0) + 1
+            event.last_error = error
+            if event.attempts >= OUTBOX_MAX_ATTEMPTS:
+                event.status = "dead"
+                OUTBOX_EVENTS_TOTAL.inc(event_type=event.event_type, result="dead")
+                processed += 1
+            else:
+                delay = OUTBOX_RETRY_BACKOFF * 2 ** (event.attempts - 1)
+                event.next_attempt_at = datetime.utcnow() + timedelta(seconds=delay)
+                blocked.add(aggregate)
+                OUTBOX_EVENTS_TOTAL.inc(event_type=event.event_type, result="retry")
+        else:
+            event.status = "published"
+            event.published_at = datetime.utcnow()
+            OUTBOX_EVENTS_TOTAL.inc(event_type=event.event_type, result="published")
+            if event.created_at:
+                OUTBOX_LAG.observe((event.published_at - event.created_at).total_seconds(), event_type=event.event_type)
+            processed += 1
+    db.commit()
+    return processed
+
+def purge_published(db: Session) -> int:
+    """Borra los eventos publicados hace más de OUTBOX_RETENTION_HOURS; confirma la transacción"""
+    cutoff = datetime.utcnow() - timedelta(hours=OUTBOX_RETENTION_HOURS)
+    result = db.execute(
+        delete(OutboxEvent).where(OutboxEvent.status == "published", OutboxEvent.published_at < cutoff)
+    )
+    db.commit()
+    return result.rowcount
+
+class OutboxRelay:
+    """Hilo que publica los eventos pendientes cada `interval` segundos mientras tenga el lock del clúster"""
+
+    def __init__(self, interval: float = OUTBOX_RELAY_INTERVAL, batch_size: int = OUTBOX_BATCH_SIZE):
+        self.interval = interval
+        self.batch_size = batch_size
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def drain(self) -> int:
+        """
+        Publica lotes mientras vengan completos. Un lote con algún evento
+        fallido corta el ciclo: el reintento queda para su next_attempt_at
+        en lugar de repetirse enseguida.
+        """
+        published = 0
+        with leader_lock("outbox_relay") as acquired:
+            if not acquired:
+                return 0
+            db = SessionLocal()
+            try:
+                while not self._stop.is_set():
+                    processed = relay_batch(db, self.batch_size)
+                    published += processed
+                    if processed < self.batch_size:
+                        break
+            except Exception as e:
+                db.rollback()
+                print(f"Error en el relay del outbox: {e}")
+            finally:
+                db.close()
+        return published
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.drain()
+            except Exception as e:
+                print(f"Error en el relay del outbox: {e}")
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="outbox-relay", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+
+relay = OutboxRelay()
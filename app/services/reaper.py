@@ -0,0 +1,152 @@
+"""
+Limpieza periódica de registros vencidos.
+
+- Carritos activos sin cambios en CART_TTL_DAYS días: pasan a `expired`
+  (conservan sus items). Los que están en el almacén caliente se omiten:
+  su updated_at se actualiza cuando se escriben.
+- Pagos `pending` de más de PAYMENT_PENDING_TTL_HOURS horas: pasan a
+  `expired`. Si Mercado Pago confirma después, el webhook los actualiza.
+- Cupones activos con valid_until vencido: se desactivan.
+
+Cada tipo se recorre por id (keyset: WHERE id > último ORDER BY id LIMIT
+lote) con lotes de REAPER_BATCH_SIZE filas y un commit por lote, así nunca
+bloquea muchas filas a la vez. En PostgreSQL las filas bloqueadas por otra
+transacción se saltean (SKIP LOCKED) y quedan para la próxima ejecución.
+
+Uso como tarea programada:
+
+    python -m app.services.reaper
+    python -m app.services.reaper --only carts --batch-size 200
+
+Bases creadas antes de estas columnas e índices (create_all no altera tablas):
+
+    ALTER TABLE carts ADD COLUMN created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP;
+    ALTER TABLE carts ADD COLUMN updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP;
+    CREATE INDEX ix_carts_user_id_status ON carts (user_id, status);
+    CREATE INDEX ix_carts_status_updated_at ON carts (status, updated_at);
+    CREATE INDEX ix_payments_order_id ON payments (order_id);
+    CREATE INDEX ix_payments_status_payment_date ON payments (status, payment_date);
+"""
+import argparse
+import os
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Iterable, List, Optional
+from dotenv import load_dotenv
+from sqlalchemy import select, update
+from sqlalchemy.orm import Session
+from app.models.cart import Cart
+from app.models.coupon import Coupon
+from app.models.sales import Payment, PaymentStatus
+from app.services import cart_store
+from app.services.coupons import coupon_cache
+from app.utils.metrics import REAPER_ROWS_TOTAL
+
+load_dotenv()
+
+CART_TTL_DAYS = float(os.getenv("CART_TTL_DAYS", "7"))
+PAYMENT_PENDING_TTL_HOURS = float(os.getenv("PAYMENT_PENDING_TTL_HOURS", "48"))
+REAPER_BATCH_SIZE = int(os.getenv("REAPER_BATCH_SIZE", "500"))
+
+KINDS = ("carts", "payments", "coupons")
+
+def _reap(
+    db: Session,
+    model,
+    criteria: Iterable,
+    values: dict,
+    batch_size: int,
+    keep: Optional[Callable[[List[int]], Iterable[int]]] = None
+) -> int:
+    """Aplica `values` por lotes a las filas que cumplen `criteria`; devuelve cuántas cambió"""
+    criteria = tuple(criteria)
+    last_id = 0
+    changed = 0
+    while True:
+        ids = db.execute(
+            select(model.id)
+            .where(model.id > last_id, *criteria)
+            .order_by(model.id)
+            .limit(batch_size)
+            .with_for_update(skip_locked=True)
+        ).scalars().all()
+        if not ids:
+            return changed
+        last_id = ids[-1]
+        if keep is not None:
+            kept = set(keep(ids))
+            ids = [row_id for row_id in ids if row_id not in kept]
+        if ids:
+            changed += db.execute(
+                update(model)
+                .where(model.id.in_(ids), *criteria)
+                .values(**values)
+                .execution_options(synchronize_session=False)
+            ).rowcount
+        db.commit()
+
+def expire_carts(db: Session, now: datetime, batch_size: int = REAPER_BATCH_SIZE) -> int:
+    cutoff = now - timedelta(days=CART_TTL_DAYS)
+    return _reap(
+        db, Cart,
+        (Cart.status == "active", Cart.updated_at < cutoff),
+        {"status": "expired", "version": Cart.version + 1},
+        batch_size,
+        keep=lambda ids: cart_store.cached(ids).keys(),
+    )
+
+def expire_payments(db: Session, now: datetime, batch_size: int = REAPER_BATCH_SIZE) -> int:
+    cutoff = now - timedelta(hours=PAYMENT_PENDING_TTL_HOURS)
+    return _reap(
+        db, Payment,
+        (Payment.status == PaymentStatus.PENDING, Payment.payment_date < cutoff),
+        {"status": PaymentStatus.EXPIRED},
+        batch_size,
+    )
+
+def deactivate_coupons(db: Session, now: datetime, batch_size: int = REAPER_BATCH_SIZE) -> int:
+    changed = _reap(
+        db, Coupon,
+        (Coupon.is_active.is_(True), Coupon.valid_until < now),
+        {"is_active": False, "updated_at": now},
+        batch_size,
+    )
+    if changed:
+        coupon_cache.clear()
+    return changed
+
+REAPERS = {
+    "carts": expire_carts,
+    "payments": expire_payments,
+    "coupons": deactivate_coupons,
+}
+
+def run(db: Session, kinds: Iterable[str] = KINDS, batch_size: int = REAPER_BATCH_SIZE,
+        now: Optional[datetime] = None) -> Dict[str, int]:
+    """Ejecuta las limpiezas indicadas y devuelve las filas cambiadas por tipo"""
+    now = now or datetime.utcnow()
+    report = {}
+    for kind in kinds:
+        report[kind] = REAPERS[kind](db, now, batch_size)
+        REAPER_ROWS_TOTAL.inc(report[kind], kind=kind)
+    return report
+
+def main():
+    from app.database import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Vence carritos abandonados, pagos pendientes y cupones")
+    parser.add_argument("--only", choices=KINDS, action="append", help="Limitar a un tipo (se puede repetir)")
+    parser.add_argument("--batch-size", type=int, default=REAPER_BATCH_SIZE)
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        start = time.perf_counter()
+        report = run(db, args.only or KINDS, args.batch_size)
+        elapsed = time.perf_counter() - start
+        print(", ".join(f"{kind}: {count}" for kind, count in report.items()) + f" ({elapsed:.2f} s)")
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    main()
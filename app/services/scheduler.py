@@ -0,0 +1,291 @@
+"""
+Tareas periódicas declaradas en código (app/services/schedules.py) con
+expresiones cron de 5 campos en UTC o un intervalo en segundos.
+
+Con varias réplicas de la API, cada una corre el planificador, pero cada
+ejecución la hace una sola:
+
+- Elección de líder por tarea: pg_try_advisory_lock (PostgreSQL) tomado en
+  una conexión propia mientras dura la ejecución. Quien no obtiene el lock
+  la saltea, así una tarea larga nunca se superpone consigo misma. Con
+  otro motor se usa un lock local (un solo nodo).
+- La tabla scheduled_runs guarda la próxima ejecución, y el inicio, la
+  duración, el estado y la réplica de la última. Con el lock tomado se
+  vuelve a leer next_run_at: si otra réplica ya la ejecutó para este
+  horario, no se repite. Los horarios perdidos (caída, tarea larga) se
+  recuperan con una sola ejecución.
+
+Se activa en la API con SCHEDULER_ENABLED=true o en un proceso aparte
+(python -m app.scheduler, ver app/scheduler.py).
+"""
+import hashlib
+import os
+import socket
+import threading
+import time
+import traceback
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Iterator, List, Optional, Set
+from dotenv import load_dotenv
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+from app.database import SessionLocal, engine
+from app.models.scheduler import ScheduledRun
+from app.utils.metrics import SCHEDULED_RUN_DURATION, SCHEDULED_RUNS_TOTAL
+
+load_dotenv()
+
+SCHEDULER_ENABLED = os.getenv("SCHEDULER_ENABLED", "false").lower() == "true"
+SCHEDULER_TICK = float(os.getenv("SCHEDULER_TICK", "15"))
+
+CRON_FIELDS = ((0, 59), (0, 23), (1, 31), (1, 12), (0, 7))
+
+def _parse_field(field: str, low: int, high: int) -> Set[int]:
+    values: Set[int] = set()
+    for part in field.split(","):
+        step = 1
+        if "/" in part:
+            part, step_text = part.split("/", 1)
+            step = int(step_text)
+        if part == "*":
+            start, end = low, high
+        elif "-" in part:
+            start, end = (int(value) for value in part.split("-", 1))
+        else:
+            start = int(part)
+            end = high if step > 1 else start
+        if start < low or end > high or start > end or step < 1:
+            raise ValueError(f"Campo cron fuera de rango: {field}")
+        values.update(range(start, end + 1, step))
+    return values
+
+class Cron:
+    """Expresión cron de 5 campos: minuto hora día-del-mes mes día-de-la-semana (0 y 7 = domingo)"""
+
+    def __init__(self, expression: str):
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError(f"Expresión cron inválida: {expression}")
+        self.expression = expression
+        self.minutes, self.hours, self.days, self.months, weekdays = (
+            _parse_field(field, low, high) for field, (low, high) in zip(fields, CRON_FIELDS)
+        )
+        self.weekdays = {day % 7 for day in weekdays}
+        self.any_day = fields[2] == "*"
+        self.any_weekday = fields[4] == "*"
+
+    def _day_matches(self, moment: datetime) -> bool:
+        day = moment.day in self.days
+        weekday = (moment.weekday() + 1) % 7 in self.weekdays
+        # Como en cron: con ambos campos restringidos alcanza con que coincida uno
+        if self.any_day or self.any_weekday:
+            return day and weekday
+        return day or weekday
+
+    def next_after(self, moment: datetime) -> datetime:
+        candidate = moment.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = candidate + timedelta(days=366 * 5)
+        while candidate < limit:
+            if candidate.month not in self.months or not self._day_matches(candidate):
+                candidate = (candidate + timedelta(days=1)).replace(hour=0, minute=0)
+            elif candidate.hour not in self.hours:
+                candidate = (candidate + timedelta(hours=1)).replace(minute=0)
+            elif candidate.minute not in self.minutes:
+                candidate += timedelta(minutes=1)
+            else:
+                return candidate
+        raise ValueError(f"La expresión cron nunca se cumple: {self.expression}")
+
+class Schedule:
+    """Tarea periódica: `func(db)` cada `every` segundos o según `cron`"""
+
+    def __init__(self, name: str, func: Callable[[Session], object], cron: Optional[str] = None,
+                 every: Optional[float] = None):
+        if (cron is None) == (every is None):
+            raise ValueError(f"La tarea {name} necesita cron o every (solo uno)")
+        self.name = name
+        self.func = func
+        self.cron = Cron(cron) if cron is not None else None
+        self.every = every
+
+    @property
+    def description(self) -> str:
+        return self.cron.expression if self.cron else f"cada {self.every:g} s"
+
+    def next_after(self, moment: datetime) -> datetime:
+        if self.cron is not None:
+            return self.cron.next_after(moment)
+        return moment + timedelta(seconds=self.every)
+
+_schedules: Dict[str, Schedule] = {}
+
+def scheduled(name: str, cron: Optional[str] = None, every: Optional[float] = None):
+    """Registra `func(db)` como tarea periódica"""
+    def register(func: Callable[[Session], object]) -> Callable[[Session], object]:
+        _schedules[name] = Schedule(name, func, cron=cron, every=every)
+        return func
+    return register
+
+def schedules() -> List[Schedule]:
+    return list(_schedules.values())
+
+_local_locks: Dict[str, threading.Lock] = {}
+_local_locks_guard = threading.Lock()
+
+def _lock_key(name: str) -> int:
+    # Clave estable de 64 bits con signo para pg_try_advisory_lock
+    return int.from_bytes(hashlib.sha256(f"scheduler:{name}".encode()).digest()[:8], "big", signed=True)
+
+@contextmanager
+def leader_lock(name: str) -> Iterator[bool]:
+    """Lock de clúster de la tarea mientras dura el bloque; produce si se obtuvo"""
+    if engine.dialect.name == "postgresql":
+        key = _lock_key(name)
+        with engine.connect() as connection:
+            acquired = connection.execute(select(func.pg_try_advisory_lock(key))).scalar()
+            connection.commit()
+            try:
+                yield bool(acquired)
+            finally:
+                if acquired:
+                    connection.execute(select(func.pg_advisory_unlock(key)))
+                    connection.commit()
+        return
+
+    with _local_locks_guard:
+        lock = _local_locks.setdefault(name, threading.Lock())
+    acquired = lock.acquire(blocking=False)
+    try:
+        yield acquired
+    finally:
+        if acquired:
+            lock.release()
+
+def run_schedule(schedule: Schedule, node: str, force: bool = False) -> Optional[str]:
+    """
+    Ejecuta la tarea si le toca (o siempre, con force) y esta réplica obtiene
+    el lock. Devuelve "ok", "error", "skipped" (otra réplica la está
+    ejecutando) o None (todavía no le toca).
+    """
+    with leader_lock(schedule.name) as acquired:
+        if not acquired:
+            SCHEDULED_RUNS_TOTAL.inc(name=schedule.name, result="skipped")
+            return "skipped"
+        db = SessionLocal()
+        try:
+            now = datetime.utcnow()
+            run = db.get(ScheduledRun, schedule.name)
+            if run is None:
+                # Primera vez: se agenda desde ahora, sin ejecutar al desplegar
+                run = ScheduledRun(name=schedule.name, next_run_at=schedule.next_after(now), run_count=0)
+                db.add(run)
+                db.commit()
+            if not force and run.next_run_at > now:
+                return None
+
+            run.last_started_at = now
+            run.last_status = "running"
+            run.last_node = node
+            db.commit()
+
+            work_db = SessionLocal()
+            start = time.perf_counter()
+            try:
+                result = schedule.func(work_db)
+                status, error = "ok", None
+                print(f"Tarea programada {schedule.name}: {result}")
+            except Exception as e:
+                work_db.rollback()
+                status = "error"
+                error = "".join(traceback.format_exception_only(type(e), e)).strip()
+                print(f"Error en la tarea programada {schedule.name}: {error}")
+            finally:
+                work_db.close()
+            duration = time.perf_counter() - start
+
+            finished = datetime.utcnow()
+            run.last_finished_at = finished
+            run.last_duration = duration
+            run.last_status = status
+            run.last_error = error
+            run.run_count = (run.run_count or 0) + 1
+            run.next_run_at = schedule.next_after(finished)
+            db.commit()
+            SCHEDULED_RUNS_TOTAL.inc(name=schedule.name, result=status)
+            SCHEDULED_RUN_DURATION.observe(duration, name=schedule.name)
+            return status
+        finally:
+            db.close()
+
+class Scheduler:
+    """Hilo que cada `tick` segundos lanza las tareas que ya deben ejecutarse, cada una en su hilo"""
+
+    def __init__(self, tick: float = SCHEDULER_TICK, node: Optional[str] = None):
+        self.tick = tick
+        self.node = node or f"{socket.gethostname()}-{os.getpid()}"
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._running: Set[str] = set()
+        self._running_lock = threading.Lock()
+
+    def due(self, now: Optional[datetime] = None) -> List[Schedule]:
+        now = now or datetime.utcnow()
+        db = SessionLocal()
+        try:
+            next_runs = dict(db.execute(select(ScheduledRun.name, ScheduledRun.next_run_at)).all())
+        finally:
+            db.close()
+        return [
+            schedule for schedule in schedules()
+            if schedule.name not in next_runs or next_runs[schedule.name] <= now
+        ]
+
+    def _execute(self, schedule: Schedule):
+        try:
+            run_schedule(schedule, self.node)
+        except Exception as e:
+            print(f"Error en el planificador ({schedule.name}): {e}")
+        finally:
+            with self._running_lock:
+                self._running.discard(schedule.name)
+
+    def run_pending(self) -> List[str]:
+        """Lanza las tareas que deben ejecutarse y no están en curso en este proceso"""
+        started = []
+        for schedule in self.due():
+            with self._running_lock:
+                if schedule.name in self._running:
+                    continue
+                self._running.add(schedule.name)
+            threading.Thread(
+                target=self._execute, args=(schedule,), name=f"scheduled-{schedule.name}", daemon=True
+            ).start()
+            started.append(schedule.name)
+        return started
+
+    def _run(self):
+        while True:
+            try:
+                self.run_pending()
+            except Exception as e:
+                print(f"Error en el planificador: {e}")
+            if self._stop.wait(self.tick):
+                return
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="scheduler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Deja de lanzar tareas; las que están en curso terminan en sus hilos"""
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+
+background_scheduler = Scheduler()
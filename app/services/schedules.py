@@ -0,0 +1,30 @@
+"""
+Tareas periódicas (ver app/services/scheduler.py). Horarios en UTC; cada
+función recibe una sesión propia y devuelve un resumen para el log.
+
+El archivado de órdenes e historial (`python -m app.services.archive`) no
+está programado: no todas las lecturas del historial consultan todavía las
+tablas frías.
+"""
+from datetime import datetime, timedelta
+from sqlalchemy.orm import Session
+from app.services import analytics, idempotency, outbox, reaper
+from app.services.scheduler import scheduled
+
+@scheduled("reaper", cron="*/15 * * * *")
+def expire_stale_records(db: Session):
+    return reaper.run(db)
+
+@scheduled("idempotency_purge", cron="5 * * * *")
+def purge_idempotency_keys(db: Session):
+    return {"keys": idempotency.purge_expired(db)}
+
+@scheduled("outbox_purge", cron="20 * * * *")
+def purge_published_events(db: Session):
+    return {"events": outbox.purge_published(db)}
+
+@scheduled("sales_rollups", cron="30 2 * * *")
+def reconcile_sales_rollups(db: Session):
+    # Reconstruye los rollups de ayer por si algún cambio de estado no pasó por record_sale_completion
+    yesterday = datetime.utcnow().date() - timedelta(days=1)
+    return {"sales": analytics.backfill(db, yesterday, yesterday)}
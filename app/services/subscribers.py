@@ -0,0 +1,23 @@
+"""
+Suscriptores de eventos de dominio (ver app/services/outbox.py). Corren en
+la sesión del relay: lo que agregan se confirma junto con la marca de
+publicado, así un evento no genera dos veces la misma tarea.
+"""
+from sqlalchemy.orm import Session
+from app.services import jobs
+from app.services.outbox import subscriber
+
+@subscriber("order.created")
+def order_confirmation(db: Session, event: dict):
+    jobs.enqueue(db, "send_order_confirmation", order_id=event["payload"]["order_id"])
+
+@subscriber("payment.completed")
+def payment_confirmation(db: Session, event: dict):
+    payload = event["payload"]
+    jobs.enqueue(
+        db, "send_payment_confirmation",
+        email=payload["email"],
+        order_id=payload["order_id"],
+        amount=payload["amount"],
+        invoice_number=payload["invoice_number"],
+    )
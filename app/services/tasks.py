@@ -0,0 +1,33 @@
+"""
+Tareas en segundo plano (ver app/services/jobs.py). Cada una recibe el
+payload JSON como argumentos y lanza una excepción para que se reintente.
+"""
+from sqlalchemy.orm import joinedload
+from app.database import SessionLocal
+from app.models.orders import Order, OrderItem
+from app.services.jobs import task
+from app.utils.mail_sender import send_order_confirmation, send_payment_confirmation
+
+@task("send_order_confirmation")
+def order_confirmation_email(order_id: int):
+    db = SessionLocal()
+    try:
+        order = db.query(Order).filter(Order.id == order_id).options(
+            joinedload(Order.items).joinedload(OrderItem.product),
+            joinedload(Order.user)
+        ).one()
+        sent = send_order_confirmation(
+            to_email=order.user.email,
+            order_number=order.order_number,
+            total_amount=order.total_amount,
+            items=order.items
+        )
+    finally:
+        db.close()
+    if not sent:
+        raise RuntimeError(f"No se pudo enviar la confirmación de la orden {order_id}")
+
+@task("send_payment_confirmation")
+def payment_confirmation_email(email: str, order_id: int, amount: float, invoice_number: int):
+    if not send_payment_confirmation(email, order_id, amount, invoice_number):
+        raise RuntimeError(f"No se pudo enviar la confirmación de pago de la orden {order_id}")
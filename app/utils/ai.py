@@ -1,6 +1,8 @@
 from groq import Groq
 import os
 from dotenv import load_dotenv
+from app.utils.circuit_breaker import get_breaker
+from app.utils.tracing import traced
 
 # Load environment variables
 load_dotenv()
@@ -11,13 +13,16 @@ if not api_key:
     raise ValueError("GROQ_API_KEY environment variable is not set")
 
 client = Groq(api_key=api_key)
+groq_breaker = get_breaker("groq")
 
+@traced("groq.completion", "client")
 def generate_ai_completion(prompt: str, system_message: str = "Eres un experto en diseño de emails. Genera un HTML de email profesional y responsivo según el siguiente prompt. Devuelve solamente el HTML sin etiquetas adicionales ni explicaciones. hazlo bonito y con una gama de colores azules y verdes."):
     """
     Generate completion using Groq AI
     """
     try:
-        chat_completion = client.chat.completions.create(
+        chat_completion = groq_breaker.call(
+            client.chat.completions.create,
             messages=[
                 {
                     "role": "system",
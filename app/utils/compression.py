@@ -0,0 +1,246 @@
+"""
+Compresión negociada de respuestas (Accept-Encoding): zstd y brotli si sus
+paquetes están instalados (pip install zstandard brotli), gzip siempre.
+
+- Solo se comprimen tipos de texto (JSON, NDJSON, text/*) y respuestas de
+  al menos COMPRESSION_MIN_SIZE bytes; las más chicas no compensan el CPU.
+- Las respuestas en streaming se comprimen por fragmento con un flush en
+  cada uno, así cada lote de NDJSON llega al cliente sin esperar al final.
+- Niveles configurables por algoritmo. Los valores por defecto priorizan
+  CPU sobre ratio, que para JSON ya es alto en niveles bajos.
+
+Bytes y CPU por algoritmo y nivel: python -m benchmarks.compression
+"""
+import os
+import zlib
+from typing import Dict, List, Optional
+from dotenv import load_dotenv
+
+try:
+    import brotli
+except ImportError:  # brotli es opcional
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # zstandard es opcional
+    zstandard = None
+
+load_dotenv()
+
+COMPRESSION_ENABLED = os.getenv("COMPRESSION_ENABLED", "true").lower() == "true"
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+GZIP_LEVEL = int(os.getenv("COMPRESSION_GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.getenv("COMPRESSION_BROTLI_QUALITY", "4"))
+ZSTD_LEVEL = int(os.getenv("COMPRESSION_ZSTD_LEVEL", "3"))
+# Orden de preferencia del servidor cuando el cliente acepta varios con el mismo q
+COMPRESSION_ENCODINGS = [
+    encoding.strip()
+    for encoding in os.getenv("COMPRESSION_ENCODINGS", "zstd,br,gzip").split(",")
+    if encoding.strip()
+]
+
+COMPRESSIBLE_TYPES = ("application/json", "application/x-ndjson", "application/problem+json", "text/")
+
+class GzipEncoder:
+    def __init__(self, level: int = GZIP_LEVEL):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush(zlib.Z_FINISH)
+
+class BrotliEncoder:
+    def __init__(self, quality: int = BROTLI_QUALITY):
+        self._compressor = brotli.Compressor(quality=quality, mode=brotli.MODE_TEXT)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.process(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush()
+
+    def finish(self) -> bytes:
+        return self._compressor.finish()
+
+class ZstdEncoder:
+    def __init__(self, level: int = ZSTD_LEVEL):
+        self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_FINISH)
+
+def available_encoders() -> Dict[str, type]:
+    encoders = {"gzip": GzipEncoder}
+    if brotli is not None:
+        encoders["br"] = BrotliEncoder
+    if zstandard is not None:
+        encoders["zstd"] = ZstdEncoder
+    return encoders
+
+ENCODERS = available_encoders()
+
+def negotiate(accept_encoding: str, preference: List[str] = COMPRESSION_ENCODINGS) -> Optional[str]:
+    """Elige la codificación con mayor q que el servidor soporte; a igual q, según `preference`"""
+    accepted: Dict[str, float] = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name] = quality
+
+    best, best_quality = None, 0.0
+    for encoding in preference:
+        if encoding not in ENCODERS:
+            continue
+        quality = accepted.get(encoding, accepted.get("*", 0.0))
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+def _header(headers: list, name: bytes) -> Optional[bytes]:
+    for key, value in headers:
+        if key.lower() == name:
+            return value
+    return None
+
+def _is_compressible(headers: list) -> bool:
+    if _header(headers, b"content-encoding") is not None:
+        return False
+    content_type = (_header(headers, b"content-type") or b"").decode("latin-1").lower()
+    return content_type.startswith(COMPRESSIBLE_TYPES)
+
+def _vary_headers(headers: list) -> list:
+    """
+    Agrega Accept-Encoding a Vary. Va en toda respuesta comprimible, se
+    comprima o no: si la versión sin comprimir queda en un caché sin Vary,
+    se le serviría también a quien pidió gzip, y al revés.
+    """
+    result = []
+    vary = None
+    for key, value in headers:
+        if key.lower() == b"vary":
+            vary = value if vary is None else vary + b", " + value
+            continue
+        result.append((key, value))
+    if vary is None:
+        vary = b"Accept-Encoding"
+    elif b"accept-encoding" not in vary.lower() and vary.strip() != b"*":
+        vary += b", Accept-Encoding"
+    result.append((b"vary", vary))
+    return result
+
+def _compressed_headers(headers: list, encoding: str, length: Optional[int]) -> list:
+    result = []
+    for key, value in headers:
+        lower = key.lower()
+        if lower == b"content-length":
+            continue
+        if lower == b"etag" and not value.startswith(b"W/"):
+            # El cuerpo comprimido ya no es idéntico byte a byte: el ETag pasa a ser débil
+            value = b"W/" + value
+        result.append((key, value))
+    result.append((b"content-encoding", encoding.encode()))
+    if length is not None:
+        result.append((b"content-length", str(length).encode()))
+    return _vary_headers(result)
+
+class CompressionMiddleware:
+    """
+    Middleware ASGI de compresión. Decide con el primer fragmento del cuerpo:
+    si la respuesta es completa y chica se envía sin comprimir; si es
+    completa y grande se comprime de una vez; si viene en streaming se
+    comprime fragmento a fragmento. Toda respuesta comprimible lleva
+    Vary: Accept-Encoding, también las que salen sin comprimir.
+    """
+
+    def __init__(self, app, minimum_size: int = COMPRESSION_MIN_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        accept_encoding = ""
+        for key, value in scope["headers"]:
+            if key == b"accept-encoding":
+                accept_encoding = value.decode("latin-1")
+                break
+        encoding = negotiate(accept_encoding) if accept_encoding else None
+        if encoding is None:
+            # Sin compresión posible igual se declara Vary en las respuestas comprimibles
+            async def send_identity(message):
+                if message["type"] == "http.response.start":
+                    headers = list(message.get("headers", []))
+                    if message["status"] != 204 and _is_compressible(headers):
+                        message = {**message, "headers": _vary_headers(headers)}
+                await send(message)
+
+            await self.app(scope, receive, send_identity)
+            return
+
+        state = {"start": None, "encoder": None, "passthrough": False}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                state["start"] = message
+                return
+            if message["type"] != "http.response.body" or state["passthrough"]:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            start = state["start"]
+
+            if state["encoder"] is None:
+                headers = list(start.get("headers", []))
+                varies = start["status"] != 204 and _is_compressible(headers)
+                compressible = varies and start["status"] != 304
+                if not compressible or (not more_body and len(body) < self.minimum_size):
+                    state["passthrough"] = True
+                    await send({**start, "headers": _vary_headers(headers)} if varies else start)
+                    await send(message)
+                    return
+
+                state["encoder"] = ENCODERS[encoding]()
+                if not more_body:
+                    # Cuerpo completo: se comprime de una vez y se conoce el largo final
+                    compressed = state["encoder"].compress(body) + state["encoder"].finish()
+                    await send({**start, "headers": _compressed_headers(headers, encoding, len(compressed))})
+                    await send({"type": "http.response.body", "body": compressed})
+                    return
+                await send({**start, "headers": _compressed_headers(headers, encoding, None)})
+
+            encoder = state["encoder"]
+            chunk = encoder.compress(body) + (encoder.flush() if more_body else encoder.finish())
+            await send({"type": "http.response.body", "body": chunk, "more_body": more_body})
+
+        await self.app(scope, receive, send_wrapper)
+
+def compress(data: bytes, encoding: str, level: Optional[int] = None) -> bytes:
+    """Compresión de un bloque completo (usada por el benchmark)"""
+    encoder_class = ENCODERS[encoding]
+    encoder = encoder_class(level) if level is not None else encoder_class()
+    return encoder.compress(data) + encoder.finish()
@@ -0,0 +1,82 @@
+"""
+Control de concurrencia optimista para carritos y productos.
+
+Cart y Product tienen una columna `version` declarada como version_id_col:
+cada UPDATE del ORM lleva WHERE version = <versión leída> y la incrementa.
+Si otra transacción cambió la fila en el medio, el UPDATE no afecta filas y
+SQLAlchemy lanza StaleDataError, sin SELECT ... FOR UPDATE ni esperas por
+bloqueos.
+
+- Rutas: el cliente puede mandar la versión que vio en `If-Match`
+  (`If-Match: 3` o `If-Match: "3"`). Si no coincide, o si otra escritura
+  gana la carrera, la respuesta es 409 con el estado actual.
+- Escritores internos: with_retry repite la unidad de trabajo completa
+  (lectura y escritura) cuando pierde la carrera.
+
+Los UPDATE masivos (cambio de precio en carritos, restauración de stock)
+no pasan por el ORM: incrementan la versión explícitamente.
+
+Bases creadas antes de estas columnas (create_all no altera tablas):
+
+    ALTER TABLE carts ADD COLUMN version INTEGER NOT NULL DEFAULT 1;
+    ALTER TABLE products ADD COLUMN version INTEGER NOT NULL DEFAULT 1;
+"""
+import random
+import time
+from typing import Any, Callable, Optional, TypeVar
+from fastapi.responses import JSONResponse
+from pydantic import TypeAdapter
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.exc import StaleDataError
+
+T = TypeVar("T")
+
+class VersionConflict(Exception):
+    """La versión esperada por el cliente no es la actual"""
+
+    def __init__(self, expected: int, current: Optional[int]):
+        super().__init__(f"Versión esperada {expected}, actual {current}")
+        self.expected = expected
+        self.current = current
+
+def expected_version(if_match: Optional[str]) -> Optional[int]:
+    """Versión de la cabecera If-Match (acepta 3, "3" y W/"3"); None si no se envió o es *"""
+    if not if_match or if_match.strip() == "*":
+        return None
+    value = if_match.strip()
+    if value.startswith("W/"):
+        value = value[2:]
+    try:
+        return int(value.strip('"'))
+    except ValueError:
+        raise VersionConflict(expected=-1, current=None)
+
+def check_version(current: Optional[int], expected: Optional[int]):
+    if expected is not None and current != expected:
+        raise VersionConflict(expected, current)
+
+def conflict_response(schema, current: Any, detail: str = "El recurso fue modificado por otra petición") -> JSONResponse:
+    """409 con el estado actual serializado con el schema de la ruta"""
+    adapter = TypeAdapter(schema)
+    content = {"detail": detail, "current": None}
+    if current is not None:
+        content["current"] = adapter.dump_python(adapter.validate_python(current, from_attributes=True), mode="json")
+    return JSONResponse(status_code=409, content=content)
+
+def with_retry(db: Session, work: Callable[[Session], T], attempts: int = 3, backoff: float = 0.02) -> T:
+    """
+    Ejecuta work(db) y confirma; si otra transacción cambió una fila
+    versionada en el medio, deshace y vuelve a ejecutar desde la lectura,
+    con una espera corta y aleatoria. Tras `attempts` intentos relanza
+    StaleDataError. VersionConflict no se reintenta: es la respuesta.
+    """
+    for attempt in range(attempts):
+        try:
+            result = work(db)
+            db.commit()
+            return result
+        except StaleDataError:
+            db.rollback()
+            if attempt == attempts - 1:
+                raise
+            time.sleep(backoff * (2 ** attempt) * random.random())
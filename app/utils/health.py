@@ -0,0 +1,135 @@
+import os
+import socket
+import threading
+import time
+from typing import Callable, Dict
+from sqlalchemy import text
+from dotenv import load_dotenv
+from app.database import engine
+from app.utils.circuit_breaker import breaker_states, OPEN
+from app.utils.mail_sender import smtp_address, smtp_port, mail_queue_depth
+
+load_dotenv()
+
+# Segundos que se reutiliza el resultado de una sonda antes de volver a ejecutarla
+HEALTH_CACHE_SECONDS = float(os.getenv("HEALTH_CACHE_SECONDS", "5"))
+# Tiempo máximo de cada sonda de red
+HEALTH_PROBE_TIMEOUT = float(os.getenv("HEALTH_PROBE_TIMEOUT", "2"))
+# Fracción del pool en uso a partir de la cual el worker deja de estar listo
+POOL_SATURATION_LIMIT = float(os.getenv("HEALTH_POOL_SATURATION_LIMIT", "0.9"))
+# Correos en curso a partir de los cuales se considera la cola degradada
+MAIL_QUEUE_LIMIT = int(os.getenv("HEALTH_MAIL_QUEUE_LIMIT", "50"))
+
+_cache: Dict[str, tuple] = {}
+_cache_lock = threading.Lock()
+_probe_locks: Dict[str, threading.Lock] = {}
+
+def _cached(name: str, probe: Callable[[], dict]) -> dict:
+    """
+    Ejecuta la sonda como máximo una vez cada HEALTH_CACHE_SECONDS.
+    Si varias peticiones llegan a la vez, solo una ejecuta la sonda y
+    el resto espera y reutiliza el resultado.
+    """
+    now = time.monotonic()
+    with _cache_lock:
+        cached = _cache.get(name)
+        if cached and now - cached[0] < HEALTH_CACHE_SECONDS:
+            return cached[1]
+        lock = _probe_locks.setdefault(name, threading.Lock())
+
+    with lock:
+        with _cache_lock:
+            cached = _cache.get(name)
+            if cached and time.monotonic() - cached[0] < HEALTH_CACHE_SECONDS:
+                return cached[1]
+        result = probe()
+        result["checked_at"] = time.time()
+        with _cache_lock:
+            _cache[name] = (time.monotonic(), result)
+        return result
+
+def _probe_database() -> dict:
+    start = time.perf_counter()
+    try:
+        with engine.connect() as connection:
+            connection.execute(text("SELECT 1"))
+        return {"status": "ok", "latency_ms": round((time.perf_counter() - start) * 1000, 2)}
+    except Exception as e:
+        print(f"Health check: error conectando a la base de datos: {e}")
+        return {
+            "status": "error",
+            "latency_ms": round((time.perf_counter() - start) * 1000, 2),
+            "error": str(e)
+        }
+
+def _probe_pool() -> dict:
+    pool = engine.pool
+    size = pool.size() if hasattr(pool, "size") else None
+    checked_out = pool.checkedout() if hasattr(pool, "checkedout") else None
+    overflow = pool.overflow() if hasattr(pool, "overflow") else None
+    max_overflow = getattr(pool, "_max_overflow", 0) or 0
+
+    result = {
+        "status": "ok",
+        "pool_class": type(pool).__name__,
+        "size": size,
+        "checked_out": checked_out,
+        "overflow": overflow,
+        "saturation": None
+    }
+    if size and checked_out is not None:
+        capacity = size + max(max_overflow, 0)
+        saturation = checked_out / capacity
+        result["saturation"] = round(saturation, 3)
+        if saturation >= POOL_SATURATION_LIMIT:
+            result["status"] = "saturated"
+    return result
+
+def _probe_smtp() -> dict:
+    start = time.perf_counter()
+    try:
+        with socket.create_connection((smtp_address, smtp_port), timeout=HEALTH_PROBE_TIMEOUT):
+            pass
+        return {"status": "ok", "latency_ms": round((time.perf_counter() - start) * 1000, 2)}
+    except OSError as e:
+        return {
+            "status": "error",
+            "latency_ms": round((time.perf_counter() - start) * 1000, 2),
+            "error": str(e)
+        }
+
+def _probe_mail_queue() -> dict:
+    depth = mail_queue_depth()
+    return {"status": "ok" if depth < MAIL_QUEUE_LIMIT else "degraded", "depth": depth}
+
+def check_readiness() -> dict:
+    """Sondas mínimas para decidir si el worker puede recibir tráfico"""
+    database = _cached("database", _probe_database)
+    pool = _probe_pool()  # Solo lee contadores en memoria, no necesita caché
+    ready = database["status"] == "ok" and pool["status"] == "ok"
+    return {
+        "status": "ok" if ready else "unavailable",
+        "checks": {"database": database, "pool": pool}
+    }
+
+def check_deep_health() -> dict:
+    """Estado completo del worker y de sus dependencias externas"""
+    readiness = check_readiness()
+    checks = dict(readiness["checks"])
+    checks["smtp"] = _cached("smtp", _probe_smtp)
+    checks["mail_queue"] = _probe_mail_queue()
+
+    circuits = breaker_states()
+    checks["circuits"] = circuits
+
+    if readiness["status"] != "ok":
+        status = "unavailable"
+    elif (
+        checks["smtp"]["status"] != "ok"
+        or checks["mail_queue"]["status"] != "ok"
+        or any(circuit["state"] == OPEN for circuit in circuits.values())
+    ):
+        status = "degraded"
+    else:
+        status = "ok"
+    return {"status": status, "checks": checks}
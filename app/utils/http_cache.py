@@ -0,0 +1,88 @@
+"""
+Caché HTTP para lecturas públicas del catálogo: ETag, Last-Modified,
+respuestas 304 Not Modified y Cache-Control para navegadores y CDNs.
+
+La versión del catálogo se deriva de los productos (cantidad, id máximo y
+la última fecha de alta o modificación). Cualquier alta, edición, cambio
+de stock o baja la cambia y con ella todos los ETags de los listados.
+"""
+import hashlib
+import os
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Optional, Tuple
+from dotenv import load_dotenv
+from fastapi import Request
+from fastapi.responses import Response
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+from app.models.product import Product
+
+load_dotenv()
+
+# Segundos que navegadores y CDNs pueden reutilizar una respuesta sin revalidar,
+# y segundos extra en los que pueden servirla mientras revalidan en segundo plano
+CATALOG_MAX_AGE = int(os.getenv("CATALOG_MAX_AGE", "60"))
+CATALOG_STALE_WHILE_REVALIDATE = int(os.getenv("CATALOG_STALE_WHILE_REVALIDATE", "300"))
+
+def catalog_cache_control() -> str:
+    return f"public, max-age={CATALOG_MAX_AGE}, stale-while-revalidate={CATALOG_STALE_WHILE_REVALIDATE}"
+
+def catalog_version(db: Session) -> Tuple[str, Optional[datetime]]:
+    """(versión, última modificación) del catálogo con una sola consulta agregada"""
+    count, max_id, last_modified = db.execute(
+        select(
+            func.count(Product.id),
+            func.max(Product.id),
+            func.max(func.coalesce(Product.updated_at, Product.created_at)),
+        )
+    ).one()
+    if isinstance(last_modified, str):  # SQLite devuelve el agregado como texto
+        last_modified = datetime.fromisoformat(last_modified)
+    return f"{count}:{max_id}:{last_modified.isoformat() if last_modified else ''}", last_modified
+
+def product_version(product: Product) -> Tuple[str, Optional[datetime]]:
+    last_modified = product.updated_at or product.created_at
+    return f"{product.id}:{last_modified.isoformat() if last_modified else ''}", last_modified
+
+def make_etag(*parts) -> str:
+    """ETag débil: el mismo contenido puede viajar comprimido o sin comprimir"""
+    digest = hashlib.sha1("|".join(str(part) for part in parts).encode()).hexdigest()[:20]
+    return f'W/"{digest}"'
+
+def canonical_query(request: Request) -> str:
+    """Query string con los parámetros ordenados, para que ?a=1&b=2 y ?b=2&a=1 compartan ETag"""
+    return "&".join(f"{key}={value}" for key, value in sorted(request.query_params.multi_items()))
+
+def _http_date(value: datetime) -> str:
+    return format_datetime(value.replace(tzinfo=timezone.utc, microsecond=0), usegmt=True)
+
+def cache_headers(etag: str, last_modified: Optional[datetime], cache_control: str) -> dict:
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    if last_modified is not None:
+        headers["Last-Modified"] = _http_date(last_modified)
+    return headers
+
+def is_not_modified(request: Request, etag: str, last_modified: Optional[datetime]) -> bool:
+    """Evalúa If-None-Match (prioritario) o If-Modified-Since según RFC 9110"""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        if if_none_match.strip() == "*":
+            return True
+        # Comparación débil: se ignora el prefijo W/
+        candidates = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+        return etag.removeprefix("W/") in candidates
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and last_modified is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        if since.tzinfo is None:
+            since = since.replace(tzinfo=timezone.utc)
+        return last_modified.replace(tzinfo=timezone.utc, microsecond=0) <= since
+    return False
+
+def not_modified_response(headers: dict) -> Response:
+    return Response(status_code=304, headers=headers)
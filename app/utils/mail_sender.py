@@ -5,6 +5,10 @@ from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from dotenv import load_dotenv
 from typing import List, Any
+import threading
+from app.utils.circuit_breaker import get_breaker
+from app.utils.metrics import EMAILS_TOTAL
+from app.utils.tracing import tracer
 
 load_dotenv()
 
@@ -17,16 +21,38 @@ email_password = os.getenv("EMAIL_PASSWORD")
 if not email_address or not email_password:
     raise EnvironmentError("EMAIL_ADDRESS y EMAIL_PASSWORD deben estar configurados en el entorno.")
 
-def _send_email(message: MIMEMultipart, to_email: str) -> bool:
-    try:
+smtp_breaker = get_breaker("smtp")
+
+# Correos en curso de envío (profundidad de la cola de correo)
+_pending_emails = 0
+_pending_lock = threading.Lock()
+
+def mail_queue_depth() -> int:
+    return _pending_emails
+
+def _deliver(message: MIMEMultipart, to_email: str):
+    attributes = {"smtp.host": smtp_address, "smtp.subject": message["Subject"]}
+    with tracer.start_span("smtp.send", "client", attributes):
         context = ssl.create_default_context()
-        with smtplib.SMTP_SSL(smtp_address, smtp_port, context=context) as server:
+        with smtplib.SMTP_SSL(smtp_address, smtp_port, context=context, timeout=30) as server:
             server.login(email_address, email_password)
             server.sendmail(email_address, to_email, message.as_string())
+
+def _send_email(message: MIMEMultipart, to_email: str) -> bool:
+    global _pending_emails
+    with _pending_lock:
+        _pending_emails += 1
+    try:
+        smtp_breaker.call(_deliver, message, to_email)
+        EMAILS_TOTAL.inc(result="sent")
         return True
     except Exception as e:
+        EMAILS_TOTAL.inc(result="failed")
         print(f"[ERROR] Fallo al enviar correo a {to_email}: {e}")
         return False
+    finally:
+        with _pending_lock:
+            _pending_emails -= 1
 
 def send_order_confirmation(to_email: str, order_number: str, total_amount: float, items: List[Any]) -> bool:
     message = MIMEMultipart()
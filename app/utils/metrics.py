@@ -0,0 +1,318 @@
+import threading
+import time
+from contextvars import ContextVar
+from typing import Dict, Optional, Sequence, Tuple
+from sqlalchemy import event
+
+# Buckets por defecto (segundos), los mismos que usa el cliente oficial de Prometheus
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1.0, 2.5, 5.0, 7.5, 10.0)
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(f'{extra[0]}="{_escape(extra[1])}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def header(self):
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def render(self):
+        lines = self.header()
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def render(self):
+        lines = self.header()
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        # clave -> [conteos por bucket, suma, cantidad]
+        self._values: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            data = self._values.get(key)
+            if data is None:
+                data = [[0] * len(self.buckets), 0.0, 0]
+                self._values[key] = data
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    data[0][index] += 1
+                    break
+            data[1] += value
+            data[2] += 1
+
+    def count(self, **labels) -> int:
+        data = self._values.get(self._key(labels))
+        return data[2] if data else 0
+
+    def render(self):
+        lines = self.header()
+        with self._lock:
+            items = [(key, (list(data[0]), data[1], data[2])) for key, data in self._values.items()]
+        for key, (bucket_counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, bucket_counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labelnames, key, ("le", _format_value(bound)))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+registry = Registry()
+
+# Métricas HTTP
+HTTP_REQUESTS_TOTAL = registry.counter(
+    "http_requests_total", "Total de peticiones HTTP", ["method", "route", "status"]
+)
+HTTP_REQUEST_DURATION = registry.histogram(
+    "http_request_duration_seconds", "Latencia de las peticiones HTTP", ["method", "route"]
+)
+HTTP_REQUESTS_IN_FLIGHT = registry.gauge(
+    "http_requests_in_flight", "Peticiones HTTP en curso", ["method"]
+)
+
+# Métricas de base de datos
+DB_QUERIES_TOTAL = registry.counter(
+    "db_queries_total", "Total de sentencias SQL ejecutadas", ["route"]
+)
+DB_QUERY_DURATION = registry.histogram(
+    "db_query_duration_seconds", "Duración de las sentencias SQL", ["route"]
+)
+DB_QUERIES_PER_REQUEST = registry.histogram(
+    "db_queries_per_request", "Sentencias SQL por petición HTTP", ["route"], buckets=QUERY_COUNT_BUCKETS
+)
+DB_TIME_PER_REQUEST = registry.histogram(
+    "db_time_per_request_seconds", "Tiempo total en SQL por petición HTTP", ["route"]
+)
+
+# Métricas de negocio
+CHECKOUTS_TOTAL = registry.counter(
+    "checkouts_total", "Checkouts de carritos y creación de órdenes", ["kind", "result"]
+)
+PAYMENTS_TOTAL = registry.counter(
+    "payments_total", "Eventos de pago procesados", ["event", "status"]
+)
+EMAILS_TOTAL = registry.counter(
+    "emails_total", "Correos enviados", ["result"]
+)
+CART_STORE_FLUSHED_TOTAL = registry.counter(
+    "cart_store_flushed_total", "Carritos del almacén caliente escritos en la base", ["result"]
+)
+OUTBOX_EVENTS_TOTAL = registry.counter(
+    "outbox_events_total", "Eventos de dominio por resultado (recorded, published, retry, dead)", ["event_type", "result"]
+)
+OUTBOX_LAG = registry.histogram(
+    "outbox_lag_seconds", "Tiempo entre que se guarda un evento y se publica", ["event_type"]
+)
+JOBS_TOTAL = registry.counter(
+    "jobs_total", "Tareas en segundo plano por resultado (enqueued, done, retry, dead)", ["name", "result"]
+)
+JOB_DURATION = registry.histogram(
+    "job_duration_seconds", "Duración de las tareas en segundo plano", ["name"]
+)
+SCHEDULED_RUNS_TOTAL = registry.counter(
+    "scheduled_runs_total", "Ejecuciones de tareas programadas por resultado (ok, error, skipped)", ["name", "result"]
+)
+SCHEDULED_RUN_DURATION = registry.histogram(
+    "scheduled_run_duration_seconds", "Duración de las tareas programadas", ["name"],
+    buckets=(0.1, 0.5, 1.0, 5.0, 15.0, 60.0, 300.0, 900.0, 3600.0)
+)
+REAPER_ROWS_TOTAL = registry.counter(
+    "reaper_rows_total", "Filas vencidas por la limpieza periódica", ["kind"]
+)
+IDEMPOTENCY_TOTAL = registry.counter(
+    "idempotency_requests_total", "Peticiones con Idempotency-Key por resultado", ["scope", "result"]
+)
+
+class _RequestStats:
+    __slots__ = ("scope", "queries", "db_time")
+
+    def __init__(self, scope):
+        self.scope = scope
+        self.queries = 0
+        self.db_time = 0.0
+
+_request_stats: ContextVar[Optional[_RequestStats]] = ContextVar("request_stats", default=None)
+
+def _route_template(scope) -> str:
+    route = scope.get("route")
+    return getattr(route, "path", None) or "unmatched"
+
+class MetricsMiddleware:
+    """
+    Middleware ASGI que registra cantidad de peticiones, latencia por ruta,
+    peticiones en curso y sentencias SQL ejecutadas por petición.
+    Se etiqueta con la plantilla de la ruta (/orders/{order_id}) para no
+    crear una serie por cada ID.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        stats = _RequestStats(scope)
+        token = _request_stats.set(stats)
+        status_holder = {"status": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status_holder["status"] = message["status"]
+            await send(message)
+
+        HTTP_REQUESTS_IN_FLIGHT.inc(method=method)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            HTTP_REQUESTS_IN_FLIGHT.dec(method=method)
+            _request_stats.reset(token)
+            route = _route_template(scope)
+            HTTP_REQUESTS_TOTAL.inc(method=method, route=route, status=status_holder["status"])
+            HTTP_REQUEST_DURATION.observe(elapsed, method=method, route=route)
+            DB_QUERIES_PER_REQUEST.observe(stats.queries, route=route)
+            DB_TIME_PER_REQUEST.observe(stats.db_time, route=route)
+            if stats.queries:
+                DB_QUERIES_TOTAL.inc(stats.queries, route=route)
+
+def instrument_engine(engine):
+    """Registra los eventos de SQLAlchemy que miden cantidad y duración de las sentencias"""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("metrics_query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        starts = conn.info.get("metrics_query_start")
+        if not starts:
+            return
+        elapsed = time.perf_counter() - starts.pop()
+        stats = _request_stats.get()
+        if stats is not None:
+            stats.queries += 1
+            stats.db_time += elapsed
+            DB_QUERY_DURATION.observe(elapsed, route=_route_template(stats.scope))
+        else:
+            DB_QUERIES_TOTAL.inc(route="background")
+            DB_QUERY_DURATION.observe(elapsed, route="background")
+
+    @event.listens_for(engine, "handle_error")
+    def _handle_error(exception_context):
+        connection = exception_context.connection
+        if connection is not None:
+            starts = connection.info.get("metrics_query_start")
+            if starts:
+                starts.pop()
+
+def render_metrics() -> str:
+    return registry.render()
@@ -0,0 +1,175 @@
+import logging
+import os
+import re
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import List, Optional
+from dotenv import load_dotenv
+from sqlalchemy import event
+
+load_dotenv()
+
+logger = logging.getLogger("app.profiler")
+
+# Solo para desarrollo / staging: agrega sobrecarga en cada sentencia SQL
+SQL_PROFILER_ENABLED = os.getenv("SQL_PROFILER", "false").lower() in ("1", "true", "yes")
+# Repeticiones de una misma forma de SELECT a partir de las cuales se marca un N+1
+N_PLUS_ONE_THRESHOLD = int(os.getenv("SQL_PROFILER_N_PLUS_ONE_THRESHOLD", "3"))
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"\b\d+(?:\.\d+)?\b")
+_BIND_PARAM = re.compile(r"%\(\w+\)s|:\w+|\$\d+|\?|__\[POSTCOMPILE_\w+\]")
+_IN_LIST = re.compile(r"IN \((?:\s*\?\s*,?)+\)", re.IGNORECASE)
+_WHITESPACE = re.compile(r"\s+")
+
+def statement_shape(statement: str) -> str:
+    """Normaliza una sentencia SQL quitando literales y parámetros para agrupar repeticiones"""
+    shape = _STRING_LITERAL.sub("?", statement)
+    shape = _BIND_PARAM.sub("?", shape)
+    shape = _NUMBER_LITERAL.sub("?", shape)
+    shape = _WHITESPACE.sub(" ", shape).strip()
+    shape = _IN_LIST.sub("IN (...)", shape)
+    return shape
+
+class QueryProfile:
+    """Sentencias ejecutadas durante una petición (o un bloque de código)"""
+
+    def __init__(self, name: str = ""):
+        self.name = name
+        self.statements: List[tuple] = []
+        self._lock = threading.Lock()
+
+    def record(self, statement: str, duration: float):
+        with self._lock:
+            self.statements.append((statement_shape(statement), duration))
+
+    @property
+    def count(self) -> int:
+        return len(self.statements)
+
+    @property
+    def total_time(self) -> float:
+        return sum(duration for _, duration in self.statements)
+
+    def shapes(self) -> Counter:
+        return Counter(shape for shape, _ in self.statements)
+
+    def n_plus_one(self, threshold: int = None) -> List[tuple]:
+        """Formas de SELECT repetidas `threshold` o más veces: (forma, repeticiones)"""
+        threshold = threshold or N_PLUS_ONE_THRESHOLD
+        return [
+            (shape, repeats)
+            for shape, repeats in self.shapes().most_common()
+            if repeats >= threshold and shape.upper().startswith("SELECT")
+        ]
+
+    def report(self) -> str:
+        lines = [f"{self.name}: {self.count} sentencias en {self.total_time * 1000:.1f} ms"]
+        for shape, repeats in self.shapes().most_common(10):
+            lines.append(f"  {repeats:>4}x {shape[:200]}")
+        suspects = self.n_plus_one()
+        if suspects:
+            lines.append(f"  Posible N+1 en {len(suspects)} forma(s) de consulta")
+        return "\n".join(lines)
+
+_current_profile: ContextVar[Optional[QueryProfile]] = ContextVar("current_query_profile", default=None)
+# Perfiles que reciben todas las sentencias del proceso (usados por el plugin de pytest)
+_global_profiles: List[QueryProfile] = []
+_global_lock = threading.Lock()
+_instrumented_engines = set()
+
+def instrument_engine(engine):
+    """Registra los eventos de SQLAlchemy del profiler (idempotente)"""
+    if id(engine) in _instrumented_engines:
+        return
+    _instrumented_engines.add(id(engine))
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("profiler_query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        starts = conn.info.get("profiler_query_start")
+        if not starts:
+            return
+        elapsed = time.perf_counter() - starts.pop()
+        profile = _current_profile.get()
+        if profile is not None:
+            profile.record(statement, elapsed)
+        if _global_profiles:
+            with _global_lock:
+                profiles = list(_global_profiles)
+            for global_profile in profiles:
+                global_profile.record(statement, elapsed)
+
+    @event.listens_for(engine, "handle_error")
+    def _handle_error(exception_context):
+        connection = exception_context.connection
+        if connection is not None:
+            starts = connection.info.get("profiler_query_start")
+            if starts:
+                starts.pop()
+
+@contextmanager
+def profile_queries(name: str = "bloque", process_wide: bool = False):
+    """
+    Perfila las sentencias ejecutadas dentro del bloque.
+    Con process_wide=True captura también las de otros hilos (por ejemplo
+    las de la app cuando se usa TestClient).
+    """
+    profile = QueryProfile(name)
+    if process_wide:
+        with _global_lock:
+            _global_profiles.append(profile)
+        try:
+            yield profile
+        finally:
+            with _global_lock:
+                _global_profiles.remove(profile)
+    else:
+        token = _current_profile.set(profile)
+        try:
+            yield profile
+        finally:
+            _current_profile.reset(token)
+
+class QueryProfilerMiddleware:
+    """
+    Middleware ASGI que cuenta las sentencias SQL de cada petición y agrega
+    las cabeceras X-Query-Count, X-Query-Time-Ms y X-N-Plus-One.
+    Si detecta un posible N+1 escribe el detalle en el log.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        profile = QueryProfile(f"{scope['method']} {scope['path']}")
+        token = _current_profile.set(profile)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                suspects = profile.n_plus_one()
+                headers = list(message.get("headers", []))
+                headers.append((b"x-query-count", str(profile.count).encode()))
+                headers.append((b"x-query-time-ms", f"{profile.total_time * 1000:.1f}".encode()))
+                headers.append((b"x-n-plus-one", str(len(suspects)).encode()))
+                message["headers"] = headers
+                if suspects:
+                    logger.warning("Posible N+1 detectado\n%s", profile.report())
+                else:
+                    logger.debug(profile.report())
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current_profile.reset(token)
@@ -0,0 +1,65 @@
+"""
+Plugin de pytest para fijar presupuestos de consultas SQL por endpoint.
+
+Activación (en conftest.py o con `pytest -p app.utils.pytest_query_budget`):
+
+    pytest_plugins = ["app.utils.pytest_query_budget"]
+
+Uso con el fixture:
+
+    def test_listado_productos(client, query_budget):
+        with query_budget(max_queries=2):
+            client.get("/products/")
+
+Uso con el marcador (aplica a todo el test):
+
+    @pytest.mark.query_budget(max_queries=5, allow_n_plus_one=False)
+    def test_detalle_orden(client):
+        ...
+"""
+from contextlib import contextmanager
+import pytest
+from app.utils.profiler import instrument_engine, profile_queries
+
+def _assert_budget(profile, max_queries, allow_n_plus_one):
+    if max_queries is not None and profile.count > max_queries:
+        pytest.fail(
+            f"Presupuesto de consultas excedido: {profile.count} > {max_queries}\n{profile.report()}",
+            pytrace=False
+        )
+    if not allow_n_plus_one and profile.n_plus_one():
+        pytest.fail(f"Patrón N+1 detectado\n{profile.report()}", pytrace=False)
+
+@contextmanager
+def _budget(name, max_queries=None, allow_n_plus_one=False):
+    with profile_queries(name, process_wide=True) as profile:
+        yield profile
+    _assert_budget(profile, max_queries, allow_n_plus_one)
+
+def pytest_configure(config):
+    config.addinivalue_line(
+        "markers",
+        "query_budget(max_queries=None, allow_n_plus_one=False): "
+        "falla el test si ejecuta más sentencias SQL que el presupuesto o si detecta un N+1"
+    )
+    from app.database import engine
+    instrument_engine(engine)
+
+@pytest.fixture
+def query_budget(request):
+    """Devuelve un context manager que verifica el presupuesto de consultas del bloque"""
+    def factory(max_queries=None, allow_n_plus_one=False):
+        return _budget(request.node.nodeid, max_queries, allow_n_plus_one)
+    return factory
+
+@pytest.hookimpl(wrapper=True)
+def pytest_runtest_call(item):
+    marker = item.get_closest_marker("query_budget")
+    if marker is None:
+        return (yield)
+    max_queries = marker.kwargs.get("max_queries", marker.args[0] if marker.args else None)
+    allow_n_plus_one = marker.kwargs.get("allow_n_plus_one", False)
+    with profile_queries(item.nodeid, process_wide=True) as profile:
+        result = yield
+    _assert_budget(profile, max_queries, allow_n_plus_one)
+    return result
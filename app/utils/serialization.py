@@ -0,0 +1,78 @@
+"""
+Ruta rápida de serialización JSON (opcional, FAST_JSON=true).
+
+- Serializadores precompilados: un TypeAdapter por schema, construido una
+  sola vez, que valida los objetos del ORM y los escribe directamente a
+  bytes JSON con el núcleo en Rust de Pydantic (sin dict intermedio ni
+  json.dumps). Los schemas más usados (Product, Cart, OrderDetail) se
+  compilan al importar el módulo.
+- Clase de respuesta por defecto: las versiones de FastAPI que ya
+  serializan con dump_json cuando hay response_model no necesitan nada (y
+  ORJSONResponse desactivaría esa ruta); en versiones anteriores se usa
+  ORJSONResponse si orjson está instalado.
+
+Costo por schema y tamaño de payload: python -m benchmarks.serialization
+"""
+import inspect
+import os
+from functools import lru_cache
+from typing import Any, List
+from dotenv import load_dotenv
+from fastapi import routing
+from fastapi.responses import Response
+from pydantic import TypeAdapter
+from app.schemas.product import Product
+from app.schemas.cart import Cart
+from app.schemas.order import OrderDetail, OrderSummary
+
+try:
+    import orjson
+except ImportError:  # orjson es opcional
+    orjson = None
+
+load_dotenv()
+
+FAST_JSON_ENABLED = os.getenv("FAST_JSON", "false").lower() == "true"
+
+# FastAPI >= 0.130 serializa los response_model directo a bytes con Pydantic
+NATIVE_JSON_SERIALIZATION = "dump_json" in inspect.signature(routing.serialize_response).parameters
+
+class PrecompiledSerializer:
+    """Valida (desde atributos del ORM) y serializa a bytes JSON con un TypeAdapter reutilizable"""
+
+    def __init__(self, schema):
+        self.schema = schema
+        self.adapter = TypeAdapter(schema)
+
+    def dump(self, data: Any) -> bytes:
+        return self.adapter.dump_json(self.adapter.validate_python(data, from_attributes=True))
+
+@lru_cache(maxsize=None)
+def get_serializer(schema) -> PrecompiledSerializer:
+    return PrecompiledSerializer(schema)
+
+HOT_SCHEMAS = [Product, List[Product], Cart, List[Cart], OrderDetail, List[OrderSummary]]
+for _schema in HOT_SCHEMAS:
+    get_serializer(_schema)
+
+def fast_json(schema, data: Any, status_code: int = 200, headers: dict = None):
+    """
+    Con FAST_JSON=true devuelve una Response ya serializada con el
+    serializador precompilado de `schema`; si no, devuelve `data` tal cual
+    para que FastAPI lo serialice con el response_model de la ruta.
+    """
+    if not FAST_JSON_ENABLED:
+        return data
+    return Response(
+        content=get_serializer(schema).dump(data),
+        status_code=status_code,
+        headers=headers,
+        media_type="application/json"
+    )
+
+def app_options() -> dict:
+    """Argumentos extra para FastAPI(): la clase de respuesta por defecto cuando conviene cambiarla"""
+    if not FAST_JSON_ENABLED or NATIVE_JSON_SERIALIZATION or orjson is None:
+        return {}
+    from fastapi.responses import ORJSONResponse
+    return {"default_response_class": ORJSONResponse}
@@ -0,0 +1,66 @@
+"""
+Respuestas en streaming para listados grandes de administración.
+
+En vez de cargar toda la lista, validarla y serializarla de una vez, se
+recorre la consulta con yield_per (cursor del lado del servidor) y se
+serializa fila por fila, enviando cada lote apenas está listo:
+
+- NDJSON (un objeto JSON por línea) si el cliente pide
+  `Accept: application/x-ndjson` o `?stream=ndjson`.
+- Arreglo JSON en streaming (mismo formato que la respuesta normal) con
+  `?stream=json`.
+"""
+import os
+from typing import Iterator, Optional, Type
+from dotenv import load_dotenv
+from fastapi import Request
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+from app.database import SessionLocal
+
+load_dotenv()
+
+STREAM_BATCH_SIZE = int(os.getenv("STREAM_BATCH_SIZE", "500"))
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+def stream_mode(request: Request) -> Optional[str]:
+    """"ndjson", "json" o None (respuesta normal) según la query `stream` o el header Accept"""
+    requested = request.query_params.get("stream")
+    if requested in ("ndjson", "json"):
+        return requested
+    if NDJSON_MEDIA_TYPE in request.headers.get("accept", ""):
+        return "ndjson"
+    return None
+
+def _iter_models(statement, schema: Type[BaseModel], batch_size: int) -> Iterator[list]:
+    # Sesión propia: vive lo que dura el streaming, no lo que la dependencia get_db
+    db = SessionLocal()
+    try:
+        result = db.execute(statement.execution_options(yield_per=batch_size)).scalars()
+        for partition in result.partitions(batch_size):
+            yield [schema.model_validate(row).model_dump_json() for row in partition]
+    finally:
+        db.close()
+
+def _ndjson(statement, schema: Type[BaseModel], batch_size: int) -> Iterator[str]:
+    for lines in _iter_models(statement, schema, batch_size):
+        yield "\n".join(lines) + "\n"
+
+def _json_array(statement, schema: Type[BaseModel], batch_size: int) -> Iterator[str]:
+    yield "["
+    first = True
+    for lines in _iter_models(statement, schema, batch_size):
+        yield ("" if first else ",") + ",".join(lines)
+        first = False
+    yield "]"
+
+def streaming_response(
+    statement,
+    schema: Type[BaseModel],
+    mode: str = "ndjson",
+    batch_size: int = STREAM_BATCH_SIZE
+) -> StreamingResponse:
+    """StreamingResponse que serializa `statement` (un select del ORM) con `schema`, lote a lote"""
+    if mode == "json":
+        return StreamingResponse(_json_array(statement, schema, batch_size), media_type="application/json")
+    return StreamingResponse(_ndjson(statement, schema, batch_size), media_type=NDJSON_MEDIA_TYPE)
@@ -0,0 +1,276 @@
+import functools
+import inspect
+import json
+import os
+import random
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+from dotenv import load_dotenv
+from sqlalchemy import event
+
+load_dotenv()
+
+# Configuración de trazas
+TRACING_ENABLED = os.getenv("TRACING_ENABLED", "false").lower() in ("1", "true", "yes")
+# Muestreo en la raíz (head sampling): fracción de peticiones que se trazan
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0.1"))
+# Exportador: memory (últimos N spans en memoria) o file (JSON por línea)
+TRACE_EXPORTER = os.getenv("TRACE_EXPORTER", "memory")
+TRACE_FILE = os.getenv("TRACE_FILE", "traces.jsonl")
+TRACE_MEMORY_LIMIT = int(os.getenv("TRACE_MEMORY_LIMIT", "5000"))
+# Largo máximo del SQL que se guarda en cada span
+TRACE_SQL_MAX_LENGTH = 500
+
+def _random_id(bits: int) -> str:
+    return f"{random.getrandbits(bits):0{bits // 4}x}"
+
+class Span:
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str], kind: str = "internal", attributes: dict = None):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = _random_id(64)
+        self.parent_id = parent_id
+        self.kind = kind
+        self.attributes = dict(attributes or {})
+        self.status = "ok"
+        self.error = None
+        self.start_time = time.time()
+        self._start = time.perf_counter()
+        self.duration_ms = None
+        self.sampled = True
+
+    def set_attribute(self, key: str, value):
+        self.attributes[key] = value
+
+    def record_exception(self, error: BaseException):
+        self.status = "error"
+        self.error = f"{type(error).__name__}: {error}"
+
+    def end(self):
+        if self.duration_ms is None:
+            self.duration_ms = round((time.perf_counter() - self._start) * 1000, 3)
+            tracer.exporter.export(self)
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "kind": self.kind,
+            "start_time": self.start_time,
+            "duration_ms": self.duration_ms,
+            "status": self.status,
+            "error": self.error,
+            "attributes": self.attributes,
+        }
+
+class NonRecordingSpan:
+    """Span de una traza no muestreada: propaga el contexto pero no exporta nada"""
+
+    sampled = False
+
+    def __init__(self, trace_id: str, span_id: str = None):
+        self.trace_id = trace_id
+        self.span_id = span_id or _random_id(64)
+        self.name = ""
+        self.attributes = {}
+
+    def set_attribute(self, key: str, value):
+        pass
+
+    def record_exception(self, error: BaseException):
+        pass
+
+    def end(self):
+        pass
+
+class InMemorySpanExporter:
+    def __init__(self, limit: int = TRACE_MEMORY_LIMIT):
+        self.spans = deque(maxlen=limit)
+
+    def export(self, span: Span):
+        self.spans.append(span.to_dict())
+
+    def get_trace(self, trace_id: str) -> list:
+        return [span for span in list(self.spans) if span["trace_id"] == trace_id]
+
+    def clear(self):
+        self.spans.clear()
+
+class FileSpanExporter:
+    def __init__(self, path: str = TRACE_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def export(self, span: Span):
+        line = json.dumps(span.to_dict(), default=str)
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as file:
+                file.write(line + "\n")
+
+class NoopSpanExporter:
+    def export(self, span: Span):
+        pass
+
+_current_span: ContextVar = ContextVar("current_span", default=None)
+
+class Tracer:
+    def __init__(self, enabled: bool, sample_rate: float, exporter):
+        self.enabled = enabled
+        self.sample_rate = sample_rate
+        self.exporter = exporter
+
+    def _new_span(self, name: str, kind: str, attributes: dict, parent=None, remote: tuple = None):
+        parent = parent if parent is not None else _current_span.get()
+        if parent is not None:
+            if not parent.sampled:
+                return NonRecordingSpan(parent.trace_id)
+            return Span(name, parent.trace_id, parent.span_id, kind, attributes)
+        if remote is not None:
+            # Contexto recibido en la cabecera traceparent: se respeta su decisión de muestreo
+            trace_id, parent_id, sampled = remote
+            if not sampled:
+                return NonRecordingSpan(trace_id)
+            return Span(name, trace_id, parent_id, kind, attributes)
+        trace_id = _random_id(128)
+        if not self.enabled or random.random() >= self.sample_rate:
+            return NonRecordingSpan(trace_id)
+        return Span(name, trace_id, None, kind, attributes)
+
+    @contextmanager
+    def start_span(self, name: str, kind: str = "internal", attributes: dict = None, remote: tuple = None):
+        """Crea un span hijo del span actual y lo deja como actual dentro del bloque"""
+        span = self._new_span(name, kind, attributes, remote=remote)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.record_exception(e)
+            raise
+        finally:
+            _current_span.reset(token)
+            span.end()
+
+    def start_detached_span(self, name: str, kind: str = "internal", attributes: dict = None):
+        """Crea un span hijo del actual sin cambiar el contexto (para eventos de SQLAlchemy)"""
+        return self._new_span(name, kind, attributes)
+
+def _build_exporter():
+    if TRACE_EXPORTER == "file":
+        return FileSpanExporter(TRACE_FILE)
+    if TRACE_EXPORTER == "memory":
+        return InMemorySpanExporter(TRACE_MEMORY_LIMIT)
+    return NoopSpanExporter()
+
+tracer = Tracer(TRACING_ENABLED, TRACE_SAMPLE_RATE, _build_exporter())
+
+def current_span():
+    return _current_span.get()
+
+def traced(name: str, kind: str = "internal"):
+    """Decorador que envuelve la función (sync o async) en un span"""
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with tracer.start_span(name, kind):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with tracer.start_span(name, kind):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def _parse_traceparent(value: str):
+    # Formato W3C: version-trace_id-parent_id-flags
+    parts = value.split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    try:
+        sampled = bool(int(parts[3], 16) & 1)
+    except ValueError:
+        return None
+    return parts[1], parts[2], sampled
+
+class TracingMiddleware:
+    """
+    Middleware ASGI que abre el span raíz de cada petición (que cubre el
+    handler de la ruta). Respeta la cabecera traceparent entrante y devuelve
+    el trace id en X-Trace-Id.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        remote = None
+        for key, value in scope.get("headers", []):
+            if key == b"traceparent":
+                remote = _parse_traceparent(value.decode("latin-1"))
+                break
+
+        attributes = {"http.method": scope["method"], "http.target": scope["path"]}
+        with tracer.start_span(f"{scope['method']} {scope['path']}", "server", attributes, remote=remote) as span:
+            async def send_wrapper(message):
+                if message["type"] == "http.response.start":
+                    span.set_attribute("http.status_code", message["status"])
+                    if span.sampled:
+                        headers = list(message.get("headers", []))
+                        headers.append((b"x-trace-id", span.trace_id.encode()))
+                        message["headers"] = headers
+                await send(message)
+
+            try:
+                await self.app(scope, receive, send_wrapper)
+            finally:
+                route = scope.get("route")
+                if span.sampled and getattr(route, "path", None):
+                    span.name = f"{scope['method']} {route.path}"
+                    span.set_attribute("http.route", route.path)
+                    endpoint = getattr(route, "endpoint", None)
+                    if endpoint is not None:
+                        span.set_attribute("code.function", f"{endpoint.__module__}.{endpoint.__name__}")
+
+def instrument_engine(engine):
+    """Un span por cada sentencia SQL ejecutada dentro de una traza muestreada"""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        parent = _current_span.get()
+        if parent is None or not parent.sampled:
+            return
+        span = tracer.start_detached_span(
+            "db.query",
+            "client",
+            {"db.system": engine.dialect.name, "db.statement": statement[:TRACE_SQL_MAX_LENGTH]}
+        )
+        conn.info.setdefault("tracing_spans", []).append(span)
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        spans = conn.info.get("tracing_spans")
+        if spans:
+            span = spans.pop()
+            span.set_attribute("db.rowcount", cursor.rowcount)
+            span.end()
+
+    @event.listens_for(engine, "handle_error")
+    def _handle_error(exception_context):
+        connection = exception_context.connection
+        spans = connection.info.get("tracing_spans") if connection is not None else None
+        if spans:
+            span = spans.pop()
+            span.record_exception(exception_context.original_exception)
+            span.end()
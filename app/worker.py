@@ -0,0 +1,88 @@
+"""
+Worker de tareas en segundo plano (cola en la tabla jobs, ver
+app/services/jobs.py). Se pueden correr varios en paralelo, en la misma
+máquina o en otras.
+
+    python -m app.worker --concurrency 4
+    python -m app.worker --burst              # ejecuta lo pendiente y termina
+    python -m app.worker --retry-dead         # reencola las tareas descartadas
+    python -m app.worker --metrics-port 9100  # expone /metrics del worker
+    python -m app.worker --relay              # además publica los eventos del outbox
+"""
+import argparse
+import os
+import signal
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from dotenv import load_dotenv
+from app.database import SessionLocal
+from app.services import jobs, outbox
+from app.services import tasks, subscribers  # noqa: F401  registra las tareas y los suscriptores
+from app.utils.metrics import render_metrics
+
+load_dotenv()
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path != "/metrics":
+            self.send_error(404)
+            return
+        body = render_metrics().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def serve_metrics(port: int):
+    server = ThreadingHTTPServer(("0.0.0.0", port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="worker-metrics", daemon=True).start()
+
+def main():
+    parser = argparse.ArgumentParser(description="Worker de tareas en segundo plano")
+    parser.add_argument("--concurrency", type=int, default=jobs.JOB_WORKER_CONCURRENCY)
+    parser.add_argument("--poll-interval", type=float, default=jobs.JOB_POLL_INTERVAL)
+    parser.add_argument("--burst", action="store_true", help="Ejecuta las tareas listas y termina")
+    parser.add_argument("--retry-dead", nargs="*", type=int, metavar="JOB_ID",
+                        help="Reencola las tareas descartadas (todas o las indicadas) y termina")
+    parser.add_argument("--relay", action="store_true",
+                        help="Publica también los eventos del outbox (con OUTBOX_RELAY_ENABLED=false en la API)")
+    parser.add_argument("--metrics-port", type=int, default=int(os.getenv("JOB_WORKER_METRICS_PORT", "0")))
+    args = parser.parse_args()
+
+    if args.retry_dead is not None:
+        db = SessionLocal()
+        try:
+            print(f"Listo: {jobs.retry_dead(db, args.retry_dead)} tareas reencoladas")
+        finally:
+            db.close()
+        return
+
+    worker = jobs.Worker(concurrency=args.concurrency, poll_interval=args.poll_interval)
+    if args.burst:
+        if args.relay:
+            print(f"Listo: {outbox.relay.drain()} eventos publicados")
+        print(f"Listo: {worker.run_burst()} tareas ejecutadas")
+        return
+
+    def shutdown():
+        outbox.relay.stop()
+        worker.stop()
+
+    if args.metrics_port:
+        serve_metrics(args.metrics_port)
+    signal.signal(signal.SIGTERM, lambda *_: shutdown())
+    if args.relay:
+        outbox.relay.start()
+    worker.start()
+    print(f"Worker {worker.name} con {args.concurrency} hilos" + (" y relay del outbox" if args.relay else ""))
+    try:
+        worker.wait()
+    except KeyboardInterrupt:
+        shutdown()
+
+if __name__ == "__main__":
+    main()
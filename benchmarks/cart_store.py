@@ -0,0 +1,128 @@
+"""
+Ediciones de carrito por segundo: transacción en la base por cada cambio
+(comportamiento por defecto) contra el almacén caliente en memoria con
+escritura diferida en lotes (CART_STORE=memory). Cada edición es una
+operación add / update / remove al azar sobre uno de `--carts` carritos
+activos, aplicada desde `--workers` hilos con su propia sesión, como una
+petición. Para el almacén se mide además cuánto tarda en escribir todo lo
+pendiente.
+
+    python -m benchmarks.cart_store --carts 200 --edits 5000 --workers 8
+"""
+import argparse
+import random
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import insert, select
+from sqlalchemy.orm.exc import StaleDataError
+from benchmarks.common import seed
+from app.database import SessionLocal
+from app.models.cart import Cart
+from app.models.product import Product
+from app.models.user import User
+from app.schemas.cart import CartOperation
+from app.services import cart_store
+from app.services import carts as cart_service
+from app.utils.concurrency import with_retry
+
+def create_carts(count: int) -> list:
+    db = SessionLocal()
+    try:
+        user_ids = db.execute(select(User.id).limit(count)).scalars().all()
+        result = db.execute(
+            insert(Cart).returning(Cart.id, Cart.user_id),
+            [{"user_id": user_id, "status": "active", "subtotal": 0.0, "discount_percent": 0.0,
+              "discount_amount": 0.0, "total": 0.0} for user_id in user_ids]
+        )
+        carts = [(row.id, row.user_id) for row in result]
+        db.commit()
+        return carts
+    finally:
+        db.close()
+
+def random_operation(rng: random.Random, product_ids: list) -> CartOperation:
+    op = rng.choices(["add", "update", "remove"], weights=[6, 3, 1])[0]
+    product_id = rng.choice(product_ids)
+    if op == "update":
+        # update de un producto que no está en el carrito es un 404: se cuenta como edición rechazada
+        return CartOperation(op="update", product_id=product_id, quantity=rng.randint(1, 5))
+    return CartOperation(op=op, product_id=product_id, quantity=rng.randint(1, 3))
+
+def database_edit(cart_id: int, user_id: int, operation: CartOperation):
+    # Igual que la ruta: sin bloqueo de fila y con reintento si otra edición gana la carrera
+    def work(db):
+        cart = cart_service.get_active_cart(db, cart_id, user_id)
+        cart_service.apply_operations(db, cart, [operation])
+
+    db = SessionLocal()
+    try:
+        with_retry(db, work, attempts=10)
+    except (cart_service.CartOperationError, StaleDataError):
+        db.rollback()
+    finally:
+        db.close()
+
+def store_edit(cart_id: int, user_id: int, operation: CartOperation):
+    db = SessionLocal()
+    try:
+        cart_store.apply_operations(db, cart_id, user_id, [operation])
+    except cart_service.CartOperationError:
+        pass
+    finally:
+        db.close()
+
+def run(label: str, edit, carts: list, product_ids: list, edits: int, workers: int, seed_value: int):
+    rng = random.Random(seed_value)
+    plan = [(rng.choice(carts), random_operation(rng, product_ids)) for _ in range(edits)]
+    latencies = []
+
+    def attempt(step):
+        (cart_id, user_id), operation = step
+        start = time.perf_counter()
+        edit(cart_id, user_id, operation)
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        list(pool.map(attempt, plan))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    p99 = latencies[int(len(latencies) * 0.99) - 1]
+    print(
+        f"{label:<28} {edits / elapsed:>8.0f} ediciones/s  p50 {statistics.median(latencies):>7.2f} ms  "
+        f"p99 {p99:>7.2f} ms"
+    )
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de ediciones de carrito: base vs almacén caliente")
+    parser.add_argument("--carts", type=int, default=200)
+    parser.add_argument("--edits", type=int, default=5000)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--batch-size", type=int, default=cart_store.CART_STORE_FLUSH_BATCH)
+    args = parser.parse_args()
+
+    seed(orders=1000, users=max(1000, args.carts))
+    db = SessionLocal()
+    try:
+        product_ids = db.execute(select(Product.id).where(Product.is_active.is_(True)).limit(50)).scalars().all()
+    finally:
+        db.close()
+
+    print(f"{args.edits} ediciones sobre {args.carts} carritos ({args.workers} hilos)")
+    run("transacción por edición", database_edit, create_carts(args.carts), product_ids, args.edits, args.workers, 1)
+
+    cart_store.store = cart_store.MemoryCartStore()
+    run("almacén en memoria", store_edit, create_carts(args.carts), product_ids, args.edits, args.workers, 1)
+
+    db = SessionLocal()
+    try:
+        start = time.perf_counter()
+        written = cart_store.flush_all(db, args.batch_size)
+        elapsed = (time.perf_counter() - start) * 1000
+    finally:
+        db.close()
+    print(f"{'write-behind':<28} {written} carritos escritos en {elapsed:.1f} ms (lotes de {args.batch_size})")
+
+if __name__ == "__main__":
+    main()
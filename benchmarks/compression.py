@@ -0,0 +1,65 @@
+"""
+Bytes transferidos y CPU de compresión por algoritmo y nivel para las
+respuestas típicas de /orders/management/ (órdenes con items, productos y
+usuario) y /products/. Los cuerpos se generan con los mismos schemas y
+opciones de carga que las rutas.
+
+    python -m benchmarks.compression --orders 5000 --limit 100
+"""
+import argparse
+from typing import List
+from pydantic import TypeAdapter
+from sqlalchemy import select
+from benchmarks.common import seed, timed
+from app.database import SessionLocal
+from app.models.orders import Order
+from app.models.product import Product
+from app.routers.order_management import _order_load_options
+from app.schemas.order import OrderDetail
+from app.schemas.product import Product as ProductSchema
+from app.utils.compression import ENCODERS, compress
+
+LEVELS = {
+    "gzip": [1, 6, 9],
+    "br": [1, 4, 8],
+    "zstd": [1, 3, 10],
+}
+
+def payloads(limit: int) -> dict:
+    db = SessionLocal()
+    try:
+        orders = db.execute(
+            select(Order).options(*_order_load_options()).order_by(Order.created_at.desc()).limit(limit)
+        ).scalars().all()
+        products = db.execute(select(Product).limit(limit)).scalars().all()
+        return {
+            f"/orders/management/?limit={limit}": TypeAdapter(List[OrderDetail]).dump_json(
+                TypeAdapter(List[OrderDetail]).validate_python(orders, from_attributes=True)
+            ),
+            f"/products/?limit={limit}": TypeAdapter(List[ProductSchema]).dump_json(
+                TypeAdapter(List[ProductSchema]).validate_python(products, from_attributes=True)
+            ),
+        }
+    finally:
+        db.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de compresión de respuestas JSON")
+    parser.add_argument("--orders", type=int, default=5000)
+    parser.add_argument("--limit", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    seed(orders=args.orders)
+    print(f"Algoritmos disponibles: {', '.join(ENCODERS)}")
+    for path, body in payloads(args.limit).items():
+        print(f"\n{path}: {len(body)} bytes sin comprimir")
+        print(f"{'algoritmo':<10} {'nivel':>5} {'bytes':>10} {'ratio':>7} {'CPU ms':>8} {'MB/s':>8}")
+        for encoding in ENCODERS:
+            for level in LEVELS[encoding]:
+                elapsed, compressed = timed(lambda: compress(body, encoding, level), args.repeat)
+                throughput = len(body) / 1_000_000 / (elapsed / 1000) if elapsed else float("inf")
+                print(f"{encoding:<10} {level:>5} {len(compressed):>10} {len(body) / len(compressed):>7.1f} {elapsed:>8.2f} {throughput:>8.1f}")
+
+if __name__ == "__main__":
+    main()
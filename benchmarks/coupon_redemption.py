@@ -0,0 +1,112 @@
+"""
+Prueba de carga: muchos canjes concurrentes de un mismo código de cupón.
+
+Compara el canje anterior (leer current_uses, sumar 1 en Python y
+confirmar) con el UPDATE condicional de app.services.coupons. Cada canje
+usa su propia sesión, como una petición de checkout. Reporta canjes
+aceptados, valor final del contador, sobre-canjes y latencia.
+
+    python -m benchmarks.coupon_redemption --requests 1000 --max-uses 100 --workers 50
+"""
+import argparse
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from benchmarks.common import engine  # noqa: F401  (configura la base de benchmarks)
+from app.database import SessionLocal
+from app.models.coupon import Coupon
+from app.services.coupons import coupon_cache, redeem_coupon, validate_coupon
+
+def _create_coupon(max_uses: int) -> tuple:
+    db = SessionLocal()
+    try:
+        code = f"BENCH-{time.time_ns()}"
+        coupon = Coupon(
+            code=code,
+            discount_percent=10,
+            valid_from=datetime.utcnow() - timedelta(days=1),
+            valid_until=datetime.utcnow() + timedelta(days=1),
+            max_uses=max_uses,
+            current_uses=0,
+            is_active=True,
+        )
+        db.add(coupon)
+        db.commit()
+        return coupon.id, code
+    finally:
+        db.close()
+
+def _legacy_redeem(coupon_id: int, code: str) -> bool:
+    """Canje anterior: lectura, validación y escritura del contador en Python"""
+    db = SessionLocal()
+    try:
+        coupon = db.query(Coupon).filter(Coupon.code == code).first()
+        if not coupon.is_active or coupon.current_uses >= coupon.max_uses:
+            return False
+        coupon.current_uses += 1
+        if coupon.current_uses >= coupon.max_uses:
+            coupon.is_active = False
+        db.commit()
+        return True
+    except Exception:
+        db.rollback()
+        return False
+    finally:
+        db.close()
+
+def _atomic_redeem(coupon_id: int, code: str) -> bool:
+    """Canje actual: validación desde la caché y UPDATE condicional"""
+    db = SessionLocal()
+    try:
+        coupon = validate_coupon(db, code)
+        redeemed = redeem_coupon(db, coupon.id)
+        db.commit()
+        return redeemed
+    except Exception:
+        db.rollback()
+        return False
+    finally:
+        db.close()
+
+def run(strategy, label: str, requests: int, max_uses: int, workers: int):
+    coupon_cache.clear()
+    coupon_id, code = _create_coupon(max_uses)
+    latencies = []
+
+    def attempt(_):
+        start = time.perf_counter()
+        redeemed = strategy(coupon_id, code)
+        latencies.append((time.perf_counter() - start) * 1000)
+        return redeemed
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        accepted = sum(pool.map(attempt, range(requests)))
+    elapsed = time.perf_counter() - start
+
+    db = SessionLocal()
+    try:
+        final_uses = db.query(Coupon.current_uses).filter(Coupon.id == coupon_id).scalar()
+    finally:
+        db.close()
+    latencies.sort()
+    p99 = latencies[int(len(latencies) * 0.99) - 1]
+    print(
+        f"{label:<22} aceptados {accepted:>5}  contador {final_uses:>5}  sobre-canjes {max(accepted - max_uses, 0):>5}  "
+        f"p50 {statistics.median(latencies):>7.2f} ms  p99 {p99:>7.2f} ms  {requests / elapsed:>7.0f} canjes/s"
+    )
+
+def main():
+    parser = argparse.ArgumentParser(description="Prueba de carga de canjes concurrentes de un cupón")
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--max-uses", type=int, default=100)
+    parser.add_argument("--workers", type=int, default=50)
+    args = parser.parse_args()
+
+    print(f"{args.requests} canjes concurrentes de un cupón con max_uses={args.max_uses} ({args.workers} hilos)")
+    run(_legacy_redeem, "leer-modificar-escribir", args.requests, args.max_uses, args.workers)
+    run(_atomic_redeem, "UPDATE condicional", args.requests, args.max_uses, args.workers)
+
+if __name__ == "__main__":
+    main()
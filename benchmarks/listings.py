@@ -0,0 +1,88 @@
+"""
+Compara la estrategia de carga anterior (joinedload encadenado) con la
+actual (selectinload + load_only) en los listados de ventas y de gestión
+de órdenes. Mide latencia (mediana) y filas transferidas desde la base.
+
+    python -m benchmarks.listings --orders 20000 --limit 100 --offset 5000
+"""
+import argparse
+from sqlalchemy.orm import joinedload
+from benchmarks.common import seed, timed, StatementRecorder
+from app.database import SessionLocal
+from app.models.orders import Order, OrderItem
+from app.models.sales import Sale, SaleItem
+from app.routers.sales import _sale_load_options
+from app.routers.order_management import _order_load_options
+
+ACTIVE_ORDER_STATUSES = ["pending", "confirmed", "paid", "processing", "shipped"]
+
+def _sales_query(db, options, limit, offset):
+    return (
+        db.query(Sale)
+        .filter(Sale.status == "pending")
+        .options(*options)
+        .order_by(Sale.created_at.desc())
+        .offset(offset)
+        .limit(limit)
+    )
+
+def _orders_query(db, options, limit, offset):
+    return (
+        db.query(Order)
+        .filter(Order.status.in_(ACTIVE_ORDER_STATUSES))
+        .options(*options)
+        .order_by(Order.created_at.desc())
+        .offset(offset)
+        .limit(limit)
+    )
+
+CASES = [
+    (
+        "sales.read_pending_sales",
+        _sales_query,
+        (joinedload(Sale.items).joinedload(SaleItem.product), joinedload(Sale.user)),
+        _sale_load_options(),
+    ),
+    (
+        "order_management.get_pending_orders",
+        _orders_query,
+        (joinedload(Order.items).joinedload(OrderItem.product), joinedload(Order.user)),
+        _order_load_options(),
+    ),
+]
+
+def run_case(build_query, options, limit, offset, repeat):
+    def execute():
+        db = SessionLocal()
+        try:
+            rows = build_query(db, options, limit, offset).all()
+            # Recorre las relaciones como lo haría la serialización del response_model
+            return sum(len(row.items) for row in rows)
+        finally:
+            db.close()
+
+    latency, items = timed(execute, repeat)
+    with StatementRecorder() as recorder:
+        execute()
+    rows, values = recorder.rows_transferred()
+    return latency, items, len(recorder.statements), rows, values
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--orders", type=int, default=10000)
+    parser.add_argument("--items-per-order", type=int, default=5)
+    parser.add_argument("--limit", type=int, default=100)
+    parser.add_argument("--offset", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    total = seed(orders=args.orders, items_per_order=args.items_per_order)
+    print(f"Órdenes en la base: {total} | limit={args.limit} offset={args.offset}\n")
+    print(f"{'listado':40} {'estrategia':12} {'ms':>9} {'sentencias':>11} {'filas':>9} {'valores':>10} {'items':>7}")
+    for name, build_query, old_options, new_options in CASES:
+        for label, options in (("joinedload", old_options), ("selectinload", new_options)):
+            latency, items, statements, rows, values = run_case(build_query, options, args.limit, args.offset, args.repeat)
+            print(f"{name:40} {label:12} {latency:9.1f} {statements:11} {rows:9} {values:10} {items:7}")
+
+if __name__ == "__main__":
+    main()
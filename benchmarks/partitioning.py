@@ -0,0 +1,80 @@
+"""
+Latencia de los listados de estados activos a medida que crece el historial.
+
+En cada paso agrega `--step` órdenes antiguas y cerradas (historial) y un
+pequeño lote de órdenes recientes activas, y mide:
+  - listado de gestión de órdenes activas (estado activo, orden por fecha)
+  - historial de órdenes de un cliente (OrderSummary, caliente + frío)
+
+Con --mode archive, después de cada paso mueve lo cerrado y antiguo a las
+tablas frías; con --mode single todo queda en las tablas calientes. Correr
+ambos modos contra bases distintas para comparar:
+
+    DATABASE_URL=postgresql://.../bench_single  python -m benchmarks.partitioning --mode single  --steps 10 --step 200000
+    DATABASE_URL=postgresql://.../bench_archive python -m benchmarks.partitioning --mode archive --steps 10 --step 200000
+"""
+import argparse
+import random
+from datetime import datetime, timedelta
+from sqlalchemy import func, select
+from benchmarks.common import SessionLocal, seed, append_orders, timed
+from app.models.orders import Order
+from app.models.archive import orders_archive
+from app.services.archive import ACTIVE_ORDER_STATUSES, CLOSED_ORDER_STATUSES, archive_cold_orders, order_summary_source
+
+def measure(repeat: int):
+    db = SessionLocal()
+    try:
+        user_id = db.query(func.min(Order.user_id)).scalar()
+
+        def active_listing():
+            return (
+                db.query(Order.id, Order.status, Order.created_at)
+                .filter(Order.status.in_(ACTIVE_ORDER_STATUSES))
+                .order_by(Order.created_at.desc())
+                .limit(100)
+                .all()
+            )
+
+        def customer_history():
+            summaries = order_summary_source(user_id)
+            return db.execute(select(summaries).order_by(summaries.c.created_at.desc()).limit(20)).all()
+
+        active_ms, _ = timed(active_listing, repeat)
+        history_ms, _ = timed(customer_history, repeat)
+        return active_ms, history_ms
+    finally:
+        db.close()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--mode", choices=["single", "archive"], default="archive")
+    parser.add_argument("--steps", type=int, default=5)
+    parser.add_argument("--step", type=int, default=100000, help="Órdenes históricas agregadas por paso")
+    parser.add_argument("--recent", type=int, default=2000, help="Órdenes recientes activas agregadas por paso")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    seed(orders=1)  # usuarios y productos
+    rng = random.Random(713)
+    now = datetime.utcnow()
+    print(f"modo={args.mode}")
+    print(f"{'historial':>12} {'calientes':>12} {'activas ms':>11} {'cliente ms':>11}")
+    for _ in range(args.steps):
+        db = SessionLocal()
+        try:
+            # Historial: órdenes cerradas de los últimos 3 años, fuera de la ventana caliente
+            append_orders(db, args.step, now - timedelta(days=3 * 365), 3 * 365 - 120, CLOSED_ORDER_STATUSES, rng=rng)
+            # Actividad reciente
+            append_orders(db, args.recent, now - timedelta(days=7), 7, ACTIVE_ORDER_STATUSES, rng=rng)
+            if args.mode == "archive":
+                archive_cold_orders(db, chunk_size=5000)
+            hot = db.query(func.count(Order.id)).scalar()
+            cold = db.execute(select(func.count()).select_from(orders_archive)).scalar()
+        finally:
+            db.close()
+        active_ms, history_ms = measure(args.repeat)
+        print(f"{hot + cold:12} {hot:12} {active_ms:11.2f} {history_ms:11.2f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Costo de serialización por schema y tamaño de payload, sin base de datos.
+
+Compara, para Product, Cart y OrderDetail con 1 a 1000 elementos:
+- JSONResponse: validar, dump_python(mode="json") y json.dumps (FastAPI clásico)
+- ORJSONResponse: validar, dump_python(mode="json") y orjson.dumps (si está instalado)
+- precompilado: TypeAdapter reutilizable, validar y dump_json directo a bytes
+
+    python -m benchmarks.serialization --sizes 1 10 100 1000
+"""
+import argparse
+import json
+import statistics
+import time
+from datetime import datetime
+from types import SimpleNamespace
+from typing import List
+from pydantic import TypeAdapter
+from app.schemas.product import Product
+from app.schemas.cart import Cart
+from app.schemas.order import OrderDetail
+from app.utils.serialization import get_serializer
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+NOW = datetime(2025, 1, 1, 12, 0, 0)
+
+def _product(index: int):
+    return SimpleNamespace(
+        id=index, name=f"Producto {index}", description="Descripción de prueba " * 4, price=1999.99,
+        category="hotel", stock=10, image_url=f"https://cdn.example.com/{index}.jpg", sku=f"SKU-{index}",
+        is_active=True, created_at=NOW, updated_at=NOW, created_by=1, updated_by=None
+    )
+
+def _user():
+    return SimpleNamespace(id=1, email="cliente@example.com", name="Cliente", lastname="Prueba", is_active=True, rol="comprador")
+
+def products_payload(size: int):
+    return [_product(index) for index in range(size)]
+
+def cart_payload(size: int):
+    items = [SimpleNamespace(id=index, cart_id=1, quantity=2, product=_product(index)) for index in range(size)]
+    return SimpleNamespace(id=1, user=_user(), items=items, coupon=None, discount_amount=0.0, status="active")
+
+def order_payload(size: int):
+    items = [
+        SimpleNamespace(id=index, order_id=1, product_id=index, quantity=2, unit_price=1999.99,
+                        subtotal=3999.98, product=_product(index))
+        for index in range(size)
+    ]
+    return SimpleNamespace(
+        id=1, order_number="ORD-1", user=_user(), items=items, status="paid", total_amount=3999.98 * size,
+        shipping_address=None, notes=None, created_at=NOW, updated_at=NOW, payment_status=None,
+        tracking_number=None, estimated_delivery=None
+    )
+
+CASES = [
+    ("Product[]", List[Product], products_payload),
+    ("Cart", Cart, cart_payload),
+    ("OrderDetail", OrderDetail, order_payload),
+]
+
+def _median_us(func, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1_000_000)
+    return statistics.median(timings)
+
+def run(sizes: List[int], repeat: int):
+    print(f"{'schema':<12} {'tamaño':>7} {'bytes':>9} {'JSONResponse µs':>16} {'ORJSONResponse µs':>18} {'precompilado µs':>16}")
+    for label, schema, build in CASES:
+        for size in sizes:
+            data = build(size)
+            # Como en FastAPI clásico: un TypeAdapter por ruta, pero dict intermedio + encoder
+            adapter = TypeAdapter(schema)
+
+            def classic():
+                return json.dumps(adapter.dump_python(adapter.validate_python(data, from_attributes=True), mode="json")).encode()
+
+            def with_orjson():
+                return orjson.dumps(adapter.dump_python(adapter.validate_python(data, from_attributes=True), mode="json"))
+
+            serializer = get_serializer(schema)
+            payload = serializer.dump(data)
+            classic_us = _median_us(classic, repeat)
+            orjson_us = _median_us(with_orjson, repeat) if orjson is not None else None
+            precompiled_us = _median_us(lambda: serializer.dump(data), repeat)
+            orjson_text = f"{orjson_us:>18.1f}" if orjson_us is not None else f"{'(sin orjson)':>18}"
+            print(f"{label:<12} {size:>7} {len(payload):>9} {classic_us:>16.1f} {orjson_text} {precompiled_us:>16.1f}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro-benchmark de serialización de respuestas")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1, 10, 100, 1000])
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+    run(args.sizes, args.repeat)
+
+if __name__ == "__main__":
+    main()
@@ -1,19 +1,46 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 import os
 from dotenv import load_dotenv
 
 from app.database import engine, Base, create_tables
-from app.routers import users, carts, products, auth, orders, sales, order_management, payment, mail, ia
+from app.routers import users, carts, products, auth, orders, sales, order_management, payment, mail, ia, health, metrics, traces, analytics, export, coupons
+from app.utils.metrics import MetricsMiddleware, instrument_engine
+from app.utils import profiler, tracing, serialization
+from app.utils.compression import COMPRESSION_ENABLED, CompressionMiddleware
+from app.services import cart_store, jobs, outbox, scheduler
+from app.services import tasks, schedules, subscribers  # noqa: F401  registra tareas, tareas periódicas y suscriptores
 
 # Carga de variables de entorno
 load_dotenv()
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Escritura diferida (write-behind) de los carritos del almacén caliente, si CART_STORE está habilitado
+    cart_store.flusher.start()
+    # Tareas en segundo plano dentro del proceso de la API (sin necesidad de `python -m app.worker` aparte)
+    if jobs.JOB_WORKER_IN_PROCESS:
+        jobs.in_process_worker.start()
+    # Relay del outbox: publica los eventos de dominio confirmados (uno activo por clúster, por advisory lock)
+    if outbox.OUTBOX_RELAY_ENABLED:
+        outbox.relay.start()
+    # Tareas periódicas: cada réplica corre el planificador y un advisory lock elige quién ejecuta cada una
+    if scheduler.SCHEDULER_ENABLED:
+        scheduler.background_scheduler.start()
+    yield
+    scheduler.background_scheduler.stop()
+    outbox.relay.stop()
+    jobs.in_process_worker.stop()
+    cart_store.flusher.stop()
+
 # Crear la aplicación FastAPI
 app = FastAPI(
     title="API E-commerce con FastAPI y PostgreSQL",
     description="API para una webapp de e-commerce utilizando FastAPI y PostgreSQL",
-    version="2.0.0"
+    version="2.0.0",
+    lifespan=lifespan,
+    **serialization.app_options() # ORJSONResponse por defecto solo si FAST_JSON=true y FastAPI no serializa con Pydantic
 )
 
 # Crear las tablas de la base de datos
@@ -28,17 +55,41 @@ app.add_middleware(
     allow_headers=["*"]
 )
 
+# Compresión negociada (zstd / brotli / gzip) de respuestas JSON grandes y en streaming
+if COMPRESSION_ENABLED:
+    app.add_middleware(CompressionMiddleware)
+
+# Métricas de latencia por ruta y de consultas SQL por petición
+app.add_middleware(MetricsMiddleware)
+instrument_engine(engine)
+
+# Trazas por petición con spans de SQL, SMTP, Groq y Mercado Pago
+if tracing.TRACING_ENABLED:
+    app.add_middleware(tracing.TracingMiddleware)
+    tracing.instrument_engine(engine)
+    app.include_router(traces.router) # consulta de trazas del exportador en memoria
+
+# Profiler de consultas SQL y detector de N+1 (solo desarrollo / staging)
+if profiler.SQL_PROFILER_ENABLED:
+    app.add_middleware(profiler.QueryProfilerMiddleware)
+    profiler.instrument_engine(engine)
+
 # Incluir rutas
 app.include_router(auth.router)  #rutas de autenticación
 app.include_router(users.router) #rutas de usuarios 
 app.include_router(carts.router) #rutas de carritos
+app.include_router(coupons.router) #rutas de cupones
 app.include_router(products.router) #rutas de productos 
 app.include_router(orders.router) #rutas de órdenes
 app.include_router(order_management.router) #rutas de gestión de órdenes
 app.include_router(sales.router) #rutas de ventas
+app.include_router(analytics.router) #analítica de ventas sobre rollups diarios
+app.include_router(export.router) #exportación de ventas y órdenes (CSV / Parquet / Arrow)
 app.include_router(payment.router) #rutas de pagos
 app.include_router(mail.router) #rutas de envío de correos
 app.include_router(ia.router) # rutas de IA para mejorar título y descripción de productos
+app.include_router(health.router) # rutas de liveness, readiness y salud de dependencias
+app.include_router(metrics.router) # métricas en formato Prometheus
 
 @app.get("/")
 def read_root():
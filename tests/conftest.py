@@ -0,0 +1,56 @@
+"""
+Configuración común de los tests: base SQLite temporal (o TEST_DATABASE_URL),
+sin hilos en segundo plano y con el plugin de presupuestos de consultas.
+"""
+import os
+import tempfile
+
+# Antes de importar la app: la base y los servicios se configuran al importar
+os.environ["DATABASE_URL"] = os.getenv(
+    "TEST_DATABASE_URL", f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'test.db')}"
+)
+os.environ["JOB_WORKER_IN_PROCESS"] = "false"
+os.environ["OUTBOX_RELAY_ENABLED"] = "false"
+os.environ["SCHEDULER_ENABLED"] = "false"
+os.environ["CART_STORE"] = "none"
+os.environ["SQL_PROFILER"] = "false"
+for name, value in {
+    "GROQ_API_KEY": "test",
+    "EMAIL_ADDRESS": "tests@example.com",
+    "EMAIL_PASSWORD": "test",
+    "MP_ACCESS_TOKEN": "TEST-token",
+}.items():
+    os.environ.setdefault(name, value)
+
+import pytest
+from fastapi.testclient import TestClient
+
+pytest_plugins = ["app.utils.pytest_query_budget"]
+
+@pytest.fixture(scope="session")
+def app():
+    from main import app
+    return app
+
+@pytest.fixture
+def db():
+    from app.database import SessionLocal
+    session = SessionLocal()
+    yield session
+    session.close()
+
+@pytest.fixture
+def client(app):
+    with TestClient(app) as test_client:
+        yield test_client
+    app.dependency_overrides.clear()
+
+@pytest.fixture
+def login(app):
+    """Autentica las peticiones del cliente como `user` (sin pasar por JWT)"""
+    from app.utils import get_current_user
+
+    def as_user(user):
+        app.dependency_overrides[get_current_user] = lambda: user
+        return user
+    return as_user
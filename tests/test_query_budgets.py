@@ -0,0 +1,106 @@
+"""
+Presupuestos de consultas SQL de los listados (historial de órdenes, ventas
+y gestión de órdenes) y del checkout. Los presupuestos no dependen del
+tamaño de la página: si un cambio vuelve a cargar relaciones por fila, el
+test falla con el reporte del profiler.
+"""
+from datetime import datetime, timedelta
+import pytest
+from app.models.cart import Cart, CartItem
+from app.models.orders import Order, OrderItem
+from app.models.product import Product
+from app.models.sales import Sale, SaleItem
+from app.models.user import User
+
+ORDERS = 30
+SALES = 30
+# Checkout (camino ORM): lecturas constantes más dos escrituras por línea
+# (UPDATE versionado del stock e INSERT del item)
+CHECKOUT_BASE_QUERIES = 7
+CHECKOUT_QUERIES_PER_LINE = 2
+
+@pytest.fixture(scope="module")
+def shop(app):
+    """Un comprador con órdenes de varios items, un vendedor y ventas pendientes con items"""
+    from app.database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        buyer = User(name="Ana", lastname="Compradora", email="compradora@example.com",
+                     hashed_password="x", rol="comprador", is_active=True)
+        seller = User(name="Beto", lastname="Vendedor", email="vendedor@example.com",
+                      hashed_password="x", rol="vendedor", is_active=True)
+        db.add_all([buyer, seller])
+        products = [
+            Product(name=f"Producto {index}", description="Producto de prueba", price=1000 + index,
+                    stock=1000, category="hotel", sku=f"QB-{index}")
+            for index in range(5)
+        ]
+        db.add_all(products)
+        db.flush()
+
+        start = datetime.utcnow() - timedelta(days=1)
+        for index in range(ORDERS):
+            order = Order(order_number=f"QB-ORD-{index}", user_id=buyer.id, status="pending",
+                          total_amount=3000, created_at=start + timedelta(minutes=index))
+            db.add(order)
+            db.flush()
+            for product in products[:3]:
+                db.add(OrderItem(order_id=order.id, product_id=product.id, quantity=1, unit_price=product.price))
+            if index < SALES:
+                sale = Sale(order_id=order.id, user_id=buyer.id, order_number=order.order_number,
+                            invoice_number=10000 + index, total_amount=3000, tax_amount=630, status="pending")
+                db.add(sale)
+                db.flush()
+                for product in products[:2]:
+                    db.add(SaleItem(sale_id=sale.id, product_id=product.id, quantity=1, unit_price=product.price))
+        product_ids = [product.id for product in products]
+        db.commit()
+        db.refresh(buyer)
+        db.refresh(seller)
+        db.expunge_all()
+        return {"buyer": buyer, "seller": seller, "products": product_ids}
+    finally:
+        db.close()
+
+@pytest.mark.parametrize("limit", [5, ORDERS])
+def test_order_history_is_one_query(client, login, shop, query_budget, limit):
+    login(shop["buyer"])
+    with query_budget(max_queries=1):
+        response = client.get(f"/orders/?limit={limit}")
+    assert response.status_code == 200
+    assert len(response.json()) == limit
+    assert all(summary["items_count"] == 3 for summary in response.json())
+
+@pytest.mark.parametrize("path", ["/sales/pending", "/sales/summary/pending"])
+@pytest.mark.parametrize("limit", [5, SALES])
+def test_sales_listings(client, login, shop, query_budget, path, limit):
+    login(shop["seller"])
+    with query_budget(max_queries=4):
+        response = client.get(f"{path}?limit={limit}")
+    assert response.status_code == 200
+    assert len(response.json()) == limit
+
+@pytest.mark.parametrize("path", ["/orders/management/pending", "/orders/management/"])
+@pytest.mark.parametrize("limit", [5, ORDERS])
+def test_order_management_listings(client, login, shop, query_budget, path, limit):
+    login(shop["seller"])
+    with query_budget(max_queries=4):
+        response = client.get(f"{path}?limit={limit}")
+    assert response.status_code == 200
+    assert len(response.json()) == limit
+
+@pytest.mark.parametrize("lines", [1, 5])
+def test_checkout(client, login, db, shop, query_budget, lines):
+    buyer = login(shop["buyer"])
+    cart = Cart(user_id=buyer.id, status="active")
+    db.add(cart)
+    db.flush()
+    for product_id in shop["products"][:lines]:
+        db.add(CartItem(cart_id=cart.id, product_id=product_id, quantity=1))
+    db.commit()
+
+    with query_budget(max_queries=CHECKOUT_BASE_QUERIES + CHECKOUT_QUERIES_PER_LINE * lines):
+        response = client.post(f"/orders/create?cart_id={cart.id}")
+    assert response.status_code == 200
+    assert len(response.json()["items"]) == lines